@@ -0,0 +1,7 @@
+from django.apps import AppConfig
+
+
+class CacheConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'apps.core.cache'
+    label = 'core_cache'
@@ -0,0 +1,212 @@
+"""
+Per-user Bloom filters for "does this user have X?" checks.
+
+Most like/follow/download status checks answer "no". A Bloom filter kept in
+the cache answers those definite negatives without touching the database;
+only "maybe" answers fall through to an ``exists()`` query.
+
+Filters are built lazily from the source table and rebuilt when they
+expire, fill up, or accumulate too many removals (which a Bloom filter
+cannot forget, so they only raise the false-positive rate).
+
+A filter must never miss a member, whatever happened to the exact status
+keys. Each user has a generation counter; a filter is stored with the
+generation read before its members were loaded and only trusted while that
+is still current. Rebuilds bump the generation; adds do not. Each add takes
+a number from the user's add sequence and writes its member to its own
+slot, then folds the settled slots into the stored filter. Readers merge
+any slots above the filter's position, so an add whose fold lost a race
+with another writer is still seen. Removals leave filters valid.
+"""
+from django.core.cache import cache
+import hashlib
+import math
+import time
+
+DEFAULT_ERROR_RATE = 0.01
+MIN_CAPACITY = 64
+FILTER_TIMEOUT = 3600  # 1 hour
+MAX_PENDING_ADDS = 100
+
+
+class BloomFilter:
+    """A fixed-size Bloom filter over string members."""
+
+    def __init__(self, capacity, error_rate=DEFAULT_ERROR_RATE):
+        self.capacity = max(int(capacity), 1)
+        self.size = max(8, math.ceil(-self.capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+        self.removals = 0
+        self.built_at = time.time()
+        self.generation = None
+        self.adds_seq = None
+
+    def _positions(self, member):
+        digest = hashlib.blake2b(str(member).encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, member):
+        for pos in self._positions(member):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, member):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(member))
+
+    @property
+    def saturated(self):
+        """True once the false-positive rate has drifted past its design point."""
+        return self.count > self.capacity or self.removals > self.capacity // 4
+
+
+class UserBloomFilter:
+    """
+    A named family of per-user Bloom filters stored in the cache.
+    ``loader(user_id)`` returns every member currently present for the user.
+    """
+
+    def __init__(self, name, loader, error_rate=DEFAULT_ERROR_RATE):
+        self.name = name
+        self.loader = loader
+        self.error_rate = error_rate
+
+    def key(self, user_id):
+        return f"bloom_{self.name}_{user_id}"
+
+    def generation_key(self, user_id):
+        return f"bloom_{self.name}_{user_id}_gen"
+
+    def adds_key(self, user_id):
+        return f"bloom_{self.name}_{user_id}_adds"
+
+    def add_slot_key(self, user_id, seq):
+        return f"bloom_{self.name}_{user_id}_add_{seq}"
+
+    def _counter(self, key):
+        # A missing counter starts at the current time, so a filter stored
+        # under one that was evicted is never taken as current.
+        fresh = time.time_ns() // 1000
+        return fresh if cache.add(key, fresh, timeout=None) else cache.get(key, fresh)
+
+    def _generation(self, user_id):
+        return self._counter(self.generation_key(user_id))
+
+    def build(self, user_id, generation=None):
+        """Rebuild the user's filter from the source table."""
+        if generation is None:
+            generation = self._generation(user_id)
+        # Read before the members, so adds that land during the load are
+        # numbered above the filter and merged from their slots.
+        adds_seq = self._counter(self.adds_key(user_id))
+        members = list(self.loader(user_id))
+        bloom = BloomFilter(max(len(members) * 2, MIN_CAPACITY), self.error_rate)
+        for member in members:
+            bloom.add(member)
+        bloom.generation = generation
+        bloom.adds_seq = adds_seq
+        cache.set(self.key(user_id), bloom, timeout=FILTER_TIMEOUT)
+        return bloom
+
+    def _pending(self, user_id, bloom, head):
+        """
+        Members added above the filter's position, up to ``head``. A slot
+        that is missing (still being written, or evicted) shows up as None.
+        """
+        if head <= bloom.adds_seq:
+            return set()
+        keys = [self.add_slot_key(user_id, seq) for seq in range(bloom.adds_seq + 1, head + 1)]
+        slots = cache.get_many(keys)
+        return {slots.get(key) for key in keys}
+
+    def _fold(self, user_id, bloom, head):
+        """Add the settled slots up to ``head`` to ``bloom`` and store it."""
+        seqs = range(bloom.adds_seq + 1, min(head, bloom.adds_seq + MAX_PENDING_ADDS) + 1)
+        slots = cache.get_many([self.add_slot_key(user_id, seq) for seq in seqs])
+        for seq in seqs:
+            member = slots.get(self.add_slot_key(user_id, seq))
+            if member is None:
+                break
+            bloom.add(member)
+            bloom.adds_seq = seq
+        self._store(user_id, bloom)
+
+    def _store(self, user_id, bloom):
+        # Keep the original expiry so every filter is rebuilt on schedule.
+        remaining = bloom.built_at + FILTER_TIMEOUT - time.time()
+        if bloom.saturated or remaining <= 0:
+            cache.delete(self.key(user_id))
+        else:
+            cache.set(self.key(user_id), bloom, timeout=remaining)
+
+    def invalidate(self, user_id):
+        """Retire the user's filter; call after members were bulk-loaded or the filter is suspect."""
+        try:
+            cache.incr(self.generation_key(user_id))
+        except ValueError:
+            pass  # Never read, or evicted: the next read starts a new generation.
+        cache.delete(self.key(user_id))
+
+    def check(self, user_id, member, exact_key, exists, timeout=3600):
+        """
+        Answer a status check: the exact cache entry first, then the filter
+        (a miss there is a definite "no"), and only then ``exists()``.
+        The exact entry, the filter, its generation and the add sequence
+        are fetched in one cache round trip; pending adds take one more.
+        """
+        key, generation_key = self.key(user_id), self.generation_key(user_id)
+        adds_key = self.adds_key(user_id)
+        values = cache.get_many([exact_key, key, generation_key, adds_key])
+        if exact_key in values:
+            return values[exact_key]
+
+        generation = values.get(generation_key)
+        if generation is None:
+            generation = self._generation(user_id)
+        bloom, head = values.get(key), values.get(adds_key)
+        adds_seq = getattr(bloom, "adds_seq", None)
+        if (bloom is None or bloom.generation != generation or adds_seq is None
+                or head is None or head < adds_seq or head - adds_seq > MAX_PENDING_ADDS):
+            bloom = self.build(user_id, generation)
+            pending = set()
+        else:
+            pending = self._pending(user_id, bloom, head)
+        member = str(member)
+        # A missing slot could be any member, so it can't rule one out.
+        if member not in bloom and member not in pending and None not in pending:
+            return False
+
+        result = exists()
+        cache.set(exact_key, result, timeout=timeout)
+        return result
+
+    def record(self, user_id, member, present, exact_key, timeout=3600):
+        """
+        Write a toggle through to the exact entry and the user's filter.
+        Call once the toggle is committed.
+        """
+        cache.set(exact_key, present, timeout=timeout)
+        if present:
+            try:
+                seq = cache.incr(self.adds_key(user_id))
+            except ValueError:
+                # The sequence was evicted, so no reader could place a slot.
+                self.invalidate(user_id)
+                return
+            cache.set(self.add_slot_key(user_id, seq), str(member), timeout=FILTER_TIMEOUT)
+            bloom = cache.get(self.key(user_id))
+            if bloom is not None and getattr(bloom, "adds_seq", None) is not None:
+                self._fold(user_id, bloom, seq)
+            return
+
+        bloom = cache.get(self.key(user_id))
+        if bloom is None:
+            return
+        # Writing this copy back is safe even if it lost a race: its
+        # position only covers the adds it holds, and a newer generation
+        # makes it ignored altogether.
+        bloom.removals += 1
+        self._store(user_id, bloom)
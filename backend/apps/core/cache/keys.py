@@ -0,0 +1,154 @@
+"""
+Registry of derived cache keys, invalidated through versioned namespaces.
+
+A namespace has one version counter for itself and one per entity (a
+photo, a collection, a user's likes...). Every cached response built from
+that data is declared here as a ``CacheKey`` naming the versions it depends
+on, and its key embeds their current values. Invalidating is a single
+``incr`` of the right version: every key built with the old value, whatever
+its query parameters, is never read again and expires on its own TTL.
+
+    cache_key = PHOTO_DETAIL.key(photo_id=photo.id)  # "photo:<id>:v<photo>.v<comments>"
+    PHOTOS.bump(photo.id)                            # retires that photo's keys
+    PHOTO_LISTINGS.bump()                            # retires every photo listing
+
+Reading a key costs one ``get_many`` for its versions. A missing version
+starts at the current time in microseconds rather than at 1, so a version
+lost to eviction never comes back with a value old keys were built with.
+
+Keys that are data structures updated in place (ring buffers, event logs,
+Bloom filters, exact status keys, liked sets, timelines) are not derived
+responses and keep their own key schemes.
+"""
+from django.core.cache import cache
+import hashlib
+import time
+
+VERSION_KEY = "ver:{namespace}"
+ENTITY_VERSION_KEY = "ver:{namespace}:{entity_id}"
+MAX_KEY_LENGTH = 200  # memcached rejects keys over 250 bytes
+
+
+class Namespace:
+    """Version counters for a family of cached data, globally and per entity."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def version_key(self, entity_id=None):
+        if entity_id is None:
+            return VERSION_KEY.format(namespace=self.name)
+        return ENTITY_VERSION_KEY.format(namespace=self.name, entity_id=entity_id)
+
+    def entity(self, param):
+        """Dependency on the version of the entity named by the key parameter ``param``."""
+        return _EntityVersion(self, param)
+
+    def bump(self, entity_id=None):
+        """Invalidate the whole namespace, or one entity's keys."""
+        try:
+            cache.incr(self.version_key(entity_id))
+        except ValueError:
+            # Never read, or evicted: the next read starts a new version.
+            pass
+
+    def bump_each(self, entity_ids):
+        """Invalidate the keys of each of ``entity_ids``."""
+        for entity_id in set(entity_ids):
+            self.bump(entity_id)
+
+    def __repr__(self):
+        return f"Namespace({self.name!r})"
+
+
+class _EntityVersion:
+    def __init__(self, namespace, param):
+        self.namespace = namespace
+        self.param = param
+
+
+def _versions(version_keys):
+    found = cache.get_many(version_keys)
+    for key in version_keys:
+        if key not in found:
+            fresh = time.time_ns() // 1000
+            found[key] = fresh if cache.add(key, fresh, timeout=None) else cache.get(key, fresh)
+    return [found[key] for key in version_keys]
+
+
+class CacheKey:
+    """A cached response and the namespace versions it is built from."""
+
+    def __init__(self, name, *depends_on):
+        self.name = name
+        self.depends_on = depends_on
+
+    def key(self, **params):
+        """The current key for ``params``; changes whenever a dependency is bumped."""
+        version_keys = [
+            dep.namespace.version_key(params[dep.param]) if isinstance(dep, _EntityVersion) else dep.version_key()
+            for dep in self.depends_on
+        ]
+        parts = [str(params[name]) for name in sorted(params)]
+        key = ":".join([self.name, *parts, "v" + ".".join(str(v) for v in _versions(version_keys))])
+        if len(key) > MAX_KEY_LENGTH:
+            key = f"{self.name}:{hashlib.sha1(key.encode()).hexdigest()}"
+        return key
+
+    def __repr__(self):
+        return f"CacheKey({self.name!r})"
+
+
+# Namespaces. Global versions cover listings and rankings; entity versions
+# cover what is cached about one photo, collection, category or user.
+# Photo listings and rankings have their own namespace, bumped only when a
+# photo is created or deleted; counts shown in them catch up on their TTL.
+PHOTOS = Namespace("photos")
+PHOTO_LISTINGS = Namespace("photo_listings")
+PHOTO_COMMENTS = Namespace("photo_comments")
+COLLECTIONS = Namespace("collections")
+USER_COLLECTIONS = Namespace("user_collections")
+CATEGORIES = Namespace("categories")
+USER_LIKES = Namespace("user_likes")
+USER_COMMENTS = Namespace("user_comments")
+DOWNLOADS = Namespace("downloads")
+USER_DOWNLOADS = Namespace("user_downloads")
+FOLLOWS = Namespace("follows")
+
+# Photos
+PHOTO_DETAIL = CacheKey("photo", PHOTOS.entity("photo_id"), PHOTO_COMMENTS.entity("photo_id"))
+PHOTOS_LIST = CacheKey("photos_list", PHOTO_LISTINGS)
+TRENDING_PHOTOS = CacheKey("trending_photos", PHOTO_LISTINGS)
+
+# Comments
+PHOTO_COMMENT_THREADS = CacheKey("photo_comments", PHOTO_COMMENTS.entity("photo_id"))
+PHOTO_COMMENT_STATS = CacheKey("comment_stats", PHOTO_COMMENTS.entity("photo_id"))
+USER_COMMENT_LIST = CacheKey("user_comments", USER_COMMENTS.entity("user_id"))
+USER_COMMENT_STATS = CacheKey("user_comment_stats", USER_COMMENTS.entity("user_id"))
+
+# Collections
+USER_COLLECTION_LIST = CacheKey("user_collections", USER_COLLECTIONS.entity("user_id"))
+FEATURED_COLLECTIONS = CacheKey("featured_collections", COLLECTIONS)
+TRENDING_COLLECTIONS = CacheKey("trending_collections", COLLECTIONS)
+COLLECTION_STATS = CacheKey("collection_stats", COLLECTIONS.entity("collection_id"))
+COLLECTION_PHOTO_PAGE = CacheKey("collection_photos", COLLECTIONS.entity("collection_id"))
+
+# Categories
+ALL_CATEGORIES = CacheKey("all_categories", CATEGORIES)
+POPULAR_CATEGORIES = CacheKey("popular_categories", CATEGORIES)
+CATEGORY_STATS = CacheKey("category_stats", CATEGORIES.entity("category_id"))
+
+# Likes
+USER_LIKE_LIST = CacheKey("user_likes", USER_LIKES.entity("user_id"))
+USER_LIKE_STATS = CacheKey("user_like_stats", USER_LIKES.entity("user_id"))
+
+# Downloads
+MOST_DOWNLOADED = CacheKey("most_downloaded_photos", DOWNLOADS)
+USER_DOWNLOAD_LIST = CacheKey("user_downloads", USER_DOWNLOADS.entity("user_id"))
+USER_DOWNLOAD_STATS = CacheKey("download_stats", USER_DOWNLOADS.entity("user_id"))
+
+# Followers
+USER_FOLLOWERS = CacheKey("user_followers", FOLLOWS.entity("user_id"))
+USER_FOLLOWING = CacheKey("user_following", FOLLOWS.entity("user_id"))
+FOLLOWER_STATS = CacheKey("follower_stats", FOLLOWS.entity("user_id"))
+SUGGESTED_USERS = CacheKey("suggested_users", FOLLOWS.entity("user_id"))
@@ -0,0 +1,74 @@
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.throttling import UserRateThrottle
+from types import SimpleNamespace
+import pickle
+import time
+
+from apps.core.cache.throttling import UserGCRAThrottle
+
+
+class Command(BaseCommand):
+    """
+    Compare DRF's UserRateThrottle with UserGCRAThrottle for one client
+    sending requests faster than its rate. A simulated clock advances by
+    1/--request-rate seconds per request; the timings are wall clock.
+    """
+    help = "Benchmark the GCRA throttle against DRF's built-in rate throttle."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rate", default="1000/minute", help="Throttle rate under test.")
+        parser.add_argument("--requests", type=int, default=20000, help="Requests to simulate.")
+        parser.add_argument(
+            "--request-rate", type=float, default=50.0,
+            help="Simulated requests per second from the client.",
+        )
+        parser.add_argument(
+            "--cache", default=None,
+            help="Cache alias to run against (default: a private local-memory cache).",
+        )
+
+    def handle(self, *args, **options):
+        if options["requests"] < 1 or options["request_rate"] <= 0:
+            raise CommandError("--requests and --request-rate must be positive")
+
+        cache = caches[options["cache"]] if options["cache"] else LocMemCache("benchmark_throttles", {})
+        request = SimpleNamespace(
+            user=SimpleNamespace(is_authenticated=True, pk="benchmark"),
+            META={"REMOTE_ADDR": "127.0.0.1"},
+        )
+
+        class BuiltinThrottle(UserRateThrottle):
+            rate = options["rate"]
+
+        builtin = BuiltinThrottle()
+        gcra = UserGCRAThrottle()
+        gcra.configure("user", rate=options["rate"])
+
+        for name, throttle in (("UserRateThrottle", builtin), ("UserGCRAThrottle", gcra)):
+            throttle.cache = cache
+            cache.delete(throttle.get_cache_key(request, None))
+            self._run(name, throttle, request, options["requests"], options["request_rate"])
+
+    def _run(self, name, throttle, request, requests, request_rate):
+        clock = [1_000_000.0]
+        throttle.timer = lambda: clock[0]
+        step = 1.0 / request_rate
+
+        allowed = 0
+        durations = []
+        for _ in range(requests):
+            start = time.perf_counter()
+            allowed += throttle.allow_request(request, None)
+            durations.append(time.perf_counter() - start)
+            clock[0] += step
+
+        durations.sort()
+        stored = throttle.cache.get(throttle.get_cache_key(request, None))
+        self.stdout.write(
+            f"{name}: {allowed}/{requests} allowed, "
+            f"mean {sum(durations) / requests * 1e6:.1f}us, "
+            f"p99 {durations[int(requests * 0.99) - 1] * 1e6:.1f}us, "
+            f"state {len(pickle.dumps(stored))} bytes"
+        )
@@ -0,0 +1,34 @@
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.core.cache.tiered import TIERS, TieredCache, hit_ratios, reset_hit_ratios
+
+
+class Command(BaseCommand):
+    """Report cache hit ratios per tier, summed over all processes. Safe to run from cron."""
+    help = "Show hit ratios of the in-process and shared cache tiers."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--cache", default="default", help="Alias of the tiered cache.")
+        parser.add_argument(
+            "--reset",
+            action="store_true",
+            help="Zero the counters after reporting, to start a new measurement window.",
+        )
+
+    def handle(self, *args, **options):
+        backend = caches[options["cache"]]
+        if not isinstance(backend, TieredCache):
+            raise CommandError(f"Cache '{options['cache']}' is not a TieredCache")
+
+        # Counts still buffered in this process; other processes flush on their own.
+        backend.flush_metrics()
+        report = hit_ratios(backend.shared)
+        for tier in TIERS:
+            stats = report[tier]
+            ratio = "n/a" if stats["ratio"] is None else f"{stats['ratio']:.1%}"
+            self.stdout.write(f"{tier}: {stats['hits']} hits, {stats['misses']} misses, hit ratio {ratio}")
+
+        if options["reset"]:
+            reset_hit_ratios(backend.shared)
+            self.stdout.write(self.style.SUCCESS("Counters reset"))
@@ -0,0 +1,115 @@
+"""
+Rate limits and quotas kept as counters in the cache.
+
+Each limit counts hits per identity in windows of ``period`` seconds, or in
+calendar days/months for quotas users see ("50 downloads per day"). A hit is
+one ``add`` + ``incr``; no query touches the source tables. With
+``sliding=True`` the previous window's count is weighted by how much of it
+still overlaps the last ``period`` seconds, which smooths out the burst a
+fixed window allows at its boundary.
+"""
+from datetime import timedelta
+from django.core.cache import cache
+from django.utils import timezone
+import time
+
+DAY = "day"
+MONTH = "month"
+
+
+class RateLimit:
+    """At most ``limit`` hits per identity per period."""
+
+    def __init__(self, name, limit, period, sliding=False):
+        if sliding and period in (DAY, MONTH):
+            raise ValueError("Calendar windows cannot slide")
+        self.name = name
+        self.limit = limit
+        self.period = period
+        self.sliding = sliding
+
+    def _window(self, offset=0):
+        """Return ``(window_id, seconds_left, elapsed_fraction)`` for the current window."""
+        if self.period == DAY:
+            now = timezone.localtime()
+            start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+            end = start + timedelta(days=1)
+            return start.strftime("%Y%m%d"), (end - now).total_seconds(), None
+        if self.period == MONTH:
+            now = timezone.localtime()
+            start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+            end = (start + timedelta(days=32)).replace(day=1)
+            return start.strftime("%Y%m"), (end - now).total_seconds(), None
+
+        now = time.time()
+        window = int(now // self.period) + offset
+        elapsed = now / self.period - int(now // self.period)
+        return str(window), (1 - elapsed) * self.period, elapsed
+
+    def key(self, ident, window):
+        return f"ratelimit_{self.name}_{ident}_{window}"
+
+    def _keys(self, ident):
+        window, seconds_left, elapsed = self._window()
+        current = self.key(ident, window)
+        previous = self.key(ident, self._window(offset=-1)[0]) if self.sliding else None
+        return current, previous, seconds_left, elapsed
+
+    def usage(self, ident):
+        """Hits counted against the limit right now."""
+        current, previous, _, elapsed = self._keys(ident)
+        if not self.sliding:
+            return cache.get(current, 0)
+        counts = cache.get_many([current, previous])
+        return int(counts.get(previous, 0) * (1 - elapsed)) + counts.get(current, 0)
+
+    def remaining(self, ident):
+        return max(self.limit - self.usage(ident), 0)
+
+    def hit(self, ident, amount=1):
+        """
+        Count ``amount`` hits. Returns False, without counting them, if they
+        would exceed the limit.
+        """
+        current, previous, seconds_left, elapsed = self._keys(ident)
+        # The window key outlives its window only when it is needed as the
+        # previous window of a sliding limit.
+        timeout = int(seconds_left) + 1 + (self.period if self.sliding else 0)
+        cache.add(current, 0, timeout=timeout)
+        try:
+            count = cache.incr(current, amount)
+        except ValueError:
+            # Evicted between add() and incr().
+            cache.set(current, amount, timeout=timeout)
+            count = amount
+
+        if self.sliding:
+            count += int((cache.get(previous) or 0) * (1 - elapsed))
+        if count > self.limit:
+            self.undo(ident, amount)
+            return False
+        return True
+
+    def undo(self, ident, amount=1):
+        """Give back hits, e.g. when the limited action failed afterwards."""
+        current = self._keys(ident)[0]
+        try:
+            cache.decr(current, amount)
+        except ValueError:
+            pass
+
+
+def hit_all(limits, ident, amount=1):
+    """
+    Count a hit against several limits (e.g. a daily and a monthly quota).
+    Returns the first limit that was exceeded, after undoing the hits already
+    counted against the others, or None if every limit allowed the hit.
+    """
+    counted = []
+    for limit in limits:
+        if not limit.hit(ident, amount):
+            for done in counted:
+                done.undo(ident, amount)
+            return limit
+        counted.append(limit)
+    return None
@@ -0,0 +1,135 @@
+"""
+GCRA throttles for Django REST framework.
+
+DRF's SimpleRateThrottle keeps a list of request timestamps per client and
+rewrites the whole list on every request, so a request costs O(rate). The
+generic cell rate algorithm keeps a single number per client instead: the
+theoretical arrival time (TAT) of its next request. Each request advances
+the TAT by one emission interval with an atomic ``incr``; a request is
+rejected when the TAT has run further ahead of the clock than the burst
+allows. This is equivalent to a token bucket of ``burst`` tokens refilled
+at the configured rate.
+
+Rates use DRF's ``DEFAULT_THROTTLE_RATES`` ("1000/minute"). The burst
+defaults to the full rate and can be lowered per scope with the
+``THROTTLE_BURSTS`` setting.
+"""
+from django.conf import settings
+from django.core.cache import cache as default_cache
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+import math
+import time
+
+MICROSECONDS = 1000000
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_rate(rate):
+    """Parse "<requests>/<period>" (as DRF does) into (requests, seconds)."""
+    num, period = rate.split("/")
+    return int(num), PERIODS[period[0]]
+
+
+class GCRAThrottle(BaseThrottle):
+    """
+    Base class: subclasses set ``scope`` and implement ``get_cache_key``.
+    Times are integer microseconds so that the TAT can be advanced by ``incr``.
+    """
+    cache = default_cache
+    timer = time.time
+    cache_format = "throttle_gcra_%(scope)s_%(ident)s"
+    scope = None
+
+    def __init__(self):
+        self._wait = None
+        if self.scope is not None:
+            self.configure(self.scope)
+
+    def configure(self, scope, rate=None):
+        """Load the scope's rate and burst; ``rate`` overrides the configured rate."""
+        self.scope = scope
+        rate = rate or api_settings.DEFAULT_THROTTLE_RATES.get(scope)
+        if rate is None:
+            raise ImproperlyConfigured(f"No default throttle rate set for '{scope}' scope")
+        self.num_requests, duration = parse_rate(rate)
+        burst = getattr(settings, 'THROTTLE_BURSTS', {}).get(scope, self.num_requests)
+
+        self.interval = duration * MICROSECONDS // self.num_requests
+        self.tolerance = self.interval * (max(burst, 1) - 1)
+
+    def get_cache_key(self, request, view):
+        raise NotImplementedError(".get_cache_key() must be overridden")
+
+    def allow_request(self, request, view):
+        key = self.get_cache_key(request, view)
+        if key is None:
+            return True
+
+        now = int(self.timer() * MICROSECONDS)
+        try:
+            tat = self.cache.incr(key, self.interval)
+        except ValueError:
+            tat = None
+
+        if tat is None or tat < now + self.interval:
+            # Idle client (or new key): its TAT restarts from now. Two racing
+            # resets can each admit a request, which only ever under-throttles.
+            tat = now + self.interval
+            self.cache.set(key, tat, timeout=self._timeout(tat, now))
+            return True
+
+        if tat - now > self.tolerance + self.interval:
+            self.cache.decr(key, self.interval)
+            self._wait = (tat - self.interval - self.tolerance - now) / MICROSECONDS
+            return False
+
+        # incr() keeps the old expiry; extend it to cover the new TAT.
+        self.cache.touch(key, timeout=self._timeout(tat, now))
+        return True
+
+    def _timeout(self, tat, now):
+        return math.ceil((tat - now) / MICROSECONDS) + 1
+
+    def wait(self):
+        return self._wait
+
+
+class UserGCRAThrottle(GCRAThrottle):
+    """Limits authenticated users by ID and anonymous users by IP."""
+    scope = "user"
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+        return self.cache_format % {"scope": self.scope, "ident": ident}
+
+
+class AnonGCRAThrottle(GCRAThrottle):
+    """Limits anonymous users by IP; authenticated requests are not counted."""
+    scope = "anon"
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return None
+        return self.cache_format % {"scope": self.scope, "ident": self.get_ident(request)}
+
+
+class ScopedGCRAThrottle(UserGCRAThrottle):
+    """
+    Per-action limits. A view lists scopes by action name in
+    ``throttle_scopes``, e.g. ``{"toggle": "likes"}``, or sets a single
+    ``throttle_scope``. Views and actions without a scope are not throttled.
+    """
+    scope = None
+
+    def allow_request(self, request, view):
+        scopes = getattr(view, 'throttle_scopes', {})
+        scope = scopes.get(getattr(view, 'action', None)) or getattr(view, 'throttle_scope', None)
+        if not scope:
+            return True
+        self.configure(scope)
+        return super().allow_request(request, view)
@@ -0,0 +1,242 @@
+"""
+Two-tier cache backend: a small in-process LRU in front of the shared cache.
+
+Every operation goes to the shared cache (Redis in production, see CACHES
+in settings) except reads of the hot keys listed in LOCAL_KEYS, which are
+answered from a per-process LRU with a short TTL when possible. Only
+versioned keys from ``apps.core.cache.keys`` may be listed: their content
+never changes under a given key, and invalidation bumps a version key,
+which is always read from the shared tier. So a bump in one process is seen
+by every other one on its next read, without pub/sub, and the local tier
+never serves stale data; it only saves the round trip for the value.
+
+Hits and misses are counted per tier in each process and added to shared
+counters every METRICS_FLUSH_EVERY reads; ``cache_stats`` reports them.
+
+    CACHES = {
+        "shared": {...},
+        "default": {
+            "BACKEND": "apps.core.cache.tiered.TieredCache",
+            "OPTIONS": {"SHARED": "shared", "LOCAL_KEYS": ["all_categories"]},
+        },
+    }
+"""
+from cachetools import TLRUCache
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+import threading
+import time
+
+LOCAL = "local"
+SHARED = "shared"
+TIERS = (LOCAL, SHARED)
+METRICS_KEY = "cache_metrics:{tier}:{outcome}"
+METRICS_FLUSH_EVERY = 1000
+
+_MISSING = object()
+
+
+class TieredCache(BaseCache):
+    """Cache backend reading LOCAL_KEYS through an in-process LRU, everything else from SHARED."""
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self._shared_alias = options.get("SHARED", "shared")
+        self._local_keys = frozenset(options.get("LOCAL_KEYS", ()))
+        self._local_timeout = options.get("LOCAL_TIMEOUT", 30)
+        # Entries are (expires_at, value) and live LOCAL_TIMEOUT seconds at
+        # most, less when set with a shorter timeout.
+        self._local = TLRUCache(
+            maxsize=options.get("LOCAL_MAX_ENTRIES", 1024),
+            ttu=lambda _key, entry, _now: entry[0],
+            timer=time.monotonic,
+        )
+        self._lock = threading.Lock()
+        self._counts = {(tier, outcome): 0 for tier in TIERS for outcome in ("hits", "misses")}
+        self._reads = 0
+
+    @property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    def _is_local(self, key):
+        return key.split(":", 1)[0] in self._local_keys
+
+    def _local_key(self, key, version):
+        return (key, self.version if version is None else version)
+
+    # Metrics
+
+    def _count(self, tier, hits, misses):
+        with self._lock:
+            self._counts[tier, "hits"] += hits
+            self._counts[tier, "misses"] += misses
+            self._reads += hits + misses
+            if self._reads < METRICS_FLUSH_EVERY:
+                return
+            counts = {key: count for key, count in self._counts.items() if count}
+            self._counts = dict.fromkeys(self._counts, 0)
+            self._reads = 0
+        self._flush_counts(counts)
+
+    def _flush_counts(self, counts):
+        shared = self.shared
+        for (tier, outcome), count in counts.items():
+            key = METRICS_KEY.format(tier=tier, outcome=outcome)
+            shared.add(key, 0, timeout=None)
+            try:
+                shared.incr(key, count)
+            except ValueError:
+                shared.set(key, count, timeout=None)
+
+    def flush_metrics(self):
+        """Add this process's counts to the shared counters now."""
+        with self._lock:
+            counts = {key: count for key, count in self._counts.items() if count}
+            self._counts = dict.fromkeys(self._counts, 0)
+            self._reads = 0
+        self._flush_counts(counts)
+
+    # Local tier
+
+    def _local_get(self, key, version):
+        with self._lock:
+            entry = self._local.get(self._local_key(key, version))
+        return _MISSING if entry is None else entry[1]
+
+    def _local_set(self, key, value, timeout, version):
+        ttl = self._local_timeout
+        if timeout is not DEFAULT_TIMEOUT and timeout is not None:
+            ttl = min(ttl, timeout)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._local[self._local_key(key, version)] = (time.monotonic() + ttl, value)
+
+    def _local_discard(self, key, version):
+        with self._lock:
+            self._local.pop(self._local_key(key, version), None)
+
+    # Cache API
+
+    def get(self, key, default=None, version=None):
+        if self._is_local(key):
+            value = self._local_get(key, version)
+            if value is not _MISSING:
+                self._count(LOCAL, 1, 0)
+                return value
+            self._count(LOCAL, 0, 1)
+
+        value = self.shared.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            self._count(SHARED, 0, 1)
+            return default
+        self._count(SHARED, 1, 0)
+        if self._is_local(key):
+            self._local_set(key, value, self._local_timeout, version)
+        return value
+
+    def get_many(self, keys, version=None):
+        found, remote = {}, []
+        local_hits = local_misses = 0
+        for key in keys:
+            value = self._local_get(key, version) if self._is_local(key) else _MISSING
+            if value is not _MISSING:
+                found[key] = value
+                local_hits += 1
+            else:
+                remote.append(key)
+                local_misses += self._is_local(key)
+        if local_hits or local_misses:
+            self._count(LOCAL, local_hits, local_misses)
+
+        if remote:
+            fetched = self.shared.get_many(remote, version=version)
+            self._count(SHARED, len(fetched), len(remote) - len(fetched))
+            for key, value in fetched.items():
+                if self._is_local(key):
+                    self._local_set(key, value, self._local_timeout, version)
+            found.update(fetched)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout=timeout, version=version)
+        if self._is_local(key):
+            self._local_set(key, value, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout=timeout, version=version)
+        for key, value in data.items():
+            if self._is_local(key) and key not in failed:
+                self._local_set(key, value, timeout, version)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.add(key, value, timeout=timeout, version=version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout=timeout, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        if self._is_local(key):
+            self._local_discard(key, version)
+        return self.shared.incr(key, delta, version=version)
+
+    def decr(self, key, delta=1, version=None):
+        if self._is_local(key):
+            self._local_discard(key, version)
+        return self.shared.decr(key, delta, version=version)
+
+    def has_key(self, key, version=None):
+        if self._is_local(key) and self._local_get(key, version) is not _MISSING:
+            return True
+        return self.shared.has_key(key, version=version)
+
+    def delete(self, key, version=None):
+        if self._is_local(key):
+            self._local_discard(key, version)
+        return self.shared.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        for key in keys:
+            if self._is_local(key):
+                self._local_discard(key, version)
+        self.shared.delete_many(keys, version=version)
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+        self.shared.clear()
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
+
+
+def hit_ratios(shared):
+    """
+    Hit counts and ratios per tier, summed over every process, from the
+    counters in ``shared``, as ``{tier: {"hits", "misses", "ratio"}}``.
+    """
+    keys = {
+        (tier, outcome): METRICS_KEY.format(tier=tier, outcome=outcome)
+        for tier in TIERS for outcome in ("hits", "misses")
+    }
+    counts = shared.get_many(list(keys.values()))
+    report = {}
+    for tier in TIERS:
+        hits = counts.get(keys[tier, "hits"], 0)
+        misses = counts.get(keys[tier, "misses"], 0)
+        report[tier] = {
+            "hits": hits,
+            "misses": misses,
+            "ratio": hits / (hits + misses) if hits + misses else None,
+        }
+    return report
+
+
+def reset_hit_ratios(shared):
+    shared.delete_many([
+        METRICS_KEY.format(tier=tier, outcome=outcome)
+        for tier in TIERS for outcome in ("hits", "misses")
+    ])
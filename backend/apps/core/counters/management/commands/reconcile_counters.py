@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.core.counters.reconcile import COUNTERS, DEFAULT_BATCH_SIZE, reconcile_all
+
+
+class Command(BaseCommand):
+    """Recompute denormalized counters and report drift. Safe to run from cron."""
+    help = "Reconcile likes/comments/downloads/followers counters with their source tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--counter",
+            action="append",
+            choices=[spec.name for spec in COUNTERS],
+            help="Only reconcile this counter (repeatable). Defaults to all.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help="Parent rows aggregated per statement.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report drift without writing corrections.",
+        )
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive")
+
+        reports = reconcile_all(
+            batch_size=options["batch_size"],
+            dry_run=options["dry_run"],
+            names=options["counter"],
+        )
+
+        for report in reports:
+            line = (
+                f"{report['counter']}: {report['rows_drifted']} drifted rows, "
+                f"abs drift {report['total_abs_drift']}, net {report['net_drift']}, "
+                f"max {report['max_abs_drift']} ({report['chunks']} chunks)"
+            )
+            style = self.style.WARNING if report["rows_drifted"] else self.style.SUCCESS
+            self.stdout.write(style(line))
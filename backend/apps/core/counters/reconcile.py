@@ -0,0 +1,163 @@
+"""
+Reconciliation of denormalized counter columns.
+
+Every counter is recomputed from its source table with one GROUP BY join per
+chunk of parent rows, and only rows whose stored value drifted are rewritten.
+Run it periodically (cron) through the ``reconcile_counters`` command.
+"""
+from collections import namedtuple
+from django.apps import apps
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+import logging
+
+logger = logging.getLogger(__name__)
+
+DRIFT_REPORT_CACHE_KEY = "counter_drift_report"
+DEFAULT_BATCH_SIZE = 5000
+
+# parent: model holding the counter, child: model whose rows are counted,
+# fk: field on the child pointing at the parent.
+CounterSpec = namedtuple("CounterSpec", ["name", "parent", "counter", "child", "fk"])
+
+COUNTERS = [
+    CounterSpec("photo_likes", "photos.Photo", "likes_count", "likes.Like", "photo"),
+    CounterSpec("photo_comments", "photos.Photo", "comments_count", "comments.Comment", "photo"),
+    CounterSpec("photo_downloads", "photos.Photo", "downloads_count", "downloads.Download", "photo"),
+    CounterSpec("user_followers", "users.User", "followers_count", "followers.Follower", "following"),
+    CounterSpec("user_following", "users.User", "following_count", "followers.Follower", "follower"),
+    CounterSpec("collection_likes", "collection.Collection", "likes_count", "collection.CollectionLike", "collection"),
+    CounterSpec("collection_followers", "collection.Collection", "followers_count", "collection.CollectionFollower", "collection"),
+    CounterSpec("collection_photos", "collection.Collection", "photos_count", "collection.PhotoCollection", "collection"),
+]
+
+
+def get_counter(name):
+    """Return the counter spec registered under ``name``."""
+    for spec in COUNTERS:
+        if spec.name == name:
+            return spec
+    raise KeyError(f"Unknown counter: {name}")
+
+
+def _tables(spec):
+    """Resolve quoted table/column names for a counter spec."""
+    qn = connection.ops.quote_name
+    parent = apps.get_model(spec.parent)
+    child = apps.get_model(spec.child)
+    return {
+        "parent": qn(parent._meta.db_table),
+        "pk": qn(parent._meta.pk.column),
+        "counter": qn(parent._meta.get_field(spec.counter).column),
+        "child": qn(child._meta.db_table),
+        "fk": qn(child._meta.get_field(spec.fk).column),
+    }
+
+
+def _drift_subquery(names, lower, upper):
+    """
+    Aggregate the true count for one chunk of parent rows.
+    Chunks are half-open primary key ranges: (lower, upper].
+    """
+    conditions, params = [], []
+    if lower is not None:
+        conditions.append("p2.{pk} > %s".format(**names))
+        params.append(lower)
+    if upper is not None:
+        conditions.append("p2.{pk} <= %s".format(**names))
+        params.append(upper)
+    where = ("WHERE " + " AND ".join(conditions) + " ") if conditions else ""
+    sql = (
+        "SELECT p2.{pk} AS id, p2.{counter} AS stored, COUNT(ch.{fk}) AS actual "
+        "FROM {parent} p2 LEFT JOIN {child} ch ON ch.{fk} = p2.{pk} "
+    ).format(**names) + where + "GROUP BY p2.{pk}, p2.{counter}".format(**names)
+    return sql, params
+
+
+def _chunk_bounds(spec, batch_size):
+    """Yield (lower, upper) primary key bounds covering the parent table."""
+    parent = apps.get_model(spec.parent)
+
+    def prep(value):
+        return None if value is None else parent._meta.pk.get_db_prep_value(value, connection)
+
+    lower = None
+    while True:
+        qs = parent.objects.order_by("pk").values_list("pk", flat=True)
+        if lower is not None:
+            qs = qs.filter(pk__gt=lower)
+        upper = qs[batch_size - 1:batch_size].first()
+        yield prep(lower), prep(upper)
+        if upper is None:
+            return
+        lower = upper
+
+
+def reconcile_counter(spec, batch_size=DEFAULT_BATCH_SIZE, dry_run=False):
+    """
+    Recompute one counter column chunk by chunk.
+    Returns drift metrics for the rows that were (or would be) corrected.
+    """
+    names = _tables(spec)
+    report = {
+        "counter": spec.name,
+        "chunks": 0,
+        "rows_drifted": 0,
+        "total_abs_drift": 0,
+        "net_drift": 0,
+        "max_abs_drift": 0,
+    }
+
+    for lower, upper in _chunk_bounds(spec, batch_size):
+        subquery, params = _drift_subquery(names, lower, upper)
+        if dry_run:
+            sql = (
+                "SELECT c.actual - c.stored FROM (" + subquery + ") c "
+                "WHERE c.stored <> c.actual"
+            )
+        else:
+            sql = (
+                "UPDATE {parent} AS p SET {counter} = c.actual ".format(**names)
+                + "FROM (" + subquery + ") c "
+                + "WHERE p.{pk} = c.id AND c.stored <> c.actual ".format(**names)
+                + "RETURNING c.actual - c.stored"
+            )
+
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                deltas = [row[0] for row in cursor.fetchall()]
+
+        report["chunks"] += 1
+        report["rows_drifted"] += len(deltas)
+        report["total_abs_drift"] += sum(abs(d) for d in deltas)
+        report["net_drift"] += sum(deltas)
+        if deltas:
+            report["max_abs_drift"] = max(report["max_abs_drift"], max(abs(d) for d in deltas))
+
+    return report
+
+
+def reconcile_all(batch_size=DEFAULT_BATCH_SIZE, dry_run=False, names=None):
+    """
+    Reconcile every registered counter (or the ones listed in ``names``).
+    The combined report is logged and kept in the cache for monitoring.
+    """
+    specs = [get_counter(name) for name in names] if names else COUNTERS
+    reports = []
+    for spec in specs:
+        report = reconcile_counter(spec, batch_size=batch_size, dry_run=dry_run)
+        if report["rows_drifted"]:
+            logger.warning(
+                f"Counter drift on {spec.name}: {report['rows_drifted']} rows, "
+                f"{report['total_abs_drift']} total, max {report['max_abs_drift']}"
+            )
+        reports.append(report)
+
+    if not dry_run:
+        cache.set(DRIFT_REPORT_CACHE_KEY, {
+            "ran_at": timezone.now().isoformat(),
+            "counters": reports,
+        }, timeout=None)
+    return reports
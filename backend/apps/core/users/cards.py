@@ -0,0 +1,36 @@
+"""
+Cached user cards: the compact id/username/avatar/followers_count summary
+shown next to every user in a list. Cards are cached individually so a
+page of N users costs one ``get_many`` plus, at most, one query for the
+cards that were missing.
+"""
+from django.core.cache import cache
+
+from .models import User
+from .serializers import UserCardSerializer
+
+USER_CARD_CACHE_KEY = "user_card_{user_id}"
+USER_CARD_TIMEOUT = 3600  # 1 hour
+CARD_FIELDS = ("id", "username", "profile_picture", "followers_count")
+
+
+def get_user_cards(user_ids):
+    """Return ``{user_id: card}`` for the given IDs; unknown IDs are left out."""
+    keys = {USER_CARD_CACHE_KEY.format(user_id=user_id): user_id for user_id in set(user_ids)}
+    cached = cache.get_many(keys)
+    cards = {keys[key]: card for key, card in cached.items()}
+
+    missing = [user_id for key, user_id in keys.items() if key not in cached]
+    if missing:
+        rows = User.objects.filter(id__in=missing).values(*CARD_FIELDS)
+        fresh = {row["id"]: dict(UserCardSerializer(row).data) for row in rows}
+        cache.set_many({
+            USER_CARD_CACHE_KEY.format(user_id=user_id): card for user_id, card in fresh.items()
+        }, timeout=USER_CARD_TIMEOUT)
+        cards.update(fresh)
+    return cards
+
+
+def invalidate_user_cards(*user_ids):
+    """Drop cached cards after a username, avatar or followers_count change."""
+    cache.delete_many([USER_CARD_CACHE_KEY.format(user_id=user_id) for user_id in user_ids])
@@ -6,4 +6,21 @@ class ProfileSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ["id","username", "email", "full_name", "bio", "profile_picture", "about", "contact","followers_count","following_count","created_at"]
-        read_only_fields = ["id","followers_count","following_count","created_at"]
\ No newline at end of file
+        read_only_fields = ["id","followers_count","following_count","created_at"]
+
+class UserCardSerializer(serializers.Serializer):
+    """Compact user summary for lists. Works on instances and ``.values()`` rows."""
+    id = serializers.UUIDField(read_only=True)
+    username = serializers.CharField(read_only=True)
+    avatar = serializers.SerializerMethodField()
+    followers_count = serializers.IntegerField(read_only=True)
+
+    def get_avatar(self, obj):
+        picture = obj["profile_picture"] if isinstance(obj, dict) else obj.profile_picture
+        if not picture:
+            return None
+        # Profile uploads store Cloudinary's secure_url, which the field
+        # parses as a public_id with the extension split off.
+        if picture.public_id.startswith(("http://", "https://")):
+            return f"{picture.public_id}.{picture.format}" if picture.format else picture.public_id
+        return picture.url
@@ -3,6 +3,7 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
 from apps.core.users.models import User
+from .cards import invalidate_user_cards
 from .serializers import ProfileSerializer
 from cloudinary.uploader import upload
 from .security import validate_image
@@ -57,6 +58,7 @@ class ProfileView(APIView):
         serializer = ProfileSerializer(user, data=data, partial=True)
         if serializer.is_valid():
             User.objects.filter(id=user.id).update(**serializer.validated_data)
+            invalidate_user_cards(user.id)
             return Response({"message": "Profile updated successfully", "data": serializer.data}, status=status.HTTP_200_OK)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
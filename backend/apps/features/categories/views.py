@@ -4,19 +4,30 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.exceptions import ValidationError, PermissionDenied
 from django.core.cache import cache
-from django.db import transaction
 from django.db.models import Count, Q
-from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from django.conf import settings
 import logging
 
 from .models import Category, photo_category
 from .serializers import CategorySerializer, PhotoCategorySerializer
+from apps.core.cache.keys import ALL_CATEGORIES, CATEGORIES, CATEGORY_STATS, POPULAR_CATEGORIES
+from apps.features.photos.memberships import CATEGORY_PHOTOS, add_photos, parse_photo_ids, remove_photos
 from apps.features.photos.models import Photo
 
 logger = logging.getLogger(__name__)
 
+
+def _photo_ids(request):
+    """The request's ``photo_ids`` as UUIDs; raises ValidationError."""
+    photo_ids = request.data.get('photo_ids', [])
+    if not photo_ids:
+        raise ValidationError("photo_ids list is required")
+    try:
+        return parse_photo_ids(photo_ids)
+    except ValueError:
+        raise ValidationError("photo_ids must be a list of valid photo IDs")
+
 class CategoryViewSet(viewsets.ModelViewSet):
     """
     ViewSet for handling category operations.
@@ -59,7 +70,7 @@ class CategoryViewSet(viewsets.ModelViewSet):
         List all categories with caching.
         """
         try:
-            cache_key = "all_categories"
+            cache_key = ALL_CATEGORIES.key()
             cached_categories = cache.get(cache_key)
 
             if cached_categories:
@@ -94,11 +105,7 @@ class CategoryViewSet(viewsets.ModelViewSet):
             response = super().create(request, *args, **kwargs)
             
             # Clear relevant caches
-            cache_keys = [
-                "all_categories",
-                "popular_categories"
-            ]
-            cache.delete_many(cache_keys)
+            CATEGORIES.bump()
 
             return response
 
@@ -126,13 +133,8 @@ class CategoryViewSet(viewsets.ModelViewSet):
             response = super().update(request, *args, **kwargs)
 
             # Clear relevant caches
-            cache_keys = [
-                "all_categories",
-                "popular_categories",
-                f"category_{category.id}",
-                f"category_photos_{category.id}"
-            ]
-            cache.delete_many(cache_keys)
+            CATEGORIES.bump(category.id)
+            CATEGORIES.bump()
 
             return response
 
@@ -156,13 +158,8 @@ class CategoryViewSet(viewsets.ModelViewSet):
             category.delete()
 
             # Clear relevant caches
-            cache_keys = [
-                "all_categories",
-                "popular_categories",
-                f"category_{category_id}",
-                f"category_photos_{category_id}"
-            ]
-            cache.delete_many(cache_keys)
+            CATEGORIES.bump(category_id)
+            CATEGORIES.bump()
 
             return Response(status=status.HTTP_204_NO_CONTENT)
 
@@ -178,38 +175,22 @@ class CategoryViewSet(viewsets.ModelViewSet):
         """Add photos to a category."""
         try:
             category = self.get_object()
-            photo_ids = request.data.get('photo_ids', [])
+            photo_ids = _photo_ids(request)
 
-            if not photo_ids:
-                raise ValidationError("photo_ids list is required")
-            
             if len(photo_ids) > self.MAX_PHOTOS_PER_BATCH:
                 raise ValidationError(f"Cannot add more than {self.MAX_PHOTOS_PER_BATCH} photos at once")
 
-            # Add photos
-            added_photos = []
-            with transaction.atomic():
-                for photo_id in photo_ids:
-                    photo = get_object_or_404(Photo, id=photo_id)
-                    
-                    # Check if user owns the photo
-                    if photo.user != request.user and not request.user.is_staff:
-                        continue
-
-                    photo_cat, created = photo_category.objects.get_or_create(
-                        photo=photo,
-                        category=category
-                    )
-                    if created:
-                        added_photos.append(photo_id)
+            # Staff can add anyone's photos; others only their own.
+            added_photos, missing = add_photos(
+                CATEGORY_PHOTOS, category, photo_ids,
+                owner_id=None if request.user.is_staff else request.user.id
+            )
+            if missing:
+                raise ValidationError(f"Photos not found: {', '.join(map(str, missing))}")
 
             # Clear relevant caches
-            cache_keys = [
-                f"category_photos_{category.id}",
-                f"category_{category.id}",
-                "popular_categories"
-            ]
-            cache.delete_many(cache_keys)
+            CATEGORIES.bump(category.id)
+            CATEGORIES.bump()
 
             return Response({
                 "message": "Photos added successfully",
@@ -230,40 +211,25 @@ class CategoryViewSet(viewsets.ModelViewSet):
         """Remove photos from a category."""
         try:
             category = self.get_object()
-            photo_ids = request.data.get('photo_ids', [])
-
-            if not photo_ids:
-                raise ValidationError("photo_ids list is required")
+            photo_ids = _photo_ids(request)
 
             if len(photo_ids) > self.MAX_PHOTOS_PER_BATCH:
                 raise ValidationError(f"Cannot remove more than {self.MAX_PHOTOS_PER_BATCH} photos at once")
 
-            # Remove photos
-            with transaction.atomic():
-                # Only remove photos owned by the user unless staff
-                if request.user.is_staff:
-                    removed = photo_category.objects.filter(
-                        category=category,
-                        photo_id__in=photo_ids
-                    ).delete()[0]
-                else:
-                    removed = photo_category.objects.filter(
-                        category=category,
-                        photo_id__in=photo_ids,
-                        photo__user=request.user
-                    ).delete()[0]
+            # Only remove photos owned by the user unless staff
+            removed_photos = remove_photos(
+                CATEGORY_PHOTOS, category, photo_ids,
+                owner_id=None if request.user.is_staff else request.user.id
+            )
 
             # Clear relevant caches
-            cache_keys = [
-                f"category_photos_{category.id}",
-                f"category_{category.id}",
-                "popular_categories"
-            ]
-            cache.delete_many(cache_keys)
+            CATEGORIES.bump(category.id)
+            CATEGORIES.bump()
 
             return Response({
                 "message": "Photos removed successfully",
-                "removed_count": removed
+                "removed_photos": removed_photos,
+                "removed_count": len(removed_photos)
             })
 
         except ValidationError as e:
@@ -301,7 +267,7 @@ class CategoryViewSet(viewsets.ModelViewSet):
     def popular(self, request):
         """Get popular categories based on photo count."""
         try:
-            cache_key = "popular_categories"
+            cache_key = POPULAR_CATEGORIES.key()
             cached_categories = cache.get(cache_key)
 
             if cached_categories:
@@ -330,7 +296,7 @@ class CategoryViewSet(viewsets.ModelViewSet):
         """Get statistics for a category."""
         try:
             category = self.get_object()
-            cache_key = f"category_stats_{category.id}"
+            cache_key = CATEGORY_STATS.key(category_id=category.id)
             cached_stats = cache.get(cache_key)
 
             if cached_stats:
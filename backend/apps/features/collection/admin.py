@@ -3,11 +3,11 @@ from .models import Collection, PhotoCollection, CollectionLike, CollectionFollo
 
 @admin.register(Collection)
 class CollectionAdmin(admin.ModelAdmin):
-    list_display = ("name", "user", "is_public", "likes_count", "followers_count", "created_at")
+    list_display = ("name", "user", "is_public", "likes_count", "followers_count", "photos_count", "created_at")
     list_filter = ("is_public", "created_at", "user")
     search_fields = ("name", "user__username")
     ordering = ("-created_at",)
-    readonly_fields = ("likes_count", "followers_count", "created_at")  # Prevent manual edits of counts
+    readonly_fields = ("likes_count", "followers_count", "photos_count", "cover_photo_ids", "cover_dirty_at", "created_at")  # Prevent manual edits of counts
     
     def has_change_permission(self, request, obj=None):
         return request.user.is_staff  # 🔥 Admins can edit
@@ -18,11 +18,18 @@ class CollectionAdmin(admin.ModelAdmin):
     def has_add_permission(self, request):
         return request.user.is_staff  # 🔥 Admins can add
 
+    def save_model(self, request, obj, form, change):
+        # Counters and covers are kept up to date by UPDATEs; only write what was edited.
+        if change:
+            obj.save(update_fields=form.changed_data)
+        else:
+            super().save_model(request, obj, form, change)
+
 @admin.register(PhotoCollection)
 class PhotoCollectionAdmin(admin.ModelAdmin):
-    list_display = ("id", "photo", "collection")
+    list_display = ("id", "photo", "collection", "position")
     search_fields = ("collection__name", "photo__id")
-    ordering = ("collection",)
+    ordering = ("collection", "position")
 
 @admin.register(CollectionLike)
 class CollectionLikeAdmin(admin.ModelAdmin):
@@ -0,0 +1,142 @@
+"""
+Streaming ZIP archives of collections.
+
+The archive is written with zipfile into a sink that is drained after every
+write, so the response streams as it is built. Entries are STORED (photos
+are already compressed) with their sizes and CRC in trailing data
+descriptors, which is how zipfile writes to an unseekable stream.
+
+Photos are fetched from storage by a small thread pool, at most
+ARCHIVE_PREFETCH ahead of the one being written, so memory is bounded by
+the prefetch window rather than the size of the collection.
+"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.utils import timezone
+from django.utils.text import slugify
+import logging
+import requests
+import zipfile
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_PREFETCH = getattr(settings, 'COLLECTION_ARCHIVE_PREFETCH', 4)
+ARCHIVE_FETCH_TIMEOUT = 30  # seconds
+ARCHIVE_CHUNK_SIZE = 64 * 1024
+
+
+class _Sink:
+    """Write-only file object for zipfile; ``drain`` hands over what was written."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        """Yield what was written since the last drain, if anything."""
+        if self._chunks:
+            data = b"".join(self._chunks)
+            self._chunks.clear()
+            yield data
+
+
+def _fetch(url):
+    response = requests.get(url, timeout=ARCHIVE_FETCH_TIMEOUT)
+    response.raise_for_status()
+    return response.content
+
+
+def archive_name(photo, index):
+    """Unique, readable file name for a photo in the archive."""
+    stem = slugify(photo.title or "") or str(photo.id)
+    return f"{index:04d}-{stem}.{photo.format or 'jpg'}"
+
+
+class _ArchiveStream:
+    """
+    Iterable response body that calls ``on_complete`` exactly once: when the
+    archive ends, when the client disconnects part way through, or when the
+    response is closed before it was ever read.
+    """
+
+    def __init__(self, photos, on_complete, fetch):
+        self._written = []
+        self._on_complete = on_complete
+        self._completed = False
+        self._chunks = _write_archive(photos, self._written, fetch, self._complete)
+
+    def __iter__(self):
+        return self._chunks
+
+    def close(self):
+        # Closing a generator that never started skips its finally block.
+        self._chunks.close()
+        self._complete()
+
+    def _complete(self):
+        if self._completed:
+            return
+        self._completed = True
+        if self._on_complete is not None:
+            self._on_complete(self._written)
+
+
+def stream_archive(photos, on_complete=None, fetch=_fetch):
+    """
+    A ZIP of ``photos`` to stream chunk by chunk. Photos that cannot be
+    fetched are left out. ``on_complete`` is called with the photos that were
+    written, also when the client disconnects or never reads the body, as
+    long as the server closes the response.
+    """
+    return _ArchiveStream(photos, on_complete, fetch)
+
+
+def _write_archive(photos, written, fetch, on_complete):
+    sink = _Sink()
+    date_time = timezone.now().timetuple()[:6]
+    pending = deque()
+    photos = iter(photos)
+
+    with ThreadPoolExecutor(max_workers=ARCHIVE_PREFETCH) as pool:
+        def fill():
+            while len(pending) < ARCHIVE_PREFETCH:
+                photo = next(photos, None)
+                if photo is None:
+                    return
+                pending.append((photo, pool.submit(fetch, photo.image.url)))
+
+        try:
+            with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED) as archive:
+                fill()
+                index = 0
+                while pending:
+                    photo, future = pending.popleft()
+                    fill()
+                    try:
+                        data = future.result()
+                    except Exception as e:
+                        logger.warning(f"Skipping photo {photo.id} in archive: {str(e)}")
+                        continue
+
+                    index += 1
+                    info = zipfile.ZipInfo(archive_name(photo, index), date_time=date_time)
+                    info.compress_type = zipfile.ZIP_STORED
+                    with archive.open(info, mode="w") as entry:
+                        for start in range(0, len(data), ARCHIVE_CHUNK_SIZE):
+                            entry.write(data[start:start + ARCHIVE_CHUNK_SIZE])
+                            yield from sink.drain()
+                    written.append(photo)
+                    yield from sink.drain()
+            # Central directory, written when the archive is closed.
+            yield from sink.drain()
+        finally:
+            for _, future in pending:
+                future.cancel()
+            on_complete()
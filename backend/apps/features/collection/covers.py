@@ -0,0 +1,145 @@
+"""
+Collection cover mosaics.
+
+A collection card shows one precomputed image: the collection's first
+photos (in order) composed into a 2x2 grid or, with COLLECTION_COVER_LAYOUT
+"feature", one large photo beside three small ones. The image and the IDs
+of the photos in it live on the collection row, so a grid of cards needs no
+query beyond the collection list and one image request per card.
+
+Changes to a collection's photos only set ``cover_dirty_at`` (in the same
+UPDATE as the photo counter, see photos.memberships). build_collection_covers
+rebuilds covers that have been dirty for at least COVER_DEBOUNCE seconds,
+so a burst of edits costs one rebuild. A cover whose photos did not change
+is not redrawn.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+from io import BytesIO
+from PIL import Image as PILImage, ImageOps
+import cloudinary.uploader
+import logging
+import requests
+
+from .models import Collection, PhotoCollection
+from apps.core.cache.keys import USER_COLLECTIONS
+
+logger = logging.getLogger(__name__)
+
+COVER_SIZE = getattr(settings, 'COLLECTION_COVER_SIZE', 600)  # pixels, square
+COVER_LAYOUT = getattr(settings, 'COLLECTION_COVER_LAYOUT', 'grid')
+COVER_DEBOUNCE = getattr(settings, 'COLLECTION_COVER_DEBOUNCE', 60)  # seconds
+COVER_PHOTOS = 4
+COVER_FETCH_TIMEOUT = 15  # seconds
+COVER_BACKGROUND = (240, 240, 240)
+
+# Tiles as (left, top, right, bottom) fractions of the cover, by photo count.
+_HALVES = [(0, 0, 1 / 2, 1), (1 / 2, 0, 1, 1)]
+_ONE_PLUS_TWO = [(0, 0, 1 / 2, 1), (1 / 2, 0, 1, 1 / 2), (1 / 2, 1 / 2, 1, 1)]
+LAYOUTS = {
+    "grid": {
+        1: [(0, 0, 1, 1)],
+        2: _HALVES,
+        3: _ONE_PLUS_TWO,
+        4: [(0, 0, 1 / 2, 1 / 2), (1 / 2, 0, 1, 1 / 2), (0, 1 / 2, 1 / 2, 1), (1 / 2, 1 / 2, 1, 1)],
+    },
+    "feature": {
+        1: [(0, 0, 1, 1)],
+        2: _HALVES,
+        3: _ONE_PLUS_TWO,
+        4: [(0, 0, 2 / 3, 1), (2 / 3, 0, 1, 1 / 3), (2 / 3, 1 / 3, 1, 2 / 3), (2 / 3, 2 / 3, 1, 1)],
+    },
+}
+
+
+def _fetch(url):
+    response = requests.get(url, timeout=COVER_FETCH_TIMEOUT)
+    response.raise_for_status()
+    return response.content
+
+
+def _store(collection, data):
+    """Upload the cover and return the value for ``cover_image``."""
+    result = cloudinary.uploader.upload(
+        data,
+        folder="collection_covers",
+        public_id=str(collection.id),
+        overwrite=True,
+        resource_type="image",
+    )
+    # Keep the version so the URL changes whenever the cover does.
+    return f"image/upload/v{result['version']}/{result['public_id']}.{result['format']}"
+
+
+def cover_photos(collection):
+    """The photos that belong in the collection's cover, in order."""
+    rows = PhotoCollection.objects.select_related('photo').filter(collection=collection)
+    return [row.photo for row in rows.order_by('position')[:COVER_PHOTOS]]
+
+
+def compose_cover(images, layout=None, size=None):
+    """Compose up to COVER_PHOTOS PIL images into one square JPEG. Returns bytes."""
+    size = size or COVER_SIZE
+    tiles = LAYOUTS[layout or COVER_LAYOUT][len(images)]
+    cover = PILImage.new("RGB", (size, size), COVER_BACKGROUND)
+    for image, (left, top, right, bottom) in zip(images, tiles):
+        box = (round(left * size), round(top * size), round(right * size), round(bottom * size))
+        tile = ImageOps.fit(image.convert("RGB"), (box[2] - box[0], box[3] - box[1]))
+        cover.paste(tile, box[:2])
+    output = BytesIO()
+    cover.save(output, format="JPEG", quality=85, optimize=True, progressive=True)
+    return output.getvalue()
+
+
+def build_cover(collection, force=False, fetch=_fetch, store=_store):
+    """
+    Rebuild the collection's cover if its photos changed (or ``force``) and
+    clear its dirty mark. Returns True if a new image was stored.
+    """
+    photos = cover_photos(collection)
+    photo_ids = [str(photo.id) for photo in photos]
+    # A change while the cover is built leaves the collection dirty.
+    changes = {
+        "cover_dirty_at": Case(
+            When(cover_dirty_at=collection.cover_dirty_at, then=Value(None)),
+            default=F("cover_dirty_at"),
+        ),
+    }
+
+    built = False
+    if not photos:
+        changes.update(cover_image=None, cover_photo_ids=[])
+    elif force or photo_ids != collection.cover_photo_ids or not collection.cover_image:
+        # Tiles only need the cover's resolution; ask storage for that size.
+        urls = [photo.image.build_url(width=COVER_SIZE, height=COVER_SIZE, crop="limit") for photo in photos]
+        with ThreadPoolExecutor(max_workers=COVER_PHOTOS) as pool:
+            blobs = list(pool.map(fetch, urls))
+        images = [PILImage.open(BytesIO(blob)) for blob in blobs]
+        changes.update(cover_image=store(collection, compose_cover(images)), cover_photo_ids=photo_ids)
+        built = True
+
+    Collection.objects.filter(pk=collection.pk).update(**changes)
+    if "cover_image" in changes:
+        USER_COLLECTIONS.bump(collection.user_id)
+    return built
+
+
+def dirty_collections(debounce=None):
+    """Collections dirty for at least ``debounce`` seconds, oldest first."""
+    quiet_since = timezone.now() - timedelta(seconds=COVER_DEBOUNCE if debounce is None else debounce)
+    return Collection.objects.filter(cover_dirty_at__lte=quiet_since).order_by('cover_dirty_at')
+
+
+def build_covers(collections, force=False):
+    """Rebuild covers for ``collections``; failures are logged and skipped. Returns ``(built, failed)``."""
+    built = failed = 0
+    for collection in collections:
+        try:
+            built += build_cover(collection, force=force)
+        except Exception as e:
+            failed += 1
+            logger.warning(f"Failed to build cover for collection {collection.id}: {str(e)}")
+    return built, failed
@@ -0,0 +1,194 @@
+"""
+Engagement rankings for trending and featured collections.
+
+Likes and follows are counted into hourly buckets per collection as they are
+toggled; an unlike or unfollow takes one off the bucket of the hour the like
+or follow was made in. ``CollectionEngagement`` keeps each collection's
+7- and 30-day sums of its buckets, updated in the same statement as the
+bucket, so trending and featured are top-K reads of that table.
+
+The windows are whole hours: with ``rolled_to`` at hour R, the sums cover
+the buckets after R minus the window. roll_collection_engagement moves R
+forward every hour, subtracting only the buckets that slid out of a window,
+and deletes buckets older than 30 days. ``rebuild_engagement`` recomputes
+everything from the likes and follows tables, to backfill or to repair drift.
+"""
+from datetime import timedelta
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import CollectionEngagement, CollectionEngagementBucket, CollectionFollower, CollectionLike
+
+FEATURED_WINDOW = timedelta(days=30)
+
+RECORD_SQL = """
+WITH bucket AS (
+    INSERT INTO {buckets} AS b ({b_collection}, {b_hour}, {b_likes}, {b_follows})
+    VALUES (%(collection)s, %(hour)s, %(likes)s, %(follows)s)
+    ON CONFLICT ({b_collection}, {b_hour}) DO UPDATE SET
+        {b_likes} = b.{b_likes} + EXCLUDED.{b_likes},
+        {b_follows} = b.{b_follows} + EXCLUDED.{b_follows}
+)
+INSERT INTO {sums} AS s ({s_collection}, {likes_7d}, {follows_7d}, {likes_30d}, {follows_30d}, {rolled_to})
+SELECT %(collection)s,
+       CASE WHEN in_7d THEN %(likes)s ELSE 0 END, CASE WHEN in_7d THEN %(follows)s ELSE 0 END,
+       CASE WHEN in_30d THEN %(likes)s ELSE 0 END, CASE WHEN in_30d THEN %(follows)s ELSE 0 END,
+       %(now)s
+FROM (SELECT %(hour)s > %(now)s - interval '7 days' AS in_7d,
+             %(hour)s > %(now)s - interval '30 days' AS in_30d) w
+WHERE %(hour)s > %(now)s - interval '30 days'
+ON CONFLICT ({s_collection}) DO UPDATE SET
+    {likes_7d} = s.{likes_7d} + CASE WHEN %(hour)s > s.{rolled_to} - interval '7 days' THEN %(likes)s ELSE 0 END,
+    {follows_7d} = s.{follows_7d} + CASE WHEN %(hour)s > s.{rolled_to} - interval '7 days' THEN %(follows)s ELSE 0 END,
+    {likes_30d} = s.{likes_30d} + CASE WHEN %(hour)s > s.{rolled_to} - interval '30 days' THEN %(likes)s ELSE 0 END,
+    {follows_30d} = s.{follows_30d} + CASE WHEN %(hour)s > s.{rolled_to} - interval '30 days' THEN %(follows)s ELSE 0 END
+"""
+
+ROLL_SQL = """
+WITH expired AS (
+    SELECT s.{s_collection} AS collection_id,
+           COALESCE(SUM(b.{b_likes}) FILTER (WHERE b.{b_hour} > s.{rolled_to} - interval '7 days'
+                                              AND b.{b_hour} <= %(to)s - interval '7 days'), 0) AS likes_7d,
+           COALESCE(SUM(b.{b_follows}) FILTER (WHERE b.{b_hour} > s.{rolled_to} - interval '7 days'
+                                                AND b.{b_hour} <= %(to)s - interval '7 days'), 0) AS follows_7d,
+           COALESCE(SUM(b.{b_likes}) FILTER (WHERE b.{b_hour} <= %(to)s - interval '30 days'), 0) AS likes_30d,
+           COALESCE(SUM(b.{b_follows}) FILTER (WHERE b.{b_hour} <= %(to)s - interval '30 days'), 0) AS follows_30d
+    FROM {sums} s JOIN {buckets} b ON b.{b_collection} = s.{s_collection}
+    WHERE s.{rolled_to} < %(to)s
+      AND b.{b_hour} > s.{rolled_to} - interval '30 days'
+      AND b.{b_hour} <= %(to)s - interval '7 days'
+    GROUP BY s.{s_collection}
+)
+UPDATE {sums} s SET
+    {likes_7d} = s.{likes_7d} - e.likes_7d,
+    {follows_7d} = s.{follows_7d} - e.follows_7d,
+    {likes_30d} = s.{likes_30d} - e.likes_30d,
+    {follows_30d} = s.{follows_30d} - e.follows_30d,
+    {rolled_to} = %(to)s
+FROM expired e
+WHERE s.{s_collection} = e.collection_id
+"""
+
+PRUNE_SQL = """
+DELETE FROM {buckets} WHERE {b_hour} <= %(to)s - interval '30 days'
+"""
+
+# Collections that no longer have anything in either window drop out.
+DROP_IDLE_SQL = """
+DELETE FROM {sums} s
+WHERE s.{likes_30d} = 0 AND s.{follows_30d} = 0 AND s.{likes_7d} = 0 AND s.{follows_7d} = 0
+  AND NOT EXISTS (SELECT 1 FROM {buckets} b WHERE b.{b_collection} = s.{s_collection})
+"""
+
+REBUILD_SQL = """
+LOCK TABLE {buckets}, {sums} IN SHARE ROW EXCLUSIVE MODE;
+DELETE FROM {buckets};
+DELETE FROM {sums};
+INSERT INTO {buckets} ({b_collection}, {b_hour}, {b_likes}, {b_follows})
+SELECT collection_id, hour, SUM(likes), SUM(follows) FROM (
+    SELECT {l_collection} AS collection_id, date_trunc('hour', {l_at}) AS hour, 1 AS likes, 0 AS follows
+    FROM {likes}
+    UNION ALL
+    SELECT {f_collection}, date_trunc('hour', {f_at}), 0, 1
+    FROM {followers}
+) e
+WHERE hour > %(to)s - interval '30 days'
+GROUP BY collection_id, hour;
+INSERT INTO {sums} ({s_collection}, {likes_7d}, {follows_7d}, {likes_30d}, {follows_30d}, {rolled_to})
+SELECT {b_collection},
+       COALESCE(SUM({b_likes}) FILTER (WHERE {b_hour} > %(to)s - interval '7 days'), 0),
+       COALESCE(SUM({b_follows}) FILTER (WHERE {b_hour} > %(to)s - interval '7 days'), 0),
+       SUM({b_likes}), SUM({b_follows}), %(to)s
+FROM {buckets}
+GROUP BY {b_collection};
+"""
+
+
+def _names():
+    qn = connection.ops.quote_name
+    buckets, sums = CollectionEngagementBucket._meta, CollectionEngagement._meta
+    likes, followers = CollectionLike._meta, CollectionFollower._meta
+    return {
+        "buckets": qn(buckets.db_table),
+        "b_collection": qn(buckets.get_field("collection").column),
+        "b_hour": qn(buckets.get_field("hour").column),
+        "b_likes": qn(buckets.get_field("likes").column),
+        "b_follows": qn(buckets.get_field("follows").column),
+        "sums": qn(sums.db_table),
+        "s_collection": qn(sums.get_field("collection").column),
+        "likes_7d": qn(sums.get_field("likes_7d").column),
+        "follows_7d": qn(sums.get_field("follows_7d").column),
+        "likes_30d": qn(sums.get_field("likes_30d").column),
+        "follows_30d": qn(sums.get_field("follows_30d").column),
+        "rolled_to": qn(sums.get_field("rolled_to").column),
+        "likes": qn(likes.db_table),
+        "l_collection": qn(likes.get_field("collection").column),
+        "l_at": qn(likes.get_field("liked_at").column),
+        "followers": qn(followers.db_table),
+        "f_collection": qn(followers.get_field("collection").column),
+        "f_at": qn(followers.get_field("followed_at").column),
+    }
+
+
+def _hour(at):
+    return at.replace(minute=0, second=0, microsecond=0)
+
+
+def record_engagement(collection_id, at, likes=0, follows=0):
+    """
+    Count a like/follow (+1) or its removal (-1) made at ``at`` towards the
+    collection's ranking. Call in the transaction that toggles it.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(RECORD_SQL.format(**_names()), {
+            "collection": collection_id,
+            "hour": _hour(at),
+            "now": _hour(timezone.now()),
+            "likes": likes,
+            "follows": follows,
+        })
+
+
+def roll_engagement(now=None):
+    """
+    Slide the windows forward to the current hour and drop buckets older
+    than 30 days. Returns ``(collections_rolled, buckets_deleted)``.
+    """
+    names = _names()
+    params = {"to": _hour(now or timezone.now())}
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(ROLL_SQL.format(**names), params)
+            rolled = cursor.rowcount
+            cursor.execute(PRUNE_SQL.format(**names), params)
+            pruned = cursor.rowcount
+            cursor.execute(DROP_IDLE_SQL.format(**names))
+    return rolled, pruned
+
+
+def rebuild_engagement(now=None):
+    """Recompute the buckets and sums from the likes and follows tables."""
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            for statement in REBUILD_SQL.format(**_names()).split(";")[:-1]:
+                cursor.execute(statement, {"to": _hour(now or timezone.now())})
+    return CollectionEngagement.objects.count()
+
+
+def trending_collections(queryset, limit):
+    """The public collections with the most likes, then follows, in the last 7 days."""
+    return queryset.filter(is_public=True, engagement__isnull=False).order_by(
+        '-engagement__likes_7d', '-engagement__follows_7d'
+    )[:limit]
+
+
+def featured_collections(queryset, limit):
+    """Public collections created in the last 30 days, by likes plus follows since."""
+    return queryset.filter(
+        is_public=True,
+        engagement__isnull=False,
+        created_at__gte=timezone.now() - FEATURED_WINDOW,
+    ).annotate(
+        engagement_score=F('engagement__likes_30d') + F('engagement__follows_30d')
+    ).order_by('-engagement_score')[:limit]
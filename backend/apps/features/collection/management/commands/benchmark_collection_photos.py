@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+import time
+import uuid
+
+from apps.core.users.models import User
+from apps.features.collection.models import Collection, PhotoCollection
+from apps.features.photos.memberships import COLLECTION_PHOTOS, add_photos, remove_photos
+from apps.features.photos.models import Photo
+
+
+class Command(BaseCommand):
+    """
+    Compare adding photos to a collection one by one (get + get_or_create
+    per photo, as add_photos used to) with the set-based add_photos, and time
+    remove_photos. Runs in a transaction that is rolled back.
+    """
+    help = "Benchmark bulk add/remove of collection photos across batch sizes."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes", default="10,100,500,1000",
+            help="Comma-separated batch sizes.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options["sizes"].split(",")]
+        except ValueError:
+            raise CommandError("--sizes must be comma-separated integers")
+        if not sizes or min(sizes) < 1:
+            raise CommandError("--sizes must be positive")
+
+        with transaction.atomic():
+            user = User.objects.create(
+                email=f"benchmark-{uuid.uuid4().hex}@example.com",
+                username=f"benchmark-{uuid.uuid4().hex[:12]}",
+            )
+            # bulk_create skips Photo.save(), which would fetch each image.
+            photos = Photo.objects.bulk_create([
+                Photo(user=user, image="benchmark", width=1, height=1, format="jpg")
+                for _ in range(max(sizes))
+            ])
+            photo_ids = [photo.id for photo in photos]
+
+            for size in sizes:
+                batch = photo_ids[:size]
+                per_row = Collection.objects.create(user=user, name=f"per-row-{size}", slug=uuid.uuid4().hex)
+                bulk = Collection.objects.create(user=user, name=f"bulk-{size}", slug=uuid.uuid4().hex)
+
+                self._measure(f"per-row add {size}", lambda: self._add_per_row(per_row, batch))
+                self._measure(f"bulk add {size}", lambda: add_photos(COLLECTION_PHOTOS, bulk, batch))
+                self._measure(f"bulk re-add {size}", lambda: add_photos(COLLECTION_PHOTOS, bulk, batch))
+                self._measure(f"bulk remove {size}", lambda: remove_photos(COLLECTION_PHOTOS, bulk, batch))
+
+            transaction.set_rollback(True)
+
+    def _add_per_row(self, collection, photo_ids):
+        for photo_id in photo_ids:
+            photo = Photo.objects.get(id=photo_id)
+            PhotoCollection.objects.get_or_create(photo=photo, collection=collection)
+
+    def _measure(self, label, run):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+        self.stdout.write(f"{label}: {elapsed * 1000:.1f}ms, {len(queries)} queries")
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.features.collection.covers import COVER_DEBOUNCE, build_covers, dirty_collections
+from apps.features.collection.models import Collection
+
+
+class Command(BaseCommand):
+    """Rebuild the cover mosaics of changed collections. Run every minute from cron."""
+    help = "Rebuild cover mosaics for collections whose photos changed."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--debounce",
+            type=int,
+            default=COVER_DEBOUNCE,
+            help="Only rebuild collections unchanged for this many seconds.",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=500,
+            help="Rebuild at most this many covers per run.",
+        )
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Redraw every collection's cover (e.g. after changing the layout).",
+        )
+
+    def handle(self, *args, **options):
+        if options["debounce"] < 0:
+            raise CommandError("--debounce cannot be negative")
+        if options["limit"] < 1:
+            raise CommandError("--limit must be positive")
+
+        if options["all"]:
+            collections = Collection.objects.order_by('id').iterator()
+        else:
+            collections = dirty_collections(options["debounce"])[:options["limit"]]
+
+        built, failed = build_covers(collections, force=options["all"])
+        self.stdout.write(self.style.SUCCESS(f"Built {built} collection covers ({failed} failed)"))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.features.collection.models import Collection
+from apps.features.collection.ordering import crowded_collections, renumber_positions
+
+DEFAULT_MIN_GAP = 64
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    """Respace photo positions in crowded collections. Run daily from cron."""
+    help = "Renumber photo positions in collections whose gaps have run low."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--min-gap",
+            type=int,
+            default=DEFAULT_MIN_GAP,
+            help="Renumber collections with two photos closer than this.",
+        )
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Renumber every collection (e.g. to backfill positions).",
+        )
+
+    def handle(self, *args, **options):
+        if options["min_gap"] < 1:
+            raise CommandError("--min-gap must be positive")
+
+        if options["all"]:
+            collection_ids = list(Collection.objects.values_list('id', flat=True))
+        else:
+            collection_ids = crowded_collections(options["min_gap"])
+
+        rows = 0
+        for start in range(0, len(collection_ids), BATCH_SIZE):
+            rows += renumber_positions(collection_ids[start:start + BATCH_SIZE])
+        self.stdout.write(self.style.SUCCESS(
+            f"Renumbered {len(collection_ids)} collections ({rows} rows rewritten)"
+        ))
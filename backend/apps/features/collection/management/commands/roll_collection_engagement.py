@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from apps.features.collection.engagement import rebuild_engagement, roll_engagement
+
+
+class Command(BaseCommand):
+    """Slide the trending/featured engagement windows forward. Run hourly from cron."""
+    help = "Expire collection engagement older than the 7- and 30-day windows."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Recompute all engagement from the likes and follows tables (backfill or repair).",
+        )
+
+    def handle(self, *args, **options):
+        if options["rebuild"]:
+            ranked = rebuild_engagement()
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt engagement for {ranked} collections"))
+            return
+
+        rolled, pruned = roll_engagement()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rolled {rolled} collections forward, pruned {pruned} hourly buckets"
+        ))
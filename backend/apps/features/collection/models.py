@@ -1,5 +1,8 @@
 import uuid
+from cloudinary.models import CloudinaryField
 from django.db import models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.utils.text import slugify
 from apps.core.users.models import User
 from apps.features.photos.models import Photo
@@ -15,10 +18,20 @@ class Collection(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     likes_count = models.IntegerField(default=0)
     followers_count = models.IntegerField(default=0)
+    photos_count = models.IntegerField(default=0)
+    # Cover mosaic of the first photos, rebuilt by build_collection_covers
+    # (see collection.covers) once cover_dirty_at has been quiet for a while.
+    cover_image = CloudinaryField("image", folder="collection_covers/", blank=True, null=True)
+    cover_photo_ids = models.JSONField(default=list, blank=True)
+    cover_dirty_at = models.DateTimeField(blank=True, null=True)
 
     class Meta:
         db_table = "collections"
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["cover_dirty_at"], name="collections_cover_dirty_idx",
+                         condition=models.Q(cover_dirty_at__isnull=False)),
+        ]
         permissions = [
             ("manage_collection", "Can manage collection"),
         ]
@@ -31,16 +44,36 @@ class Collection(models.Model):
     def __str__(self):
         return f"{self.name} by {self.user.username}"
 
+def with_live_photo_counts(queryset):
+    """
+    Annotate collections with their exact photo count (``live_photos_count``),
+    one correlated subquery per row, for when photos_count cannot be trusted,
+    e.g. before it has been backfilled by reconcile_counters.
+    """
+    counts = PhotoCollection.objects.filter(
+        collection=OuterRef('pk')
+    ).order_by().values('collection').annotate(n=Count('*')).values('n')
+    return queryset.annotate(live_photos_count=Coalesce(Subquery(counts), 0))
+
+
 class PhotoCollection(models.Model):
+    # Positions are sparse: photos start POSITION_GAP apart, so a move only
+    # rewrites the moved row (see collection.ordering).
+    POSITION_GAP = 1 << 16
+
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     photo = models.ForeignKey(Photo, on_delete=models.CASCADE, related_name="photo_collections")
     collection = models.ForeignKey(Collection, on_delete=models.CASCADE, related_name="photo_collections")
+    position = models.BigIntegerField(default=0)
 
     class Meta:
         db_table = "photo_collections"
         constraints = [
             models.UniqueConstraint(fields=["photo", "collection"], name="unique_photo_collection")
         ]
+        indexes = [
+            models.Index(fields=["collection", "position"], name="photo_collections_order_idx"),
+        ]
 
     def __str__(self):
         return f"{self.photo} in {self.collection}"
@@ -69,3 +102,41 @@ class CollectionFollower(models.Model):
 
     def __str__(self):
         return f"{self.user.username} follows {self.collection.name}"
+
+
+class CollectionEngagementBucket(models.Model):
+    """Net likes and follows a collection got in one hour (see collection.engagement)."""
+    id = models.BigAutoField(primary_key=True)
+    collection = models.ForeignKey(Collection, on_delete=models.CASCADE, related_name="engagement_buckets")
+    hour = models.DateTimeField()
+    likes = models.IntegerField(default=0)
+    follows = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = "collection_engagement_buckets"
+        constraints = [
+            models.UniqueConstraint(fields=["collection", "hour"], name="collection_engagement_hour_uniq")
+        ]
+        indexes = [
+            models.Index(fields=["hour"], name="collection_engagement_hour_idx"),
+        ]
+
+
+class CollectionEngagement(models.Model):
+    """
+    Sliding 7- and 30-day sums of a collection's engagement buckets, covering
+    the hours after ``rolled_to`` minus the window.
+    """
+    collection = models.OneToOneField(Collection, on_delete=models.CASCADE, primary_key=True,
+                                      related_name="engagement")
+    likes_7d = models.IntegerField(default=0)
+    follows_7d = models.IntegerField(default=0)
+    likes_30d = models.IntegerField(default=0)
+    follows_30d = models.IntegerField(default=0)
+    rolled_to = models.DateTimeField()
+
+    class Meta:
+        db_table = "collection_engagement"
+        indexes = [
+            models.Index(fields=["-likes_7d", "-follows_7d"], name="collection_trending_idx"),
+        ]
@@ -0,0 +1,142 @@
+"""
+Photo order within collections.
+
+``PhotoCollection.position`` is a sparse sort key: photos are appended
+POSITION_GAP apart, and a moved photo takes a position between its new
+neighbours, so moving one photo rewrites one row. A batch of moves is
+applied in memory to the collection's order and written with a single
+bulk UPDATE of the moved rows. When a gap runs out, the collection is
+renumbered in the same statement; renumber_collection_positions spreads out
+crowded collections ahead of time.
+
+Pages are keyset ranges on the (collection, position) index.
+"""
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Collection, PhotoCollection
+
+GAP = PhotoCollection.POSITION_GAP
+
+RENUMBER_SQL = """
+UPDATE {edges} e SET {position} = r.rn * %(gap)s
+FROM (
+    SELECT {pk}, ROW_NUMBER() OVER (PARTITION BY {collection} ORDER BY {position}, {pk}) AS rn
+    FROM {edges} WHERE {collection} = ANY(%(ids)s)
+) r
+WHERE e.{pk} = r.{pk} AND e.{position} <> r.rn * %(gap)s
+"""
+
+CROWDED_SQL = """
+SELECT DISTINCT {collection} FROM (
+    SELECT {collection},
+           {position} - LAG({position}) OVER (PARTITION BY {collection} ORDER BY {position}, {pk}) AS gap
+    FROM {edges}
+) g
+WHERE gap < %(min_gap)s
+"""
+
+
+def _names():
+    qn = connection.ops.quote_name
+    meta = PhotoCollection._meta
+    return {
+        "edges": qn(meta.db_table),
+        "pk": qn(meta.pk.column),
+        "collection": qn(meta.get_field("collection").column),
+        "position": qn(meta.get_field("position").column),
+    }
+
+
+def _spread(order, positions, moved):
+    """
+    New positions for the moved photos in ``order``, spaced evenly between
+    the unmoved photos around them. Returns None if a gap is too small.
+    """
+    result, run, lower = {}, [], None
+    for photo_id in order + [None]:
+        if photo_id is not None and photo_id in moved:
+            run.append(photo_id)
+            continue
+        upper = positions[photo_id] if photo_id is not None else None
+        if run:
+            if lower is None and upper is None:
+                slots = [GAP * k for k in range(1, len(run) + 1)]
+            elif lower is None:
+                slots = [upper - GAP * k for k in range(len(run), 0, -1)]
+            elif upper is None:
+                slots = [lower + GAP * k for k in range(1, len(run) + 1)]
+            else:
+                step = (upper - lower) // (len(run) + 1)
+                if step < 1:
+                    return None
+                slots = [lower + step * k for k in range(1, len(run) + 1)]
+            result.update(zip(run, slots))
+            run = []
+        lower = upper
+    return result
+
+
+def reorder(collection, moves):
+    """
+    Apply ``moves``, a list of ``(photo_id, after_photo_id)`` pairs in order;
+    ``after_photo_id`` None moves the photo to the front. Raises ValueError
+    if a photo is not in the collection. Returns the number of rows written.
+    """
+    with transaction.atomic():
+        list(Collection.objects.select_for_update().filter(pk=collection.pk).values_list('pk'))
+        rows = PhotoCollection.objects.filter(collection=collection).order_by('position', 'id')
+        row_ids, positions, order = {}, {}, []
+        for row_id, photo_id, position in rows.values_list('id', 'photo_id', 'position'):
+            row_ids[photo_id] = row_id
+            positions[photo_id] = position
+            order.append(photo_id)
+
+        for photo_id, after in moves:
+            if photo_id not in positions or (after is not None and after not in positions):
+                raise ValueError("Photo is not in this collection")
+            if photo_id == after:
+                raise ValueError("A photo cannot be moved after itself")
+            order.remove(photo_id)
+            order.insert(0 if after is None else order.index(after) + 1, photo_id)
+
+        updates = _spread(order, positions, {photo_id for photo_id, _ in moves})
+        if updates is None:
+            # Out of room between two neighbours: renumber the collection.
+            updates = {photo_id: GAP * k for k, photo_id in enumerate(order, start=1)}
+
+        changed = [
+            PhotoCollection(id=row_ids[photo_id], position=position)
+            for photo_id, position in updates.items() if positions[photo_id] != position
+        ]
+        PhotoCollection.objects.bulk_update(changed, ['position'])
+        if changed:
+            Collection.objects.filter(pk=collection.pk).update(cover_dirty_at=timezone.now())
+    return len(changed)
+
+
+def photo_page(collection, limit, after=None):
+    """
+    Return ``(photos, next_cursor)``: the next ``limit`` photos in order
+    after the position ``after`` (the previous page's cursor).
+    """
+    rows = PhotoCollection.objects.select_related('photo__user').filter(collection=collection)
+    if after is not None:
+        rows = rows.filter(position__gt=after)
+    rows = list(rows.order_by('position')[:limit + 1])
+    next_cursor = rows[limit - 1].position if len(rows) > limit else None
+    return [row.photo for row in rows[:limit]], next_cursor
+
+
+def renumber_positions(collection_ids):
+    """Respace the collections' photos POSITION_GAP apart. Returns the rows rewritten."""
+    with connection.cursor() as cursor:
+        cursor.execute(RENUMBER_SQL.format(**_names()), {"gap": GAP, "ids": list(collection_ids)})
+        return cursor.rowcount
+
+
+def crowded_collections(min_gap):
+    """IDs of collections where two neighbouring photos are less than ``min_gap`` apart."""
+    with connection.cursor() as cursor:
+        cursor.execute(CROWDED_SQL.format(**_names()), {"min_gap": min_gap})
+        return [row[0] for row in cursor.fetchall()]
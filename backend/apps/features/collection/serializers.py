@@ -7,14 +7,31 @@ class CollectionSerializer(serializers.ModelSerializer):
     likes_count = serializers.IntegerField(read_only=True)
     followers_count = serializers.IntegerField(read_only=True)
     photo_count = serializers.SerializerMethodField()
+    cover_url = serializers.SerializerMethodField()
+    cover_photo_ids = serializers.ListField(read_only=True)
 
     class Meta:
         model = Collection
         fields = ['id', 'name', 'slug', 'description', 'is_public', 'created_at', 
-                 'user', 'likes_count', 'followers_count', 'photo_count']
+                 'user', 'likes_count', 'followers_count', 'photo_count',
+                 'cover_url', 'cover_photo_ids']
 
     def get_photo_count(self, obj):
-        return obj.photo_collections.count()
+        # A live_photos_count annotation (see with_live_photo_counts) wins
+        # over the maintained counter.
+        live = getattr(obj, 'live_photos_count', None)
+        return live if live is not None else obj.photos_count
+
+    def get_cover_url(self, obj):
+        return obj.cover_image.url if obj.cover_image else None
+
+    def update(self, instance, validated_data):
+        # Write only the fields sent: counters and covers are maintained by
+        # UPDATEs elsewhere, and this instance may hold stale values for them.
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
+        instance.save(update_fields=list(validated_data))
+        return instance
 
     def validate_name(self, value):
         if len(value) < 3:
@@ -31,7 +48,7 @@ class PhotoCollectionSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = PhotoCollection
-        fields = ['id', 'photo', 'collection']
+        fields = ['id', 'photo', 'collection', 'position']
 
 class CollectionLikeSerializer(serializers.ModelSerializer):
     class Meta:
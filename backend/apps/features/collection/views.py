@@ -5,20 +5,39 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.exceptions import ValidationError, PermissionDenied
 from django.core.cache import cache
 from django.db import transaction
-from django.db.models import Count, Q, F
-from django.shortcuts import get_object_or_404
-from django.utils import timezone
+from django.db.models import Q, F
+from django.http import StreamingHttpResponse
 from django.conf import settings
 import logging
-from datetime import timedelta
+import uuid
 
-from .models import Collection, PhotoCollection, CollectionLike, CollectionFollower
+from .archive import stream_archive
+from .engagement import featured_collections, record_engagement, trending_collections
+from .models import Collection, PhotoCollection, CollectionLike, CollectionFollower, with_live_photo_counts
+from .ordering import photo_page, reorder
 from .serializers import CollectionSerializer, PhotoCollectionSerializer
-from apps.features.photos.models import Photo
+from apps.core.cache.keys import (
+    COLLECTION_PHOTO_PAGE, COLLECTION_STATS, COLLECTIONS, FEATURED_COLLECTIONS, TRENDING_COLLECTIONS,
+    USER_COLLECTION_LIST, USER_COLLECTIONS,
+)
+from apps.features.photos.memberships import COLLECTION_PHOTOS, add_photos, parse_photo_ids, remove_photos
+from apps.features.photos.serializers import PhotoSerializer
 from apps.core.users.models import User
+from apps.features.likes.services import COLLECTION_LIKES, toggle_like
 
 logger = logging.getLogger(__name__)
 
+
+def _photo_ids(request):
+    """The request's ``photo_ids`` as UUIDs; raises ValidationError."""
+    photo_ids = request.data.get('photo_ids', [])
+    if not photo_ids:
+        raise ValidationError("photo_ids list is required")
+    try:
+        return parse_photo_ids(photo_ids)
+    except ValueError:
+        raise ValidationError("photo_ids must be a list of valid photo IDs")
+
 class CollectionViewSet(viewsets.ModelViewSet):
     """
     ViewSet for handling collection operations.
@@ -34,6 +53,7 @@ class CollectionViewSet(viewsets.ModelViewSet):
     """
     serializer_class = CollectionSerializer
     permission_classes = [IsAuthenticated]
+    throttle_scopes = {'toggle_like': 'likes'}
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['name', 'description']
     ordering_fields = ['created_at', 'likes_count', 'followers_count']
@@ -41,12 +61,22 @@ class CollectionViewSet(viewsets.ModelViewSet):
     
     # Configure collection settings
     MAX_PHOTOS_PER_COLLECTION = getattr(settings, 'MAX_PHOTOS_PER_COLLECTION', 1000)
+    # Count photos per row instead of reading photos_count (e.g. while backfilling).
+    LIVE_PHOTO_COUNTS = getattr(settings, 'COLLECTION_LIVE_PHOTO_COUNTS', False)
     CACHE_TIMEOUT = 300  # 5 minutes
-    TRENDING_CACHE_TIMEOUT = 3600  # 1 hour
+    PHOTOS_PER_PAGE = 30
+    MAX_PHOTOS_PER_PAGE = 100
+    # Rankings are cheap to read (see collection.engagement), so they are
+    # cached briefly instead of being invalidated on every like and follow.
+    TRENDING_CACHE_TIMEOUT = 300  # 5 minutes
+    RANKING_SIZE = 10
+
+    def _with_photo_counts(self, queryset):
+        return with_live_photo_counts(queryset) if self.LIVE_PHOTO_COUNTS else queryset
 
     def get_queryset(self):
         """Get collections queryset with optimized loading."""
-        base_qs = Collection.objects.select_related('user')
+        base_qs = self._with_photo_counts(Collection.objects.select_related('user'))
         
         if self.action in ['list', 'retrieve']:
             # For public views, only show public collections
@@ -76,14 +106,14 @@ class CollectionViewSet(viewsets.ModelViewSet):
                 )
             
             # Check cache first
-            cache_key = f"user_collections_{user.id}"
+            cache_key = USER_COLLECTION_LIST.key(user_id=user.id)
             cached_collections = cache.get(cache_key)
             if cached_collections:
                 logger.debug(f"Returning cached collections for user: {username}")
                 return Response(cached_collections)
 
             # Get collections - show all collections for the user
-            collections = Collection.objects.filter(user=user).select_related('user')
+            collections = self._with_photo_counts(Collection.objects.filter(user=user).select_related('user'))
 
             # Serialize collections
             serializer = self.get_serializer(collections, many=True)
@@ -128,12 +158,8 @@ class CollectionViewSet(viewsets.ModelViewSet):
             response = super().create(request, *args, **kwargs)
             
             # Clear relevant caches
-            cache_keys = [
-                f"user_collections_{request.user.id}",
-                "featured_collections",
-                "trending_collections"
-            ]
-            cache.delete_many(cache_keys)
+            USER_COLLECTIONS.bump(request.user.id)
+            COLLECTIONS.bump()
 
             return response
 
@@ -160,13 +186,9 @@ class CollectionViewSet(viewsets.ModelViewSet):
             response = super().update(request, *args, **kwargs)
 
             # Clear relevant caches
-            cache_keys = [
-                f"collection_{collection.id}",
-                f"user_collections_{request.user.id}",
-                "featured_collections",
-                "trending_collections"
-            ]
-            cache.delete_many(cache_keys)
+            COLLECTIONS.bump(collection.id)
+            USER_COLLECTIONS.bump(collection.user_id)
+            COLLECTIONS.bump()
 
             return response
 
@@ -196,13 +218,9 @@ class CollectionViewSet(viewsets.ModelViewSet):
             collection.delete()
 
             # Clear relevant caches
-            cache_keys = [
-                f"collection_{collection_id}",
-                f"user_collections_{user_id}",
-                "featured_collections",
-                "trending_collections"
-            ]
-            cache.delete_many(cache_keys)
+            COLLECTIONS.bump(collection_id)
+            USER_COLLECTIONS.bump(user_id)
+            COLLECTIONS.bump()
 
             return Response(status=status.HTTP_204_NO_CONTENT)
 
@@ -225,34 +243,20 @@ class CollectionViewSet(viewsets.ModelViewSet):
             if collection.user != request.user:
                 raise PermissionDenied("You can only add photos to your own collections")
 
-            photo_ids = request.data.get('photo_ids', [])
-            if not photo_ids:
-                raise ValidationError("photo_ids list is required")
+            photo_ids = _photo_ids(request)
 
             # Check collection size limit
             current_size = PhotoCollection.objects.filter(collection=collection).count()
             if current_size + len(photo_ids) > self.MAX_PHOTOS_PER_COLLECTION:
                 raise ValidationError(f"Collection cannot exceed {self.MAX_PHOTOS_PER_COLLECTION} photos")
 
-            # Add photos
-            added_photos = []
-            with transaction.atomic():
-                for photo_id in photo_ids:
-                    photo = get_object_or_404(Photo, id=photo_id)
-                    photo_collection, created = PhotoCollection.objects.get_or_create(
-                        photo=photo,
-                        collection=collection
-                    )
-                    if created:
-                        added_photos.append(photo_id)
+            added_photos, missing = add_photos(COLLECTION_PHOTOS, collection, photo_ids)
+            if missing:
+                raise ValidationError(f"Photos not found: {', '.join(map(str, missing))}")
 
             # Clear relevant caches
-            cache_keys = [
-                f"collection_photos_{collection.id}",
-                f"collection_{collection.id}",
-                f"photo_collections_{','.join(map(str, photo_ids))}"
-            ]
-            cache.delete_many(cache_keys)
+            COLLECTIONS.bump(collection.id)
+            USER_COLLECTIONS.bump(collection.user_id)
 
             return Response({
                 "message": "Photos added successfully",
@@ -280,27 +284,17 @@ class CollectionViewSet(viewsets.ModelViewSet):
             if collection.user != request.user:
                 raise PermissionDenied("You can only remove photos from your own collections")
 
-            photo_ids = request.data.get('photo_ids', [])
-            if not photo_ids:
-                raise ValidationError("photo_ids list is required")
-
-            # Remove photos
-            removed = PhotoCollection.objects.filter(
-                collection=collection,
-                photo_id__in=photo_ids
-            ).delete()[0]
+            photo_ids = _photo_ids(request)
+            removed_photos = remove_photos(COLLECTION_PHOTOS, collection, photo_ids)
 
             # Clear relevant caches
-            cache_keys = [
-                f"collection_photos_{collection.id}",
-                f"collection_{collection.id}",
-                f"photo_collections_{','.join(map(str, photo_ids))}"
-            ]
-            cache.delete_many(cache_keys)
+            COLLECTIONS.bump(collection.id)
+            USER_COLLECTIONS.bump(collection.user_id)
 
             return Response({
                 "message": "Photos removed successfully",
-                "removed_count": removed
+                "removed_photos": removed_photos,
+                "removed_count": len(removed_photos)
             })
 
         except ValidationError as e:
@@ -318,34 +312,20 @@ class CollectionViewSet(viewsets.ModelViewSet):
     def toggle_like(self, request, pk=None):
         """Toggle like status for a collection."""
         try:
-            collection = self.get_object()
-            
             with transaction.atomic():
-                like, created = CollectionLike.objects.get_or_create(
-                    user=request.user,
-                    collection=collection
-                )
-                
-                if not created:
-                    # User already likes, so unlike
-                    like.delete()
-                    collection.likes_count = F('likes_count') - 1
-                else:
-                    collection.likes_count = F('likes_count') + 1
-                
-                collection.save()
+                result = toggle_like(COLLECTION_LIKES, request.user.id, pk)
+                if result is None:
+                    return Response({"error": "Collection not found"}, status=status.HTTP_404_NOT_FOUND)
+                liked, likes_count, liked_at = result
+                record_engagement(pk, liked_at, likes=1 if liked else -1)
 
             # Clear relevant caches
-            cache_keys = [
-                f"collection_{collection.id}",
-                f"user_liked_collections_{request.user.id}",
-                "trending_collections"
-            ]
-            cache.delete_many(cache_keys)
+            COLLECTIONS.bump(pk)
 
             return Response({
-                "message": f"Collection {'liked' if created else 'unliked'} successfully",
-                "likes_count": Collection.objects.get(id=collection.id).likes_count
+                "message": f"Collection {'liked' if liked else 'unliked'} successfully",
+                "liked": liked,
+                "likes_count": likes_count
             })
 
         except Exception as e:
@@ -370,19 +350,17 @@ class CollectionViewSet(viewsets.ModelViewSet):
                 if not created:
                     # User already follows, so unfollow
                     follow.delete()
-                    collection.followers_count = F('followers_count') - 1
-                else:
-                    collection.followers_count = F('followers_count') + 1
-                
-                collection.save()
+
+                # Only the counter is written: saving the instance would put
+                # back the photos_count and cover it was loaded with.
+                Collection.objects.filter(id=collection.id).update(
+                    followers_count=F('followers_count') + (1 if created else -1)
+                )
+                record_engagement(collection.id, follow.followed_at, follows=1 if created else -1)
 
             # Clear relevant caches
-            cache_keys = [
-                f"collection_{collection.id}",
-                f"user_followed_collections_{request.user.id}",
-                "trending_collections"
-            ]
-            cache.delete_many(cache_keys)
+            COLLECTIONS.bump(collection.id)
+            USER_COLLECTIONS.bump(collection.user_id)
 
             return Response({
                 "message": f"Collection {'followed' if created else 'unfollowed'} successfully",
@@ -400,20 +378,16 @@ class CollectionViewSet(viewsets.ModelViewSet):
     def featured(self, request):
         """Get featured collections."""
         try:
-            cache_key = "featured_collections"
+            cache_key = FEATURED_COLLECTIONS.key()
             cached_collections = cache.get(cache_key)
 
             if cached_collections:
                 return Response(cached_collections)
 
-            # Get collections with most likes and followers in the last 30 days
-            thirty_days_ago = timezone.now() - timedelta(days=30)
-            collections = Collection.objects.filter(
-                is_public=True,
-                created_at__gte=thirty_days_ago
-            ).annotate(
-                engagement_score=Count('likes') + Count('followers')
-            ).order_by('-engagement_score')[:10]
+            # New collections with the most likes and followers in the last 30 days
+            collections = featured_collections(
+                self._with_photo_counts(Collection.objects.select_related('user')), self.RANKING_SIZE
+            )
 
             serializer = self.get_serializer(collections, many=True)
             cache.set(cache_key, serializer.data, timeout=self.TRENDING_CACHE_TIMEOUT)
@@ -431,20 +405,16 @@ class CollectionViewSet(viewsets.ModelViewSet):
     def trending(self, request):
         """Get trending collections based on recent activity."""
         try:
-            cache_key = "trending_collections"
+            cache_key = TRENDING_COLLECTIONS.key()
             cached_collections = cache.get(cache_key)
 
             if cached_collections:
                 return Response(cached_collections)
 
             # Get collections with most recent likes and follows
-            seven_days_ago = timezone.now() - timedelta(days=7)
-            collections = Collection.objects.filter(
-                is_public=True
-            ).annotate(
-                recent_likes=Count('likes', filter=Q(likes__liked_at__gte=seven_days_ago)),
-                recent_follows=Count('followers', filter=Q(followers__followed_at__gte=seven_days_ago))
-            ).order_by('-recent_likes', '-recent_follows')[:10]
+            collections = trending_collections(
+                self._with_photo_counts(Collection.objects.select_related('user')), self.RANKING_SIZE
+            )
 
             serializer = self.get_serializer(collections, many=True)
             cache.set(cache_key, serializer.data, timeout=self.TRENDING_CACHE_TIMEOUT)
@@ -463,14 +433,14 @@ class CollectionViewSet(viewsets.ModelViewSet):
         """Get statistics for a collection."""
         try:
             collection = self.get_object()
-            cache_key = f"collection_stats_{collection.id}"
+            cache_key = COLLECTION_STATS.key(collection_id=collection.id)
             cached_stats = cache.get(cache_key)
 
             if cached_stats:
                 return Response(cached_stats)
 
             stats = {
-                "total_photos": PhotoCollection.objects.filter(collection=collection).count(),
+                "total_photos": getattr(collection, "live_photos_count", collection.photos_count),
                 "likes_count": collection.likes_count,
                 "followers_count": collection.followers_count,
                 "recent_likes": CollectionLike.objects.filter(
@@ -497,8 +467,162 @@ class CollectionViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @action(detail=True, methods=['get'])
+    def photos(self, request, pk=None):
+        """
+        Photos of a collection in order, paged by position.
+        Accepts limit and cursor (the previous page's next_cursor).
+        """
+        collection = self.get_object()
+        try:
+            if not (collection.is_public or collection.user == request.user or request.user.is_staff):
+                raise PermissionDenied("This collection is private")
+
+            try:
+                limit = min(int(request.query_params.get('limit', self.PHOTOS_PER_PAGE)), self.MAX_PHOTOS_PER_PAGE)
+                cursor = request.query_params.get('cursor')
+                cursor = int(cursor) if cursor else None
+            except ValueError:
+                raise ValidationError("limit and cursor must be integers")
+            if limit < 1:
+                raise ValidationError("limit must be positive")
+
+            # Only the first page of the default size is cached.
+            cacheable = cursor is None and limit == self.PHOTOS_PER_PAGE
+            if cacheable:
+                cache_key = COLLECTION_PHOTO_PAGE.key(collection_id=collection.id)
+                cached_page = cache.get(cache_key)
+                if cached_page:
+                    return Response(cached_page)
+
+            photos, next_cursor = photo_page(collection, limit, after=cursor)
+            data = {
+                "results": PhotoSerializer(photos, many=True).data,
+                "next_cursor": next_cursor
+            }
+            if cacheable:
+                cache.set(cache_key, data, timeout=self.CACHE_TIMEOUT)
+            return Response(data)
+
+        except ValidationError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except PermissionDenied as e:
+            return Response({"error": str(e)}, status=status.HTTP_403_FORBIDDEN)
+        except Exception as e:
+            logger.error(f"Failed to fetch collection photos: {str(e)}")
+            return Response(
+                {"error": "Failed to fetch collection photos"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+    @action(detail=True, methods=['post'])
+    def reorder(self, request, pk=None):
+        """
+        Move photos within a collection. Expects moves: a list of
+        {"photo_id": ..., "after": <photo_id or null for the front>},
+        applied in order and written in one statement.
+        """
+        collection = self.get_object()
+        try:
+            if collection.user != request.user:
+                raise PermissionDenied("You can only reorder your own collections")
+
+            moves = request.data.get('moves')
+            if not moves or not isinstance(moves, list):
+                raise ValidationError("moves list is required")
+            if len(moves) > self.MAX_PHOTOS_PER_COLLECTION:
+                raise ValidationError(f"Cannot apply more than {self.MAX_PHOTOS_PER_COLLECTION} moves at once")
+            try:
+                moves = [
+                    (uuid.UUID(str(move['photo_id'])), uuid.UUID(str(move['after'])) if move.get('after') else None)
+                    for move in moves
+                ]
+            except (KeyError, TypeError, ValueError):
+                raise ValidationError("Each move needs a valid photo_id and an optional after photo ID")
+
+            try:
+                updated = reorder(collection, moves)
+            except ValueError as e:
+                raise ValidationError(str(e))
+
+            COLLECTIONS.bump(collection.id)
+            return Response({"message": "Collection reordered", "updated": updated})
+
+        except ValidationError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except PermissionDenied as e:
+            return Response({"error": str(e)}, status=status.HTTP_403_FORBIDDEN)
+        except Exception as e:
+            logger.error(f"Failed to reorder collection: {str(e)}")
+            return Response(
+                {"error": "Failed to reorder collection"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+    @action(detail=True, methods=['get'])
+    def archive(self, request, pk=None):
+        """
+        Stream the collection's downloadable photos as a ZIP file.
+        Counts against the download quotas like individual downloads.
+        """
+        from apps.features.downloads.services import (
+            consume_download_quota, record_bulk_download, refund_download_quota,
+        )
+
+        collection = self.get_object()
+        try:
+            if not (collection.is_public or collection.user == request.user or request.user.is_staff):
+                raise PermissionDenied("This collection is private")
+
+            photos = [
+                row.photo for row in PhotoCollection.objects.select_related('photo').filter(
+                    collection=collection,
+                    photo__is_downloadable=True
+                ).order_by('position')
+            ]
+            if not photos:
+                raise ValidationError("This collection has no downloadable photos")
+
+            quota_error = consume_download_quota(request.user.id, len(photos))
+            if quota_error:
+                raise PermissionDenied(quota_error)
+
+            user_id = request.user.id
+
+            def on_complete(written):
+                # One bulk write for the whole archive; photos that were
+                # skipped or never sent do not count against the quota.
+                record_bulk_download(user_id, [photo.id for photo in written])
+                if len(written) < len(photos):
+                    refund_download_quota(user_id, len(photos) - len(written))
+
+            response = StreamingHttpResponse(
+                stream_archive(photos, on_complete=on_complete),
+                content_type="application/zip"
+            )
+            filename = f"{collection.slug or collection.id}.zip"
+            response["Content-Disposition"] = f'attachment; filename="{filename}"'
+            return response
+
+        except ValidationError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except PermissionDenied as e:
+            return Response({"error": str(e)}, status=status.HTTP_403_FORBIDDEN)
+        except Exception as e:
+            logger.error(f"Failed to build collection archive: {str(e)}")
+            return Response(
+                {"error": "Failed to build collection archive"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
 class PhotoCollectionViewSet(viewsets.ModelViewSet):
     """Handles CRUD operations for Photos in Collections"""
     queryset = PhotoCollection.objects.all()
     serializer_class = PhotoCollectionSerializer
     permission_classes = [IsAuthenticated]
+
+    def perform_destroy(self, instance):
+        # Keeps the collection's photos_count in step.
+        remove_photos(COLLECTION_PHOTOS, instance.collection, [instance.photo_id])
+        COLLECTIONS.bump(instance.collection_id)
+        USER_COLLECTIONS.bump(instance.collection.user_id)
@@ -1,9 +1,16 @@
 from django.contrib import admin
-from .models import Comment
+from .models import Comment, CommentReport
 
 @admin.register(Comment)
 class CommentAdmin(admin.ModelAdmin):
-    list_display = ("user", "photo", "comment_text", "created_at")
-    list_filter = ("created_at",)
+    list_display = ("user", "photo", "comment_text", "is_hidden", "created_at")
+    list_filter = ("is_hidden", "created_at")
     search_fields = ("user__username", "photo__title", "comment_text")
     ordering = ("-created_at",)
+
+
+@admin.register(CommentReport)
+class CommentReportAdmin(admin.ModelAdmin):
+    list_display = ("comment", "report_count", "priority", "status", "last_reported_at")
+    list_filter = ("status",)
+    ordering = ("-priority",)
@@ -1,5 +1,11 @@
 import uuid
 from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+PATH_SEPARATOR = "."
+MAX_THREAD_DEPTH = 10
+
 
 class Comment(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -7,10 +13,87 @@ class Comment(models.Model):
     photo = models.ForeignKey("photos.Photo", on_delete=models.CASCADE, related_name="photo_comments")
     comment_text = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    # Threading: top-level comments have no parent and no thread; every reply
+    # points at its parent and at the top-level comment of its thread.
+    parent = models.ForeignKey("self", on_delete=models.CASCADE, null=True, blank=True, related_name="replies")
+    thread = models.ForeignKey("self", on_delete=models.CASCADE, null=True, blank=True, related_name="thread_replies")
+    # Materialized path of sortable keys, e.g. "<root>.<reply>.<reply>";
+    # ordering a thread by path lists it depth-first, oldest reply first.
+    # Byte-order collation: locale collations skip punctuation when sorting.
+    path = models.CharField(max_length=255, blank=True, default="", db_collation="C")
+    # Replies at any depth, kept on the top-level comment.
+    reply_count = models.IntegerField(default=0)
+    is_hidden = models.BooleanField(default=False)
 
     class Meta:
         db_table = "comments"
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(
+                fields=["photo", "-created_at"],
+                condition=Q(parent__isnull=True),
+                name="comments_photo_threads_idx",
+            ),
+            models.Index(fields=["thread", "path"], name="comments_thread_path_idx"),
+            models.Index(fields=["-created_at"], condition=Q(is_hidden=False), name="comments_recent_idx"),
+            # Hidden comments are few; stats subtract them from comments_count.
+            models.Index(fields=["photo"], condition=Q(is_hidden=True), name="comments_hidden_photo_idx"),
+        ]
 
     def __str__(self):
-        return f"Comment by {self.user} on {self.photo}"
\ No newline at end of file
+        return f"Comment by {self.user} on {self.photo}"
+
+    @property
+    def depth(self):
+        return self.path.count(PATH_SEPARATOR)
+
+    def save(self, *args, **kwargs):
+        """Assign the materialized path on first save."""
+        if not self.path:
+            key = f"{int(timezone.now().timestamp() * 1000000):014x}{self.id.hex[:6]}"
+            self.path = f"{self.parent.path}{PATH_SEPARATOR}{key}" if self.parent_id else key
+        super().save(*args, **kwargs)
+
+
+class CommentReport(models.Model):
+    """One moderation queue entry per reported comment."""
+    STATUS_OPEN = "open"
+    STATUS_HIDDEN = "hidden"
+    STATUS_DISMISSED = "dismissed"
+    STATUS_CHOICES = [
+        (STATUS_OPEN, "Open"),
+        (STATUS_HIDDEN, "Hidden"),
+        (STATUS_DISMISSED, "Dismissed"),
+    ]
+
+    comment = models.OneToOneField(Comment, on_delete=models.CASCADE, primary_key=True, related_name="report")
+    report_count = models.IntegerField(default=0)
+    # Log of the time-decayed report rate; see moderation.py. Higher means
+    # more reports more recently, comparable across rows without rescoring.
+    priority = models.FloatField(default=0)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_OPEN)
+    last_reason = models.CharField(max_length=255, blank=True, default="")
+    first_reported_at = models.DateTimeField()
+    last_reported_at = models.DateTimeField()
+
+    class Meta:
+        db_table = "comment_reports"
+        indexes = [
+            models.Index(fields=["status", "-priority"], name="comment_reports_queue_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.report_count} reports on {self.comment_id}"
+
+
+class CommentReporter(models.Model):
+    """A user's report of a comment; unique so repeat reports are not counted."""
+    id = models.BigAutoField(primary_key=True)
+    comment = models.ForeignKey(Comment, on_delete=models.CASCADE, related_name="reporters")
+    reporter = models.ForeignKey("users.User", on_delete=models.CASCADE, related_name="comment_reports")
+    reason = models.CharField(max_length=255)
+    reported_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "comment_reporters"
+        unique_together = ("comment", "reporter")
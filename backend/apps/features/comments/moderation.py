@@ -0,0 +1,203 @@
+"""
+Comment reports and bulk moderation.
+
+Filing a report is one statement: the reporter row is inserted with
+ON CONFLICT DO NOTHING, and only a new reporter bumps the comment's queue
+entry. The queue is ordered by a time-decayed report rate stored in log
+form, ``priority = ln(sum(exp(t_i / tau)))`` over report times ``t_i``, so
+each report adds to it with a log-add-exp in SQL and rows never need to be
+rescored as time passes: later and denser reports always rank higher.
+
+Moderator actions take a list of comment IDs and run as single set-based
+statements, followed by one cache invalidation sweep.
+"""
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+import math
+
+from .models import PATH_SEPARATOR, Comment, CommentReport, CommentReporter
+from .recent import reset_recent_comments
+from apps.core.cache.keys import PHOTO_COMMENTS, USER_COMMENTS
+from apps.core.users.models import User
+from apps.features.photos.models import Photo
+
+# Reports lose half their weight in the queue after this many seconds.
+PRIORITY_HALF_LIFE = getattr(settings, 'REPORT_PRIORITY_HALF_LIFE', 3600)
+_TAU = PRIORITY_HALF_LIFE / math.log(2)
+
+REPORT_SQL = """
+WITH vote AS (
+    INSERT INTO {reporters} ({r_comment}, {r_reporter}, {r_reason}, {r_at})
+    VALUES (%(comment_id)s, %(reporter_id)s, %(reason)s, %(now)s)
+    ON CONFLICT ({r_comment}, {r_reporter}) DO NOTHING
+    RETURNING 1
+)
+INSERT INTO {reports} AS r ({q_comment}, {q_count}, {q_priority}, {q_status}, {q_reason}, {q_first}, {q_last})
+SELECT %(comment_id)s, 1, %(weight)s, %(open)s, %(reason)s, %(now)s, %(now)s FROM vote
+ON CONFLICT ({q_comment}) DO UPDATE SET
+    {q_count} = r.{q_count} + 1,
+    {q_priority} = GREATEST(r.{q_priority}, EXCLUDED.{q_priority})
+        + LN(1 + EXP(-ABS(r.{q_priority} - EXCLUDED.{q_priority}))),
+    {q_status} = CASE WHEN r.{q_status} = %(dismissed)s THEN %(open)s ELSE r.{q_status} END,
+    {q_reason} = EXCLUDED.{q_reason},
+    {q_last} = EXCLUDED.{q_last}
+RETURNING {q_count}
+"""
+
+DELETE_SQL = """
+WITH targets AS (
+    SELECT {pk}, {thread}, {path} FROM {comments} WHERE {pk} = ANY(%(ids)s)
+), doomed AS (
+    DELETE FROM {comments} c
+    WHERE c.{pk} IN (SELECT {pk} FROM targets)
+       OR c.{thread} IN (SELECT {pk} FROM targets WHERE {thread} IS NULL)
+       OR EXISTS (
+           SELECT 1 FROM targets t
+           WHERE t.{thread} IS NOT NULL AND c.{thread} = t.{thread}
+             AND c.{path} > t.{path} || %(sep)s AND c.{path} < t.{path} || %(sep_next)s
+       )
+    RETURNING c.{pk}, c.{photo}, c.{thread}, c.{user}
+), reports AS (
+    DELETE FROM {reports} WHERE {q_comment} IN (SELECT {pk} FROM doomed)
+), reporters AS (
+    DELETE FROM {reporters} WHERE {r_comment} IN (SELECT {pk} FROM doomed)
+), photo_counts AS (
+    UPDATE {photos} p SET {comments_count} = p.{comments_count} - d.n
+    FROM (SELECT {photo}, COUNT(*) AS n FROM doomed GROUP BY {photo}) d
+    WHERE p.{photo_pk} = d.{photo}
+), thread_counts AS (
+    UPDATE {comments} c SET {reply_count} = c.{reply_count} - d.n
+    FROM (
+        SELECT {thread}, COUNT(*) AS n FROM doomed
+        WHERE {thread} IS NOT NULL AND {thread} NOT IN (SELECT {pk} FROM doomed)
+        GROUP BY {thread}
+    ) d
+    WHERE c.{pk} = d.{thread}
+)
+SELECT DISTINCT {photo}, {user} FROM doomed
+"""
+
+
+def _names():
+    qn = connection.ops.quote_name
+    comment, reports, reporters = Comment._meta, CommentReport._meta, CommentReporter._meta
+    return {
+        "comments": qn(comment.db_table),
+        "pk": qn(comment.pk.column),
+        "thread": qn(comment.get_field("thread").column),
+        "path": qn(comment.get_field("path").column),
+        "photo": qn(comment.get_field("photo").column),
+        "user": qn(comment.get_field("user").column),
+        "reply_count": qn(comment.get_field("reply_count").column),
+        "photos": qn(Photo._meta.db_table),
+        "photo_pk": qn(Photo._meta.pk.column),
+        "comments_count": qn(Photo._meta.get_field("comments_count").column),
+        "reports": qn(reports.db_table),
+        "q_comment": qn(reports.get_field("comment").column),
+        "q_count": qn(reports.get_field("report_count").column),
+        "q_priority": qn(reports.get_field("priority").column),
+        "q_status": qn(reports.get_field("status").column),
+        "q_reason": qn(reports.get_field("last_reason").column),
+        "q_first": qn(reports.get_field("first_reported_at").column),
+        "q_last": qn(reports.get_field("last_reported_at").column),
+        "reporters": qn(reporters.db_table),
+        "r_comment": qn(reporters.get_field("comment").column),
+        "r_reporter": qn(reporters.get_field("reporter").column),
+        "r_reason": qn(reporters.get_field("reason").column),
+        "r_at": qn(reporters.get_field("reported_at").column),
+    }
+
+
+def report_comment(comment_id, reporter_id, reason):
+    """
+    File a report. Returns the comment's report count, or None if this
+    reporter had already reported it (the count is then unchanged).
+    """
+    now = timezone.now()
+    params = {
+        "comment_id": comment_id,
+        "reporter_id": reporter_id,
+        "reason": reason[:255],
+        "now": now,
+        "weight": now.timestamp() / _TAU,
+        "open": CommentReport.STATUS_OPEN,
+        "dismissed": CommentReport.STATUS_DISMISSED,
+    }
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(REPORT_SQL.format(**_names()), params)
+            row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def moderation_queue(status=CommentReport.STATUS_OPEN, limit=50):
+    """Queue entries in priority order, with their comment and author."""
+    return CommentReport.objects.select_related('comment', 'comment__user').filter(
+        status=status
+    ).order_by('-priority')[:limit]
+
+
+def _authors_and_photos(comment_ids):
+    rows = Comment.objects.filter(id__in=comment_ids).values_list('photo_id', 'user_id')
+    return {photo_id for photo_id, _ in rows}, {user_id for _, user_id in rows}
+
+
+def hide_comments(comment_ids):
+    """Hide comments and close their reports. Returns (photo_ids, user_ids) touched."""
+    with transaction.atomic():
+        Comment.objects.filter(id__in=comment_ids).update(is_hidden=True)
+        CommentReport.objects.filter(comment_id__in=comment_ids).update(status=CommentReport.STATUS_HIDDEN)
+    return _authors_and_photos(comment_ids)
+
+
+def dismiss_reports(comment_ids):
+    """Close reports without acting on the comments."""
+    CommentReport.objects.filter(comment_id__in=comment_ids).update(status=CommentReport.STATUS_DISMISSED)
+    return set(), set()
+
+
+def delete_comments(comment_ids):
+    """
+    Delete comments with all their replies, their reports, and the matching
+    comments_count/reply_count decrements, in one statement.
+    """
+    params = {
+        "ids": list(comment_ids),
+        "sep": PATH_SEPARATOR,
+        "sep_next": chr(ord(PATH_SEPARATOR) + 1),
+    }
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(DELETE_SQL.format(**_names()), params)
+            rows = cursor.fetchall()
+    return {photo_id for photo_id, _ in rows}, {user_id for _, user_id in rows}
+
+
+def ban_authors(comment_ids):
+    """Deactivate the authors of the comments and hide everything they wrote."""
+    user_ids = set(Comment.objects.filter(id__in=comment_ids).values_list('user_id', flat=True))
+    with transaction.atomic():
+        User.objects.filter(id__in=user_ids, is_staff=False).update(is_active=False)
+        Comment.objects.filter(user_id__in=user_ids).update(is_hidden=True)
+        CommentReport.objects.filter(
+            Q(comment__user_id__in=user_ids) | Q(comment_id__in=comment_ids)
+        ).update(status=CommentReport.STATUS_HIDDEN)
+    photo_ids = set(Comment.objects.filter(user_id__in=user_ids).values_list('photo_id', flat=True).distinct())
+    return photo_ids, user_ids
+
+
+MODERATION_ACTIONS = {
+    "hide": hide_comments,
+    "delete": delete_comments,
+    "dismiss": dismiss_reports,
+    "ban": ban_authors,
+}
+
+
+def invalidate_comment_caches(photo_ids, user_ids):
+    """Retire the cached comments of every photo and author touched by a moderation action."""
+    PHOTO_COMMENTS.bump_each(photo_ids)
+    USER_COMMENTS.bump_each(user_ids)
+    reset_recent_comments()
@@ -0,0 +1,124 @@
+"""
+Ring buffer of the most recent comments, kept in the cache.
+
+Every new comment claims the next sequence number with ``incr`` on the head
+key and is written, already denormalized, into slot ``seq % RING_SIZE``.
+Readers fetch the newest slots with one ``get_many`` and never query the
+database unless the buffer is cold, in which case it is rebuilt from the
+(created_at) index. A slot below the head that is missing or still holds
+an older entry belongs to a writer between its ``incr`` and its write (or
+was evicted); readers skip it rather than rebuild. Edits rewrite the entry in place, deletions leave a
+tombstone, and moderation simply drops the head so the next read rebuilds.
+"""
+from django.core.cache import cache
+
+from .models import Comment
+
+RING_SIZE = 64  # Slack above the 20 shown, so tombstones rarely force a rebuild
+RING_HEAD_KEY = "recent_comments_head"
+RING_SLOT_KEY = "recent_comments_slot_{index}"
+RING_TIMEOUT = 24 * 3600
+ENTRY_FIELDS = ('id', 'user__username', 'photo__title', 'comment_text', 'created_at')
+
+
+def _slot_key(seq):
+    return RING_SLOT_KEY.format(index=seq % RING_SIZE)
+
+
+def _entry(row):
+    return {field: row[field] for field in ENTRY_FIELDS if field != 'id'}
+
+
+def rebuild_recent_comments():
+    """Refill the buffer from the newest visible comments. Returns the head sequence."""
+    rows = list(
+        Comment.objects.filter(is_hidden=False).order_by('-created_at')[:RING_SIZE].values(*ENTRY_FIELDS)
+    )
+    rows.reverse()
+    # A full buffer is numbered from RING_SIZE + 1, so that head <= RING_SIZE
+    # always means the buffer holds every visible comment.
+    start = RING_SIZE + 1 if len(rows) == RING_SIZE else 1
+    slots = {
+        _slot_key(seq): (seq, row['id'], _entry(row))
+        for seq, row in enumerate(rows, start=start)
+    }
+    head = start + len(rows) - 1
+    cache.set_many(slots, timeout=RING_TIMEOUT)
+    cache.set(RING_HEAD_KEY, head, timeout=RING_TIMEOUT)
+    return head
+
+
+def push_recent_comment(comment):
+    """Append a newly created comment."""
+    try:
+        seq = cache.incr(RING_HEAD_KEY)
+    except ValueError:
+        # Cold buffer: the rebuild picks up the committed comment itself.
+        rebuild_recent_comments()
+        return
+    entry = {
+        'user__username': comment.user.username,
+        'photo__title': comment.photo.title,
+        'comment_text': comment.comment_text,
+        'created_at': comment.created_at,
+    }
+    cache.set(_slot_key(seq), (seq, comment.id, entry), timeout=RING_TIMEOUT)
+
+
+def _rewrite(comment_id, change):
+    head = cache.get(RING_HEAD_KEY)
+    if head is None:
+        return
+    keys = [_slot_key(seq) for seq in range(max(head - RING_SIZE + 1, 1), head + 1)]
+    for key, slot in cache.get_many(keys).items():
+        if slot[1] == comment_id and slot[2] is not None:
+            cache.set(key, (slot[0], slot[1], change(slot[2])), timeout=RING_TIMEOUT)
+
+
+def update_recent_comment(comment):
+    """Rewrite an edited comment's entry, if it is still in the buffer."""
+    _rewrite(comment.id, lambda entry: {**entry, 'comment_text': comment.comment_text})
+
+
+def remove_recent_comment(comment_id):
+    """Leave a tombstone for a deleted comment."""
+    _rewrite(comment_id, lambda entry: None)
+
+
+def reset_recent_comments():
+    """Force a rebuild on the next read, e.g. after bulk moderation."""
+    cache.delete(RING_HEAD_KEY)
+
+
+def _read(head, limit):
+    """Return ``(entries, complete)``; incomplete means a rebuild could find more."""
+    seqs = list(range(head, max(head - RING_SIZE, 0), -1))
+    slots = cache.get_many([_slot_key(seq) for seq in seqs])
+
+    entries, skipped = [], False
+    for seq in seqs:
+        slot = slots.get(_slot_key(seq))
+        if slot is None or slot[0] != seq:
+            # Not written yet, evicted, or overwritten by a writer that
+            # lapped this reader: a rebuild would not help the first.
+            skipped = True
+            continue
+        if slot[2] is not None:
+            entries.append(slot[2])
+            if len(entries) == limit:
+                return entries, True
+    # Short only because of tombstones: complete unless older comments exist
+    # outside the buffer.
+    return entries, skipped or head <= RING_SIZE
+
+
+def recent_comments(limit=20):
+    """The newest ``limit`` comments, newest first."""
+    head = cache.get(RING_HEAD_KEY)
+    if head is None:
+        head = rebuild_recent_comments()
+
+    entries, complete = _read(head, limit)
+    if not complete:
+        entries, _ = _read(rebuild_recent_comments(), limit)
+    return entries
@@ -4,11 +4,29 @@ from .models import Comment
 class CommentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Comment
-        fields = ["id", "user", "photo", "comment_text", "created_at"]
-        read_only_fields = ["id", "user", "created_at"]
+        fields = ["id", "user", "photo", "parent", "thread", "comment_text", "reply_count", "created_at"]
+        read_only_fields = ["id", "user", "parent", "thread", "reply_count", "created_at"]
 
     def validate_comment_text(self, value):
         """Ensure comment is not empty"""
         if not value.strip():
             raise serializers.ValidationError("Comment cannot be empty.")
         return value
+
+
+class CommentThreadSerializer(CommentSerializer):
+    """A top-level comment with the first page of its replies."""
+    replies = serializers.SerializerMethodField()
+    replies_cursor = serializers.SerializerMethodField()
+
+    class Meta(CommentSerializer.Meta):
+        fields = CommentSerializer.Meta.fields + ["replies", "replies_cursor"]
+
+    def get_replies(self, obj):
+        return CommentSerializer(obj.first_replies, many=True).data
+
+    def get_replies_cursor(self, obj):
+        """Cursor for the thread's next replies, if it has more."""
+        if obj.first_replies and obj.reply_count > len(obj.first_replies):
+            return obj.first_replies[-1].path
+        return None
@@ -0,0 +1,121 @@
+"""
+Loading comment threads.
+
+A page of threads is one query: the newest top-level comments of a photo
+(a keyset range on the partial photo/created_at index) together with the
+first replies of each thread, read with a LATERAL ``LIMIT`` per thread on
+the (thread, path) index, so a thread with thousands of replies costs as
+much as one with a handful. Further replies are paged by path.
+"""
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from django.utils.dateparse import parse_datetime
+import base64
+import uuid
+
+from .models import PATH_SEPARATOR, Comment
+
+PAGE_IDS_SQL = """
+WITH roots AS (
+    SELECT {pk}, {created_at} FROM {comments}
+    WHERE {photo} = %s AND {parent} IS NULL AND NOT {hidden} {after}
+    ORDER BY {created_at} DESC, {pk} DESC
+    LIMIT %s
+)
+SELECT {pk} FROM roots
+UNION ALL
+SELECT r.{pk} FROM roots CROSS JOIN LATERAL (
+    SELECT c.{pk} FROM {comments} c
+    WHERE c.{thread} = roots.{pk} AND NOT c.{hidden}
+    ORDER BY c.{path}
+    LIMIT %s
+) r
+"""
+
+
+def _names():
+    qn = connection.ops.quote_name
+    meta = Comment._meta
+    return {
+        "comments": qn(meta.db_table),
+        "pk": qn(meta.pk.column),
+        "photo": qn(meta.get_field("photo").column),
+        "parent": qn(meta.get_field("parent").column),
+        "thread": qn(meta.get_field("thread").column),
+        "path": qn(meta.get_field("path").column),
+        "created_at": qn(meta.get_field("created_at").column),
+        "hidden": qn(meta.get_field("is_hidden").column),
+    }
+
+
+def encode_cursor(comment):
+    value = f"{comment.created_at.isoformat()}|{comment.id}"
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Return the ``(created_at, id)`` of the last thread on the previous page."""
+    try:
+        created_at, comment_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        created_at = parse_datetime(created_at)
+        if created_at is None:
+            raise ValueError
+        return created_at, uuid.UUID(comment_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+
+def thread_page(photo_id, limit, replies, cursor=None):
+    """
+    Return ``(threads, next_cursor)``: up to ``limit`` top-level comments,
+    newest first, each with its first ``replies`` replies in ``first_replies``.
+    """
+    names = _names()
+    params = [photo_id]
+    after = ""
+    if cursor:
+        created_at, comment_id = decode_cursor(cursor)
+        after = "AND ({created_at}, {pk}) < (%s, %s)".format(**names)
+        params += [created_at, comment_id]
+    sql = PAGE_IDS_SQL.format(after=after, **names)
+    rows = Comment.objects.select_related('user').filter(id__in=RawSQL(sql, params + [limit + 1, replies]))
+
+    threads, first_replies = [], {}
+    for comment in rows:
+        if comment.thread_id is None:
+            threads.append(comment)
+        else:
+            first_replies.setdefault(comment.thread_id, []).append(comment)
+
+    threads.sort(key=lambda c: (c.created_at, c.id), reverse=True)
+    next_cursor = encode_cursor(threads[limit - 1]) if len(threads) > limit else None
+    threads = threads[:limit]
+    for thread in threads:
+        thread.first_replies = sorted(first_replies.get(thread.id, []), key=lambda c: c.path)
+    return threads, next_cursor
+
+
+def reply_page(thread_id, limit, after=None):
+    """
+    Return ``(replies, next_cursor)`` for a thread in path order, continuing
+    after the path given as ``after`` (the previous page's cursor).
+    """
+    replies = Comment.objects.select_related('user').filter(thread_id=thread_id, is_hidden=False)
+    if after:
+        replies = replies.filter(path__gt=after)
+    replies = list(replies.order_by('path')[:limit + 1])
+    next_cursor = replies[limit - 1].path if len(replies) > limit else None
+    return replies[:limit], next_cursor
+
+
+def subtree(comment):
+    """The comment's replies at any depth (excluding the comment itself)."""
+    if comment.thread_id is None:
+        return Comment.objects.filter(thread_id=comment.id)
+    # Descendant paths are exactly those between "<path>." and "<path>/"
+    # ("/" sorts right after "."), a range on the (thread, path) index.
+    return Comment.objects.filter(
+        thread_id=comment.thread_id,
+        path__gt=comment.path + PATH_SEPARATOR,
+        path__lt=comment.path + chr(ord(PATH_SEPARATOR) + 1),
+    )
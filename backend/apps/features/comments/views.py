@@ -5,16 +5,25 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.exceptions import ValidationError, PermissionDenied
 from django.core.cache import cache
 from django.db import transaction
-from django.db.models import Count, Q
+from django.db.models import Count, Q, F
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from django.conf import settings
 import logging
-from datetime import timedelta
-
-from .models import Comment
-from .serializers import CommentSerializer
+import uuid
+
+from .models import MAX_THREAD_DEPTH, Comment, CommentReport
+from .moderation import MODERATION_ACTIONS, invalidate_comment_caches, moderation_queue, report_comment
+from .recent import (
+    push_recent_comment, recent_comments, remove_recent_comment, reset_recent_comments, update_recent_comment,
+)
+from .serializers import CommentSerializer, CommentThreadSerializer
+from .threads import reply_page, subtree, thread_page
 from apps.features.photos.models import Photo
+from apps.core.cache.keys import (
+    PHOTO_COMMENT_STATS, PHOTO_COMMENT_THREADS, PHOTO_COMMENTS, USER_COMMENT_LIST, USER_COMMENT_STATS, USER_COMMENTS
+)
+from apps.core.cache.ratelimit import RateLimit
 from apps.core.users.models import User
 
 logger = logging.getLogger(__name__)
@@ -33,11 +42,15 @@ class CommentViewSet(viewsets.ModelViewSet):
     """
     serializer_class = CommentSerializer
     permission_classes = [IsAuthenticated]
+    throttle_scopes = {'report': 'reports'}
     
     # Configure comment settings
     MAX_COMMENT_LENGTH = getattr(settings, 'MAX_COMMENT_LENGTH', 1000)
     COMMENTS_PER_PAGE = getattr(settings, 'COMMENTS_PER_PAGE', 20)
+    REPLIES_PER_THREAD = getattr(settings, 'REPLIES_PER_THREAD', 3)
+    MAX_MODERATION_BATCH = 500
     COMMENT_RATE_LIMIT = getattr(settings, 'COMMENT_RATE_LIMIT', 5)  # comments per minute
+    COMMENT_LIMIT = RateLimit("comments", COMMENT_RATE_LIMIT, 60, sliding=True)
     CACHE_TIMEOUT = 300  # 5 minutes
 
     def get_queryset(self):
@@ -60,34 +73,38 @@ class CommentViewSet(viewsets.ModelViewSet):
             if len(comment_text) > self.MAX_COMMENT_LENGTH:
                 raise ValidationError(f"Comment text cannot exceed {self.MAX_COMMENT_LENGTH} characters")
 
-            # Check rate limiting
-            recent_comments = Comment.objects.filter(
-                user=request.user,
-                created_at__gte=timezone.now() - timedelta(minutes=1)
-            ).count()
+            photo = get_object_or_404(Photo, id=photo_id)
 
-            if recent_comments >= self.COMMENT_RATE_LIMIT:
-                raise PermissionDenied(f"Maximum {self.COMMENT_RATE_LIMIT} comments per minute allowed")
+            parent = None
+            parent_id = request.data.get('parent_id')
+            if parent_id:
+                parent = get_object_or_404(Comment, id=parent_id)
+                if parent.photo_id != photo.id:
+                    raise ValidationError("parent_id must be a comment on the same photo")
+                if parent.depth + 1 >= MAX_THREAD_DEPTH:
+                    raise ValidationError(f"Replies cannot be nested more than {MAX_THREAD_DEPTH} levels deep")
 
-            photo = get_object_or_404(Photo, id=photo_id)
+            # Check rate limiting
+            if not self.COMMENT_LIMIT.hit(request.user.id):
+                raise PermissionDenied(f"Maximum {self.COMMENT_RATE_LIMIT} comments per minute allowed")
             
             # Create comment
             with transaction.atomic():
                 comment = Comment.objects.create(
                     user=request.user,
                     photo=photo,
-                    comment_text=comment_text
+                    comment_text=comment_text,
+                    parent=parent,
+                    thread_id=(parent.thread_id or parent.id) if parent else None
                 )
+                Photo.objects.filter(id=photo.id).update(comments_count=F('comments_count') + 1)
+                if comment.thread_id:
+                    Comment.objects.filter(id=comment.thread_id).update(reply_count=F('reply_count') + 1)
 
             # Clear relevant caches
-            cache_keys = [
-                f"photo_comments_{photo.id}",
-                f"user_comments_{request.user.id}",
-                f"comment_stats_{photo.id}",
-                "recent_comments",
-                f"user_comment_count_{request.user.id}"
-            ]
-            cache.delete_many(cache_keys)
+            PHOTO_COMMENTS.bump(photo.id)
+            USER_COMMENTS.bump(request.user.id)
+            push_recent_comment(comment)
 
             return Response(
                 self.get_serializer(comment).data,
@@ -127,12 +144,9 @@ class CommentViewSet(viewsets.ModelViewSet):
             comment.save()
 
             # Clear relevant caches
-            cache_keys = [
-                f"photo_comments_{comment.photo.id}",
-                f"user_comments_{request.user.id}",
-                "recent_comments"
-            ]
-            cache.delete_many(cache_keys)
+            PHOTO_COMMENTS.bump(comment.photo_id)
+            USER_COMMENTS.bump(comment.user_id)
+            update_recent_comment(comment)
 
             return Response(self.get_serializer(comment).data)
 
@@ -158,20 +172,27 @@ class CommentViewSet(viewsets.ModelViewSet):
             if comment.user != request.user and not request.user.is_staff:
                 raise PermissionDenied("You can only delete your own comments")
 
+            comment_id = comment.id
             photo_id = comment.photo.id
             user_id = comment.user.id
             
-            comment.delete()
+            with transaction.atomic():
+                # Replies are deleted with the comment (CASCADE).
+                authors = [user_id] + list(subtree(comment).values_list('user_id', flat=True))
+                removed = len(authors)
+                comment.delete()
+                Photo.objects.filter(id=photo_id).update(comments_count=F('comments_count') - removed)
+                if comment.thread_id:
+                    Comment.objects.filter(id=comment.thread_id).update(reply_count=F('reply_count') - removed)
 
             # Clear relevant caches
-            cache_keys = [
-                f"photo_comments_{photo_id}",
-                f"user_comments_{user_id}",
-                f"comment_stats_{photo_id}",
-                "recent_comments",
-                f"user_comment_count_{user_id}"
-            ]
-            cache.delete_many(cache_keys)
+            PHOTO_COMMENTS.bump(photo_id)
+            USER_COMMENTS.bump_each(authors)
+            if removed > 1:
+                # Replies were deleted too; cheaper to rebuild than to find them.
+                reset_recent_comments()
+            else:
+                remove_recent_comment(comment_id)
 
             return Response(status=status.HTTP_204_NO_CONTENT)
 
@@ -186,26 +207,45 @@ class CommentViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'])
     def photo_comments(self, request):
-        """Get comments for a specific photo with caching."""
+        """
+        Get a page of comment threads for a photo, newest first, each with
+        its first replies. Paginate with the returned next_cursor.
+        """
         try:
             photo_id = request.query_params.get('photo_id')
             if not photo_id:
                 raise ValidationError("photo_id query parameter is required")
 
-            cache_key = f"photo_comments_{photo_id}"
-            cached_comments = cache.get(cache_key)
-
-            if cached_comments:
-                return Response(cached_comments)
+            cursor = request.query_params.get('cursor')
+            try:
+                limit = min(int(request.query_params.get('limit', self.COMMENTS_PER_PAGE)), 100)
+                replies = min(int(request.query_params.get('replies', self.REPLIES_PER_THREAD)), 20)
+            except ValueError:
+                raise ValidationError("limit and replies must be integers")
+            if limit < 1 or replies < 0:
+                raise ValidationError("limit must be positive and replies non-negative")
+
+            # Only the default first page is cached.
+            default_page = not cursor and 'limit' not in request.query_params and 'replies' not in request.query_params
+            if default_page:
+                cache_key = PHOTO_COMMENT_THREADS.key(photo_id=photo_id)
+                cached_comments = cache.get(cache_key)
+                if cached_comments:
+                    return Response(cached_comments)
+
+            try:
+                threads, next_cursor = thread_page(photo_id, limit, replies, cursor=cursor)
+            except ValueError as e:
+                raise ValidationError(str(e))
+
+            data = {
+                "results": CommentThreadSerializer(threads, many=True).data,
+                "next_cursor": next_cursor
+            }
+            if default_page:
+                cache.set(cache_key, data, timeout=self.CACHE_TIMEOUT)
 
-            comments = Comment.objects.select_related('user').filter(
-                photo_id=photo_id
-            ).order_by('-created_at')
-
-            serializer = self.get_serializer(comments, many=True)
-            cache.set(cache_key, serializer.data, timeout=self.CACHE_TIMEOUT)
-            
-            return Response(serializer.data)
+            return Response(data)
 
         except ValidationError as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
@@ -216,19 +256,53 @@ class CommentViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @action(detail=True, methods=['get'])
+    def replies(self, request, pk=None):
+        """
+        Get further replies of a thread in order. Pass the thread's
+        replies_cursor (or the previous next_cursor) as cursor.
+        """
+        try:
+            comment = self.get_object()
+            thread_id = comment.thread_id or comment.id
+
+            try:
+                limit = min(int(request.query_params.get('limit', self.COMMENTS_PER_PAGE)), 100)
+            except ValueError:
+                raise ValidationError("limit must be an integer")
+            if limit < 1:
+                raise ValidationError("limit must be positive")
+
+            replies, next_cursor = reply_page(
+                thread_id, limit, after=request.query_params.get('cursor')
+            )
+            return Response({
+                "results": self.get_serializer(replies, many=True).data,
+                "next_cursor": next_cursor
+            })
+
+        except ValidationError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            logger.error(f"Failed to fetch comment replies: {str(e)}")
+            return Response(
+                {"error": "Failed to fetch comment replies"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
     @action(detail=False, methods=['get'])
     def user_comments(self, request):
         """Get comment history for a user with caching."""
         try:
             user_id = request.query_params.get('user_id', request.user.id)
-            cache_key = f"user_comments_{user_id}"
+            cache_key = USER_COMMENT_LIST.key(user_id=user_id)
             cached_comments = cache.get(cache_key)
 
             if cached_comments:
                 return Response(cached_comments)
 
             comments = Comment.objects.select_related('photo').filter(
-                user_id=user_id
+                user_id=user_id, is_hidden=False
             ).order_by('-created_at')
 
             serializer = self.get_serializer(comments, many=True)
@@ -251,15 +325,21 @@ class CommentViewSet(viewsets.ModelViewSet):
             if not photo_id:
                 raise ValidationError("photo_id query parameter is required")
 
-            cache_key = f"comment_stats_{photo_id}"
+            cache_key = PHOTO_COMMENT_STATS.key(photo_id=photo_id)
             cached_stats = cache.get(cache_key)
 
             if cached_stats:
                 return Response(cached_stats)
 
-            total_comments = Comment.objects.filter(photo_id=photo_id).count()
+            # Photo.comments_count is kept in step with create/destroy and
+            # corrected by the reconcile_counters job. It includes hidden
+            # comments, counted separately on a small partial index.
+            total_comments = Photo.objects.filter(id=photo_id).values_list(
+                'comments_count', flat=True
+            ).first() or 0
+            total_comments -= Comment.objects.filter(photo_id=photo_id, is_hidden=True).count()
             recent_comments = Comment.objects.select_related('user').filter(
-                photo_id=photo_id
+                photo_id=photo_id, is_hidden=False
             ).order_by('-created_at')[:5].values(
                 'user__username',
                 'comment_text',
@@ -287,23 +367,8 @@ class CommentViewSet(viewsets.ModelViewSet):
     def recent(self, request):
         """Get recent comments across all photos."""
         try:
-            cache_key = "recent_comments"
-            cached_comments = cache.get(cache_key)
-
-            if cached_comments:
-                return Response(cached_comments)
-
-            comments = Comment.objects.select_related('user', 'photo').order_by(
-                '-created_at'
-            )[:20].values(
-                'user__username',
-                'photo__title',
-                'comment_text',
-                'created_at'
-            )
-
-            cache.set(cache_key, list(comments), timeout=self.CACHE_TIMEOUT)
-            return Response(comments)
+            # Served from the write-through ring buffer; no query when warm.
+            return Response(recent_comments(limit=20))
 
         except Exception as e:
             logger.error(f"Failed to fetch recent comments: {str(e)}")
@@ -317,21 +382,17 @@ class CommentViewSet(viewsets.ModelViewSet):
         """Get comment statistics for a user."""
         try:
             user_id = request.query_params.get('user_id', request.user.id)
-            cache_key = f"user_comment_stats_{user_id}"
+            cache_key = USER_COMMENT_STATS.key(user_id=user_id)
             cached_stats = cache.get(cache_key)
 
             if cached_stats:
                 return Response(cached_stats)
 
-            total_comments = Comment.objects.filter(user_id=user_id).count()
-            today_comments = Comment.objects.filter(
-                user_id=user_id,
-                created_at__date=timezone.now().date()
-            ).count()
+            visible = Comment.objects.filter(user_id=user_id, is_hidden=False)
+            total_comments = visible.count()
+            today_comments = visible.filter(created_at__date=timezone.now().date()).count()
 
-            recent_comments = Comment.objects.select_related('photo').filter(
-                user_id=user_id
-            ).order_by('-created_at')[:5].values(
+            recent_comments = visible.select_related('photo').order_by('-created_at')[:5].values(
                 'photo__title',
                 'comment_text',
                 'created_at'
@@ -355,7 +416,7 @@ class CommentViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['post'])
     def report(self, request, pk=None):
-        """Report a comment for moderation."""
+        """Report a comment for moderation. Repeat reports by the same user are not counted."""
         try:
             comment = self.get_object()
             reason = request.data.get('reason')
@@ -363,13 +424,12 @@ class CommentViewSet(viewsets.ModelViewSet):
             if not reason:
                 raise ValidationError("reason is required")
 
-            # Here you would typically create a CommentReport model instance
-            # and notify moderators, but for now we'll just log it
-            logger.info(f"Comment {comment.id} reported by {request.user.id}. Reason: {reason}")
+            report_count = report_comment(comment.id, request.user.id, reason)
 
             return Response({
                 "message": "Comment reported successfully",
-                "comment_id": comment.id
+                "comment_id": comment.id,
+                "already_reported": report_count is None
             })
 
         except ValidationError as e:
@@ -380,3 +440,86 @@ class CommentViewSet(viewsets.ModelViewSet):
                 {"error": "Failed to report comment"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+
+    @action(detail=False, methods=['get'])
+    def moderation_queue(self, request):
+        """Reported comments, most urgent first. Staff only."""
+        try:
+            if not request.user.is_staff:
+                raise PermissionDenied("Only moderators can view the moderation queue")
+
+            report_status = request.query_params.get('status', CommentReport.STATUS_OPEN)
+            if report_status not in dict(CommentReport.STATUS_CHOICES):
+                raise ValidationError("Invalid status")
+            try:
+                limit = min(int(request.query_params.get('limit', 50)), self.MAX_MODERATION_BATCH)
+            except ValueError:
+                raise ValidationError("limit must be an integer")
+
+            return Response([{
+                "comment_id": report.comment_id,
+                "comment_text": report.comment.comment_text,
+                "author": report.comment.user.username,
+                "photo_id": report.comment.photo_id,
+                "is_hidden": report.comment.is_hidden,
+                "report_count": report.report_count,
+                "priority": report.priority,
+                "last_reason": report.last_reason,
+                "first_reported_at": report.first_reported_at,
+                "last_reported_at": report.last_reported_at,
+            } for report in moderation_queue(report_status, limit)])
+
+        except ValidationError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except PermissionDenied as e:
+            return Response({"error": str(e)}, status=status.HTTP_403_FORBIDDEN)
+        except Exception as e:
+            logger.error(f"Failed to fetch moderation queue: {str(e)}")
+            return Response(
+                {"error": "Failed to fetch moderation queue"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+    @action(detail=False, methods=['post'])
+    def moderate(self, request):
+        """
+        Apply a moderation action to many comments at once. Staff only.
+        Body: {"action": "hide" | "delete" | "dismiss" | "ban", "comment_ids": [...]}
+        """
+        try:
+            if not request.user.is_staff:
+                raise PermissionDenied("Only moderators can moderate comments")
+
+            moderation_action = request.data.get('action')
+            if moderation_action not in MODERATION_ACTIONS:
+                raise ValidationError(f"action must be one of: {', '.join(MODERATION_ACTIONS)}")
+
+            comment_ids = request.data.get('comment_ids')
+            if not isinstance(comment_ids, list) or not comment_ids:
+                raise ValidationError("comment_ids must be a non-empty list")
+            if len(comment_ids) > self.MAX_MODERATION_BATCH:
+                raise ValidationError(f"At most {self.MAX_MODERATION_BATCH} comments per request")
+            try:
+                comment_ids = [uuid.UUID(str(comment_id)) for comment_id in comment_ids]
+            except ValueError:
+                raise ValidationError("comment_ids must be valid UUIDs")
+
+            photo_ids, user_ids = MODERATION_ACTIONS[moderation_action](comment_ids)
+            invalidate_comment_caches(photo_ids, user_ids)
+
+            logger.info(f"Moderator {request.user.id} applied {moderation_action} to {len(comment_ids)} comments")
+            return Response({
+                "message": f"Applied {moderation_action} to {len(comment_ids)} comments",
+                "action": moderation_action
+            })
+
+        except ValidationError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except PermissionDenied as e:
+            return Response({"error": str(e)}, status=status.HTTP_403_FORBIDDEN)
+        except Exception as e:
+            logger.error(f"Moderation action failed: {str(e)}")
+            return Response(
+                {"error": "Failed to apply moderation action"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
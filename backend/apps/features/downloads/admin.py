@@ -3,7 +3,7 @@ from .models import Download
 
 @admin.register(Download)
 class DownloadAdmin(admin.ModelAdmin):
-    list_display = ("user", "photo", "downloaded_at")
+    list_display = ("user", "photo", "downloaded_at", "download_count")
     search_fields = ("user__username", "photo__title")
     ordering = ("-downloaded_at",)
     list_filter = ("downloaded_at",)
\ No newline at end of file
@@ -0,0 +1,329 @@
+"""
+Download event log.
+
+Every download is an event. Requests only append the event to a buffer in
+the cache (an ``incr`` claiming sequence numbers, the slot writes, and an
+``incr`` of the committed count); the flush drains the buffer in order and,
+per batch, in one transaction:
+
+* appends the raw events to ``download_events`` with ``bulk_create``,
+* adds them to the hourly and daily per-photo rollups, and
+* upserts each user's ``Download`` row (last download time and count),
+  bumping ``Photo.downloads_count`` for first downloads.
+
+Each batch is a constant number of statements, so the cost per download
+stays flat as volume grows. A flush runs inline every
+DOWNLOAD_EVENT_FLUSH_EVERY downloads and from cron via
+``flush_download_events``, which also applies retention.
+
+A slot missing from the buffer is either evicted or claimed by a writer
+that has not stored it yet, however large its claim. The flush only skips
+it as evicted when every claim up to the head has been committed, or when
+it was claimed more than EVENT_STALL_GRACE seconds ago (a writer that died
+between claiming and writing); otherwise it stops there until next time.
+
+Each event's sequence number is its idempotency key: the last one applied
+is kept in ``DownloadEventCursor`` and moved in the batch's transaction, so
+a batch retried after a crash, or taken by a second flush, is skipped.
+
+The sequence is created by ``add`` at the start of an epoch: the creation
+time in seconds, kept in the high bits of every number it hands out. If
+the sequence is evicted it restarts in a new epoch, whatever its numbers
+had reached. The cursor records the epoch it belongs to, and the flush
+starts it over at the new epoch's first number when the head's differs (or,
+for a sequence restarted within the same second, when the head is behind).
+
+Removing a download leaves a tombstone holding the head of the sequence.
+Buffered events for that user and photo up to it still count in the raw
+log and rollups, but no longer re-create the ``Download`` row.
+"""
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+import logging
+import time
+
+from .models import Download, DownloadEvent, DownloadEventCursor, DownloadRollup
+from apps.core.cache.keys import DOWNLOADS, USER_DOWNLOADS
+from apps.core.users.models import User
+from apps.features.photos.models import Photo
+
+logger = logging.getLogger(__name__)
+
+EVENT_SEQ_KEY = "download_events_seq"
+EPOCH_SHIFT = 32  # Sequence numbers are (epoch << EPOCH_SHIFT) + position.
+COMMITTED_KEY = "download_events_committed"
+STALL_KEY = "download_events_stall"
+EVENT_SLOT_KEY = "download_event_{seq}"
+TOMBSTONE_KEY = "download_removed_{user_id}_{photo_id}"
+FLUSH_LOCK_KEY = "download_events_flush_lock"
+EVENT_TIMEOUT = 24 * 3600
+FLUSH_EVERY = getattr(settings, 'DOWNLOAD_EVENT_FLUSH_EVERY', 100)
+FLUSH_BATCH_SIZE = 1000
+# How long a claimed sequence number may stay unwritten before it is lost.
+EVENT_STALL_GRACE = 60  # seconds
+
+EVENT_RETENTION_DAYS = getattr(settings, 'DOWNLOAD_EVENT_RETENTION_DAYS', 90)
+HOURLY_ROLLUP_RETENTION_DAYS = getattr(settings, 'DOWNLOAD_HOURLY_ROLLUP_RETENTION_DAYS', 30)
+
+ROLLUP_SQL = """
+INSERT INTO {rollups} AS r ({r_photo}, {r_granularity}, {r_bucket}, {r_count})
+SELECT * FROM unnest(%(photos)s::uuid[], %(granularities)s::varchar[], %(buckets)s::timestamptz[], %(counts)s::int[])
+ON CONFLICT ({r_granularity}, {r_bucket}, {r_photo}) DO UPDATE SET {r_count} = r.{r_count} + EXCLUDED.{r_count}
+"""
+
+DOWNLOADS_SQL = """
+WITH batch AS (
+    SELECT b.* FROM unnest(%(users)s::uuid[], %(photos)s::uuid[], %(times)s::timestamptz[], %(counts)s::int[])
+        AS b(user_id, photo_id, downloaded_at, n)
+    WHERE EXISTS (SELECT 1 FROM {users} u WHERE u.{user_pk} = b.user_id)
+      AND EXISTS (SELECT 1 FROM {photos} p WHERE p.{photo_pk} = b.photo_id)
+), upserted AS (
+    INSERT INTO {downloads} AS d ({d_pk}, {d_user}, {d_photo}, {d_at}, {d_count})
+    SELECT gen_random_uuid(), user_id, photo_id, downloaded_at, n FROM batch
+    ON CONFLICT ({d_user}, {d_photo}) DO UPDATE SET
+        {d_at} = GREATEST(d.{d_at}, EXCLUDED.{d_at}),
+        {d_count} = d.{d_count} + EXCLUDED.{d_count}
+    RETURNING d.{d_photo} AS photo_id, (xmax = 0) AS inserted
+)
+UPDATE {photos} p SET {downloads_count} = p.{downloads_count} + c.n
+FROM (SELECT photo_id, COUNT(*) AS n FROM upserted WHERE inserted GROUP BY photo_id) c
+WHERE p.{photo_pk} = c.photo_id
+"""
+
+
+def _names():
+    qn = connection.ops.quote_name
+    downloads, rollups = Download._meta, DownloadRollup._meta
+    return {
+        "users": qn(User._meta.db_table),
+        "user_pk": qn(User._meta.pk.column),
+        "photos": qn(Photo._meta.db_table),
+        "photo_pk": qn(Photo._meta.pk.column),
+        "downloads_count": qn(Photo._meta.get_field("downloads_count").column),
+        "downloads": qn(downloads.db_table),
+        "d_pk": qn(downloads.pk.column),
+        "d_user": qn(downloads.get_field("user").column),
+        "d_photo": qn(downloads.get_field("photo").column),
+        "d_at": qn(downloads.get_field("downloaded_at").column),
+        "d_count": qn(downloads.get_field("download_count").column),
+        "rollups": qn(rollups.db_table),
+        "r_photo": qn(rollups.get_field("photo").column),
+        "r_granularity": qn(rollups.get_field("granularity").column),
+        "r_bucket": qn(rollups.get_field("bucket").column),
+        "r_count": qn(rollups.get_field("count").column),
+    }
+
+
+def _slot_key(seq):
+    return EVENT_SLOT_KEY.format(seq=seq)
+
+
+def _epoch(seq):
+    return seq >> EPOCH_SHIFT
+
+
+def _epoch_start(epoch):
+    """The number before the first one handed out in ``epoch``."""
+    return epoch << EPOCH_SHIFT
+
+
+def record_download_event(user_id, photo_id):
+    """Append a download to the buffer; flushes inline every FLUSH_EVERY events."""
+    record_download_events(user_id, [photo_id])
+
+
+def record_download_events(user_id, photo_ids):
+    """Append several downloads by one user with a single incr and set_many."""
+    if not photo_ids:
+        return
+    count = len(photo_ids)
+    start = _epoch_start(int(time.time()))
+    cache.add(EVENT_SEQ_KEY, start, timeout=None)
+    try:
+        last = cache.incr(EVENT_SEQ_KEY, count)
+    except ValueError:
+        # Evicted between add() and incr(); the flush notices the new epoch.
+        cache.set(EVENT_SEQ_KEY, start + count, timeout=None)
+        last = start + count
+    first = last - count + 1
+    now = time.time()
+    slots = {
+        _slot_key(seq): (str(user_id), str(photo_id), now)
+        for seq, photo_id in zip(range(first, last + 1), photo_ids)
+    }
+    cache.set_many(slots, timeout=EVENT_TIMEOUT)
+    cache.add(COMMITTED_KEY, _epoch_start(_epoch(last)), timeout=None)
+    try:
+        cache.incr(COMMITTED_KEY, count)
+    except ValueError:
+        pass  # Evicted: the flush falls back on EVENT_STALL_GRACE.
+    if (first - 1) // FLUSH_EVERY != last // FLUSH_EVERY:
+        flush_download_events()
+
+
+def _lock_cursor():
+    DownloadEventCursor.objects.get_or_create(pk=DownloadEventCursor.SINGLETON)
+    return DownloadEventCursor.objects.select_for_update().get(pk=DownloadEventCursor.SINGLETON)
+
+
+def _tombstone_key(user_id, photo_id):
+    return TOMBSTONE_KEY.format(user_id=user_id, photo_id=photo_id)
+
+
+def drop_buffered_downloads(user_id, photo_id):
+    """
+    Keep downloads of the photo buffered so far from re-creating the user's
+    Download row. Call in the transaction that deletes it.
+    """
+    _lock_cursor()  # Waits for a batch in progress to commit.
+    cache.set(_tombstone_key(user_id, photo_id), cache.get(EVENT_SEQ_KEY, 0), timeout=EVENT_TIMEOUT)
+
+
+def _write_batch(events, end):
+    """
+    Persist one batch of ``(seq, (user_id, photo_id, timestamp))`` events
+    and mark the log applied up to ``end``. Events already applied are
+    skipped. Returns the number of events written and the users touched.
+    """
+    names = _names()
+    with transaction.atomic():
+        cursor_row = _lock_cursor()
+        events = [(seq, event) for seq, event in events if seq > cursor_row.applied_seq]
+        tombstones = cache.get_many(list({_tombstone_key(user_id, photo_id) for _, (user_id, photo_id, _) in events}))
+
+        rows, hourly, daily, per_user = [], Counter(), Counter(), {}
+        for seq, (user_id, photo_id, timestamp) in events:
+            at = datetime.fromtimestamp(timestamp, tz=dt_timezone.utc)
+            rows.append(DownloadEvent(user_id=user_id, photo_id=photo_id, downloaded_at=at))
+            hour = at.replace(minute=0, second=0, microsecond=0)
+            hourly[photo_id, hour] += 1
+            daily[photo_id, hour.replace(hour=0)] += 1
+            if seq <= tombstones.get(_tombstone_key(user_id, photo_id), 0):
+                continue  # Removed by the user after this download.
+            last, count = per_user.get((user_id, photo_id), (at, 0))
+            per_user[user_id, photo_id] = (max(last, at), count + 1)
+
+        buckets = [
+            (photo_id, granularity, bucket, count)
+            for granularity, counts in ((DownloadRollup.HOUR, hourly), (DownloadRollup.DAY, daily))
+            for (photo_id, bucket), count in counts.items()
+        ]
+        DownloadEvent.objects.bulk_create(rows, batch_size=FLUSH_BATCH_SIZE)
+        with connection.cursor() as cursor:
+            cursor.execute(ROLLUP_SQL.format(**names), {
+                "photos": [b[0] for b in buckets],
+                "granularities": [b[1] for b in buckets],
+                "buckets": [b[2] for b in buckets],
+                "counts": [b[3] for b in buckets],
+            })
+            cursor.execute(DOWNLOADS_SQL.format(**names), {
+                "users": [user_id for user_id, _ in per_user],
+                "photos": [photo_id for _, photo_id in per_user],
+                "times": [last for last, _ in per_user.values()],
+                "counts": [count for _, count in per_user.values()],
+            })
+        if end > cursor_row.applied_seq:
+            cursor_row.applied_seq = end
+            cursor_row.save(update_fields=["applied_seq"])
+    return len(rows), {user_id for user_id, _ in per_user}
+
+
+def _settled_head(head, committed, done):
+    """Highest sequence number whose slot, if missing, can no longer be written."""
+    if committed == head:
+        cache.delete(STALL_KEY)
+        return head
+    now = time.time()
+    stall = cache.get(STALL_KEY)
+    if stall is None or stall[0] <= done:
+        cache.set(STALL_KEY, (head, now), timeout=None)
+        return done
+    stalled_head, since = stall
+    if now - since < EVENT_STALL_GRACE:
+        return done
+    # Everything claimed before the grace period started is settled.
+    cache.set(STALL_KEY, (head, now), timeout=None)
+    return stalled_head
+
+
+def flush_download_events():
+    """Drain the buffer into the database. Returns the number of events written."""
+    from .services import DOWNLOADS_FILTER  # services imports this module
+
+    if not cache.add(FLUSH_LOCK_KEY, 1, timeout=300):
+        return 0  # Another flush is running.
+    written = 0
+    try:
+        # Committed is read first: if it then equals the head, every claim
+        # up to the head had stored its slots.
+        committed = cache.get(COMMITTED_KEY, 0)
+        head = cache.get(EVENT_SEQ_KEY)
+        if head is None:
+            return 0  # Nothing recorded since the sequence was evicted.
+        epoch, done = DownloadEventCursor.objects.filter(pk=DownloadEventCursor.SINGLETON).values_list(
+            'epoch', 'applied_seq'
+        ).first() or (None, 0)
+        if epoch != _epoch(head) or head < done:
+            # The sequence was evicted and restarted in a new epoch; so
+            # does the committed count.
+            done = _epoch_start(_epoch(head))
+            with transaction.atomic():
+                _lock_cursor()
+                DownloadEventCursor.objects.filter(pk=DownloadEventCursor.SINGLETON).update(
+                    epoch=_epoch(head), applied_seq=done
+                )
+            cache.delete_many([COMMITTED_KEY, STALL_KEY])
+            committed = 0
+        settled = _settled_head(head, committed, done)
+
+        while done < head:
+            end = min(head, done + FLUSH_BATCH_SIZE)
+            keys = [_slot_key(seq) for seq in range(done + 1, end + 1)]
+            slots = cache.get_many(keys)
+            events, stalled = [], False
+            for seq, key in zip(range(done + 1, end + 1), keys):
+                if key in slots:
+                    events.append((seq, slots[key]))
+                elif seq > settled:
+                    # Possibly claimed by a writer that has not stored it
+                    # yet: stop here and pick it up next time.
+                    end, stalled = seq - 1, True
+                    break
+                else:
+                    logger.warning(f"Download event {seq} was evicted before it was flushed")
+
+            if end > done:
+                count, users = _write_batch(events, end)
+                cache.delete_many(keys[:end - done])
+                written += count
+            else:
+                users = set()
+            done = end
+
+            DOWNLOADS.bump()
+            USER_DOWNLOADS.bump_each(users)
+            # Filters built while these downloads were buffered lack them.
+            for user_id in users:
+                DOWNLOADS_FILTER.invalidate(user_id)
+            if stalled:
+                break
+    finally:
+        cache.delete(FLUSH_LOCK_KEY)
+    return written
+
+
+def prune_download_history(event_days=EVENT_RETENTION_DAYS, hourly_days=HOURLY_ROLLUP_RETENTION_DAYS):
+    """
+    Apply retention: raw events and hourly rollups are only kept for a while,
+    daily rollups and Download rows indefinitely. Returns the rows deleted.
+    """
+    now = timezone.now()
+    events, _ = DownloadEvent.objects.filter(downloaded_at__lt=now - timedelta(days=event_days)).delete()
+    hourly, _ = DownloadRollup.objects.filter(
+        granularity=DownloadRollup.HOUR, bucket__lt=now - timedelta(days=hourly_days)
+    ).delete()
+    return events, hourly
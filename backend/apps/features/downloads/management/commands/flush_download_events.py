@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.features.downloads.events import (
+    EVENT_RETENTION_DAYS, HOURLY_ROLLUP_RETENTION_DAYS, flush_download_events, prune_download_history,
+)
+
+
+class Command(BaseCommand):
+    """Flush buffered download events and roll them up. Run every minute from cron."""
+    help = "Write buffered download events, update the rollups and apply retention."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--prune",
+            action="store_true",
+            help="Also delete events and hourly rollups past their retention.",
+        )
+        parser.add_argument(
+            "--event-days",
+            type=int,
+            default=EVENT_RETENTION_DAYS,
+            help="Days of raw download events to keep.",
+        )
+        parser.add_argument(
+            "--hourly-days",
+            type=int,
+            default=HOURLY_ROLLUP_RETENTION_DAYS,
+            help="Days of hourly rollups to keep.",
+        )
+
+    def handle(self, *args, **options):
+        if options["event_days"] < 1 or options["hourly_days"] < 1:
+            raise CommandError("Retention must be at least one day")
+
+        written = flush_download_events()
+        self.stdout.write(self.style.SUCCESS(f"Flushed {written} download events"))
+
+        if options["prune"]:
+            events, hourly = prune_download_history(options["event_days"], options["hourly_days"])
+            self.stdout.write(f"Pruned {events} events and {hourly} hourly rollups")
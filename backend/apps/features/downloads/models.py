@@ -1,13 +1,16 @@
 import uuid
+from django.contrib.postgres.indexes import BrinIndex
 from django.db import models
 from apps.core.users.models import User
 from apps.features.photos.models import Photo
 
 class Download(models.Model):
+    """A user's downloads of a photo, rolled up from DownloadEvent."""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="downloads")
     photo = models.ForeignKey(Photo, on_delete=models.CASCADE, related_name="photo_downloads")
     downloaded_at = models.DateTimeField(auto_now_add=True)
+    download_count = models.IntegerField(default=1)
 
     class Meta:
         db_table = "downloads"
@@ -16,3 +19,58 @@ class Download(models.Model):
 
     def __str__(self):
         return f"{self.user.username} downloaded {self.photo.title}"
+
+
+class DownloadEvent(models.Model):
+    """
+    One row per download, appended in batches by the event flush. No foreign
+    key constraints or B-tree indexes, so inserts stay cheap; the BRIN index
+    serves time-range scans and retention deletes.
+    """
+    id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(
+        User, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, related_name="+"
+    )
+    photo = models.ForeignKey(
+        Photo, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, related_name="+"
+    )
+    downloaded_at = models.DateTimeField()
+
+    class Meta:
+        db_table = "download_events"
+        indexes = [BrinIndex(fields=["downloaded_at"], name="download_events_time_brin")]
+
+
+class DownloadEventCursor(models.Model):
+    """
+    The last event sequence number applied to the database, and the epoch
+    of the sequence it belongs to. Moved in the same transaction as each
+    batch, so a batch is never applied twice.
+    """
+    SINGLETON = 1
+    id = models.PositiveSmallIntegerField(primary_key=True, default=SINGLETON)
+    epoch = models.BigIntegerField(null=True)
+    applied_seq = models.BigIntegerField(default=0)
+
+    class Meta:
+        db_table = "download_event_cursor"
+
+
+class DownloadRollup(models.Model):
+    """Downloads of a photo per hour or per day."""
+    HOUR = "hour"
+    DAY = "day"
+    GRANULARITY_CHOICES = [(HOUR, "Hour"), (DAY, "Day")]
+
+    photo = models.ForeignKey(Photo, on_delete=models.CASCADE, related_name="download_rollups")
+    granularity = models.CharField(max_length=4, choices=GRANULARITY_CHOICES)
+    bucket = models.DateTimeField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = "download_rollups"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["granularity", "bucket", "photo"], name="download_rollups_bucket_uniq"
+            ),
+        ]
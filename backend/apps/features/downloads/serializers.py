@@ -18,4 +18,4 @@ class DownloadSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Download
-        fields = ["id", "photo", "downloaded_at"]
+        fields = ["id", "photo", "downloaded_at", "download_count"]
@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from apps.core.cache.bloom import UserBloomFilter
+from apps.core.cache.ratelimit import DAY, MONTH, RateLimit, hit_all
+from .events import record_download_events
+from .models import Download
+
+
+def _downloaded_photo_ids(user_id):
+    return Download.objects.filter(user_id=user_id).values_list("photo_id", flat=True)
+
+
+# Answers "has this user downloaded photo X?" negatives without a query.
+DOWNLOADS_FILTER = UserBloomFilter("downloads", _downloaded_photo_ids)
+
+
+DAILY_DOWNLOAD_LIMIT = getattr(settings, 'DAILY_DOWNLOAD_LIMIT', 50)
+MONTHLY_DOWNLOAD_LIMIT = getattr(settings, 'MONTHLY_DOWNLOAD_LIMIT', 1000)
+
+# Download quotas per user, counted in the cache on every tracked download.
+DAILY_DOWNLOADS = RateLimit("downloads_daily", DAILY_DOWNLOAD_LIMIT, DAY)
+MONTHLY_DOWNLOADS = RateLimit("downloads_monthly", MONTHLY_DOWNLOAD_LIMIT, MONTH)
+DOWNLOAD_QUOTAS = (DAILY_DOWNLOADS, MONTHLY_DOWNLOADS)
+
+
+def consume_download_quota(user_id, amount=1):
+    """
+    Count ``amount`` downloads against the user's quotas.
+    Returns an error message if a quota is used up, otherwise None.
+    """
+    exceeded = hit_all(DOWNLOAD_QUOTAS, user_id, amount)
+    if exceeded is DAILY_DOWNLOADS:
+        return "Daily download limit reached"
+    if exceeded is MONTHLY_DOWNLOADS:
+        return "Monthly download limit reached"
+    return None
+
+
+def refund_download_quota(user_id, amount):
+    """Give back quota consumed for downloads that did not happen."""
+    for quota in DOWNLOAD_QUOTAS:
+        quota.undo(user_id, amount)
+
+
+def record_bulk_download(user_id, photo_ids):
+    """
+    Record downloads of many photos at once (e.g. a collection archive):
+    one append to the event log and one write of the status entries.
+    """
+    record_download_events(user_id, photo_ids)
+    cache.set_many(
+        {f"download_status_{user_id}_{photo_id}": True for photo_id in photo_ids},
+        timeout=3600
+    )
+    # Rebuilt from the downloads table (and the entries above) on next use.
+    DOWNLOADS_FILTER.invalidate(user_id)
@@ -0,0 +1,66 @@
+"""
+Signed, expiring download links.
+
+``track_download`` hands out a link to ``/api/downloads/file/<token>/``
+instead of the photo's permanent URL. The token is signed with the
+project's SECRET_KEY and names the photo, its Cloudinary public ID and
+format, the user and the link's expiry. Signed tokens are readable by
+whoever holds them, so it never contains a delivery URL. Serving it checks
+the signature alone and redirects to a Cloudinary delivery URL, built from
+the token, that expires with it, so neither the link nor where it leads
+outlives DOWNLOAD_URL_MAX_AGE. A photo deleted or made non-downloadable
+after the link was issued stays reachable until then.
+"""
+from cloudinary.utils import private_download_url
+from django.conf import settings
+from django.core import signing
+from django.urls import reverse
+import time
+
+DOWNLOAD_URL_MAX_AGE = getattr(settings, 'DOWNLOAD_URL_MAX_AGE', 300)  # seconds
+SALT = "downloads.file"
+
+
+def make_download_token(photo, user_id):
+    payload = {
+        "p": str(photo.id),
+        "i": photo.image.public_id,
+        "f": photo.image.format,
+        "u": str(user_id),
+        "e": int(time.time()) + DOWNLOAD_URL_MAX_AGE,
+    }
+    return signing.dumps(payload, salt=SALT, compress=True)
+
+
+def read_download_token(token, max_age=None):
+    """
+    Return the token's payload. Raises signing.SignatureExpired for an old
+    token and signing.BadSignature for a tampered one.
+    """
+    payload = signing.loads(token, salt=SALT, max_age=max_age or DOWNLOAD_URL_MAX_AGE)
+    if "e" not in payload:
+        raise signing.BadSignature("Download link has no expiry")
+    if "i" not in payload:
+        raise signing.BadSignature("Download link names no file")
+    if payload["e"] <= time.time():
+        raise signing.SignatureExpired("Download link has expired")
+    return payload
+
+
+def remaining_lifetime(payload):
+    """Seconds until the token in ``payload`` expires."""
+    return max(0, payload["e"] - int(time.time()))
+
+
+def signed_download_url(request, photo, user_id):
+    """Absolute, expiring download link for the photo."""
+    token = make_download_token(photo, user_id)
+    return request.build_absolute_uri(reverse("downloads:file", args=[token]))
+
+
+def delivery_url(payload):
+    """Cloudinary URL for the token's original file, valid until the token expires."""
+    return private_download_url(
+        payload["i"], payload.get("f"),
+        type="upload", attachment=True, expires_at=payload["e"],
+    )
@@ -1,11 +1,12 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import DownloadViewSet
+from .views import DownloadViewSet, serve_download
 
 app_name = "downloads"
 router = DefaultRouter()
 router.register(r'', DownloadViewSet, basename='downloads')
 
 urlpatterns = [
+    path("file/<str:token>/", serve_download, name="file"),
     path("", include(router.urls)),
 ]
@@ -3,20 +3,55 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.exceptions import ValidationError, PermissionDenied
+from django.conf import settings
+from django.core import signing
 from django.core.cache import cache
 from django.db import transaction
-from django.db.models import Count, Q
+from django.db.models import Q, F, Sum
+from django.http import HttpResponse, HttpResponseRedirect
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
-from django.conf import settings
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import require_GET
+from datetime import timedelta
 import logging
-
-from .models import Download
-from .serializers import DownloadSerializer
+import uuid
+
+from .models import Download, DownloadRollup
+from .events import drop_buffered_downloads, record_download_event
+from .serializers import DownloadSerializer, PhotoSerializer
+from .services import DAILY_DOWNLOADS, DOWNLOADS_FILTER, MONTHLY_DOWNLOADS, consume_download_quota
+from .tokens import (
+    DOWNLOAD_URL_MAX_AGE, delivery_url, read_download_token, remaining_lifetime, signed_download_url
+)
+from apps.core.cache.keys import (
+    DOWNLOADS, MOST_DOWNLOADED, PHOTOS, USER_DOWNLOAD_LIST, USER_DOWNLOAD_STATS, USER_DOWNLOADS
+)
 from apps.features.photos.models import Photo
 
 logger = logging.getLogger(__name__)
 
+
+@require_GET
+def serve_download(request, token):
+    """
+    Redirect a signed download link to a delivery URL for the file that
+    expires with the link. The token is checked with the signing key alone
+    and names the file, so nothing is read from the database.
+    """
+    try:
+        payload = read_download_token(token)
+    except signing.SignatureExpired:
+        return HttpResponse("Download link has expired", status=status.HTTP_410_GONE)
+    except signing.BadSignature:
+        return HttpResponse("Invalid download link", status=status.HTTP_403_FORBIDDEN)
+
+    response = HttpResponseRedirect(delivery_url(payload))
+    # The redirect is only valid while the token is; keep it out of shared caches.
+    patch_cache_control(response, private=True, max_age=remaining_lifetime(payload))
+    return response
+
+
 class DownloadViewSet(viewsets.ModelViewSet):
     """
     ViewSet for handling photo download operations.
@@ -34,8 +69,9 @@ class DownloadViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     
     # Configure download limits
-    DAILY_DOWNLOAD_LIMIT = getattr(settings, 'DAILY_DOWNLOAD_LIMIT', 50)
-    MONTHLY_DOWNLOAD_LIMIT = getattr(settings, 'MONTHLY_DOWNLOAD_LIMIT', 1000)
+    DAILY_DOWNLOAD_LIMIT = DAILY_DOWNLOADS.limit
+    MONTHLY_DOWNLOAD_LIMIT = MONTHLY_DOWNLOADS.limit
+    MOST_DOWNLOADED_DAYS = getattr(settings, 'MOST_DOWNLOADED_DAYS', 30)
 
     def get_queryset(self):
         """Get downloads queryset with optimized loading."""
@@ -53,56 +89,34 @@ class DownloadViewSet(viewsets.ModelViewSet):
             if not photo_id:
                 raise ValidationError("photo_id is required")
 
-            # Check download limits
-            today = timezone.now().date()
-            daily_downloads = Download.objects.filter(
-                user=request.user,
-                downloaded_at__date=today
-            ).count()
-
-            if daily_downloads >= self.DAILY_DOWNLOAD_LIMIT:
-                raise PermissionDenied("Daily download limit reached")
-
-            this_month = timezone.now().replace(day=1)
-            monthly_downloads = Download.objects.filter(
-                user=request.user,
-                downloaded_at__gte=this_month
-            ).count()
-
-            if monthly_downloads >= self.MONTHLY_DOWNLOAD_LIMIT:
-                raise PermissionDenied("Monthly download limit reached")
-
             photo = get_object_or_404(Photo, id=photo_id)
             
             # Check if photo is downloadable
             if not photo.is_downloadable:
                 raise PermissionDenied("This photo is not available for download")
 
-            with transaction.atomic():
-                download, created = Download.objects.get_or_create(
-                    user=request.user,
-                    photo=photo,
-                    defaults={'downloaded_at': timezone.now()}
-                )
-                
-                if not created:
-                    # Update download timestamp if already exists
-                    download.downloaded_at = timezone.now()
-                    download.save()
+            # Check download limits
+            quota_error = consume_download_quota(request.user.id)
+            if quota_error:
+                raise PermissionDenied(quota_error)
 
-            # Clear relevant caches
-            cache_keys = [
-                f"user_downloads_{request.user.id}",
-                f"download_stats_{request.user.id}",
-                f"photo_downloads_{photo.id}",
-                "most_downloaded_photos",
-                f"download_limits_{request.user.id}"
-            ]
-            cache.delete_many(cache_keys)
+            # Appended to the event log; Download rows, rollups and
+            # downloads_count are updated when the log is flushed.
+            record_download_event(request.user.id, photo.id)
+
+            DOWNLOADS_FILTER.record(
+                request.user.id, photo.id, True,
+                exact_key=f"download_status_{request.user.id}_{photo.id}"
+            )
 
             return Response({
                 "message": "Download tracked successfully",
-                "download": self.get_serializer(download).data
+                "download": {
+                    "photo": PhotoSerializer(photo).data,
+                    "downloaded_at": timezone.now()
+                },
+                "download_url": signed_download_url(request, photo, request.user.id),
+                "expires_in": DOWNLOAD_URL_MAX_AGE
             })
 
         except ValidationError as e:
@@ -121,7 +135,7 @@ class DownloadViewSet(viewsets.ModelViewSet):
         """Get user's download history with caching."""
         try:
             user_id = request.query_params.get('user_id', request.user.id)
-            cache_key = f"user_downloads_{user_id}"
+            cache_key = USER_DOWNLOAD_LIST.key(user_id=user_id)
             cached_downloads = cache.get(cache_key)
 
             if cached_downloads:
@@ -145,7 +159,7 @@ class DownloadViewSet(viewsets.ModelViewSet):
         """Get download statistics for a user."""
         try:
             user_id = request.query_params.get('user_id', request.user.id)
-            cache_key = f"download_stats_{user_id}"
+            cache_key = USER_DOWNLOAD_STATS.key(user_id=user_id)
             cached_stats = cache.get(cache_key)
 
             if cached_stats:
@@ -165,12 +179,8 @@ class DownloadViewSet(viewsets.ModelViewSet):
                 "recent_downloads": self.get_queryset()
                     .order_by('-downloaded_at')[:5]
                     .values('photo__title', 'downloaded_at'),
-                "remaining_daily_limit": self.DAILY_DOWNLOAD_LIMIT - self.get_queryset().filter(
-                    downloaded_at__date=today
-                ).count(),
-                "remaining_monthly_limit": self.MONTHLY_DOWNLOAD_LIMIT - self.get_queryset().filter(
-                    downloaded_at__gte=this_month
-                ).count()
+                "remaining_daily_limit": DAILY_DOWNLOADS.remaining(request.user.id),
+                "remaining_monthly_limit": MONTHLY_DOWNLOADS.remaining(request.user.id)
             }
 
             cache.set(cache_key, stats, timeout=300)  # Cache for 5 minutes
@@ -183,27 +193,72 @@ class DownloadViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @action(detail=False, methods=['get'])
+    def check_download(self, request):
+        """
+        Check if user has downloaded a specific photo.
+        Requires photo_id query parameter.
+        """
+        try:
+            photo_id = request.query_params.get('photo_id')
+            if not photo_id:
+                raise ValidationError("photo_id query parameter is required")
+
+            try:
+                photo_id = uuid.UUID(photo_id)
+            except ValueError:
+                raise ValidationError("photo_id must be a valid photo ID")
+
+            # Most photos were never downloaded by the user: the Bloom filter
+            # answers those without a query. Results are cached for 1 hour.
+            downloaded = DOWNLOADS_FILTER.check(
+                request.user.id, photo_id,
+                exact_key=f"download_status_{request.user.id}_{photo_id}",
+                exists=lambda: Download.objects.filter(user=request.user, photo_id=photo_id).exists()
+            )
+            return Response({"downloaded": downloaded})
+
+        except ValidationError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            logger.error(f"Check download failed: {str(e)}")
+            return Response(
+                {"error": "Failed to check download status"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
     @action(detail=False, methods=['get'])
     def most_downloaded(self, request):
         """Get most downloaded photos."""
         try:
-            cache_key = "most_downloaded_photos"
+            cache_key = MOST_DOWNLOADED.key()
             cached_data = cache.get(cache_key)
 
             if cached_data:
                 return Response(cached_data)
 
-            most_downloaded = Photo.objects.annotate(
-                download_count=Count('photo_downloads')
-            ).filter(
-                download_count__gt=0,
-                is_downloadable=True
-            ).order_by('-download_count')[:10].values(
-                'id',
-                'title',
-                'download_count',
-                'user__username'
-            )
+            # Summed from the daily rollups, so the cost depends on the window,
+            # not on the total number of downloads.
+            since = timezone.now() - timedelta(days=self.MOST_DOWNLOADED_DAYS)
+            rows = DownloadRollup.objects.filter(
+                granularity=DownloadRollup.DAY,
+                bucket__gte=since,
+                photo__is_downloadable=True
+            ).values(
+                'photo_id', 'photo__title', 'photo__user__username'
+            ).annotate(
+                download_count=Sum('count')
+            ).order_by('-download_count')[:10]
+
+            most_downloaded = [
+                {
+                    'id': row['photo_id'],
+                    'title': row['photo__title'],
+                    'download_count': row['download_count'],
+                    'user__username': row['photo__user__username']
+                }
+                for row in rows
+            ]
 
             cache.set(cache_key, list(most_downloaded), timeout=3600)  # Cache for 1 hour
             return Response(most_downloaded)
@@ -219,22 +274,9 @@ class DownloadViewSet(viewsets.ModelViewSet):
     def check_limits(self, request):
         """Check user's download limits and remaining quota."""
         try:
-            cache_key = f"download_limits_{request.user.id}"
-            cached_limits = cache.get(cache_key)
-
-            if cached_limits:
-                return Response(cached_limits)
-
-            today = timezone.now().date()
-            this_month = timezone.now().replace(day=1)
-
-            daily_downloads = self.get_queryset().filter(
-                downloaded_at__date=today
-            ).count()
-
-            monthly_downloads = self.get_queryset().filter(
-                downloaded_at__gte=this_month
-            ).count()
+            # Read straight from the quota counters; nothing to cache.
+            daily_downloads = DAILY_DOWNLOADS.usage(request.user.id)
+            monthly_downloads = MONTHLY_DOWNLOADS.usage(request.user.id)
 
             limits = {
                 "daily_limit": self.DAILY_DOWNLOAD_LIMIT,
@@ -247,7 +289,6 @@ class DownloadViewSet(viewsets.ModelViewSet):
                                monthly_downloads < self.MONTHLY_DOWNLOAD_LIMIT)
             }
 
-            cache.set(cache_key, limits, timeout=300)  # Cache for 5 minutes
             return Response(limits)
 
         except Exception as e:
@@ -272,17 +313,21 @@ class DownloadViewSet(viewsets.ModelViewSet):
                 user=request.user
             )
             
-            # Delete the download
-            download.delete()
+            # Delete the download, and keep buffered events from re-creating it
+            with transaction.atomic():
+                drop_buffered_downloads(request.user.id, download.photo_id)
+                download.delete()
+                Photo.objects.filter(id=photo_id).update(downloads_count=F('downloads_count') - 1)
+
+            DOWNLOADS_FILTER.record(
+                request.user.id, download.photo_id, False,
+                exact_key=f"download_status_{request.user.id}_{download.photo_id}"
+            )
             
             # Clear relevant caches
-            cache_keys = [
-                f"user_downloads_{request.user.id}",
-                f"download_stats_{request.user.id}",
-                f"photo_downloads_{photo_id}",
-                "most_downloaded_photos"
-            ]
-            cache.delete_many(cache_keys)
+            USER_DOWNLOADS.bump(request.user.id)
+            PHOTOS.bump(download.photo_id)
+            DOWNLOADS.bump()
             
             return Response(
                 {"message": "Download removed successfully"},
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Follower
+from .models import Follower, FollowSuggestion
 
 @admin.register(Follower)
 class FollowerAdmin(admin.ModelAdmin):
@@ -7,3 +7,10 @@ class FollowerAdmin(admin.ModelAdmin):
     list_filter = ("followed_at",)
     search_fields = ("follower__username", "following__username")
     ordering = ("-followed_at",)
+
+
+@admin.register(FollowSuggestion)
+class FollowSuggestionAdmin(admin.ModelAdmin):
+    list_display = ("user", "computed_at")
+    search_fields = ("user__username",)
+    ordering = ("-computed_at",)
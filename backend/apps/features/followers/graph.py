@@ -0,0 +1,170 @@
+"""
+Offline friend-of-friend suggestions.
+
+The follow graph is loaded once into a CSR adjacency matrix (plain NumPy
+arrays: ``indptr``/``indices``) and candidate scores are computed for blocks
+of users at a time: every 2-hop path u -> v -> w counts one mutual
+connection between u and w, and the mutual count is weighted by the
+candidate's popularity. The top-K candidates per user are persisted in
+FollowSuggestion so that suggest_users is a single keyed lookup.
+"""
+from django.db import connection, transaction
+from django.utils import timezone
+import logging
+import numpy as np
+
+from .models import Follower, FollowSuggestion
+from apps.core.users.models import User
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOP_K = 10
+DEFAULT_BLOCK_SIZE = 2048
+EDGE_CHUNK_SIZE = 50000
+
+
+def load_edges():
+    """
+    Return ``(user_ids, rows, cols)``: every user ID in sorted order and the
+    follow edges as int32 (follower, following) positions into that list.
+
+    Both queries read one REPEATABLE READ snapshot, so every edge's users
+    are in the list. Inside a caller's transaction that snapshot is not
+    available, and edges to users the first query missed are skipped.
+    """
+    outermost = not connection.in_atomic_block
+    with transaction.atomic():
+        if outermost:
+            with connection.cursor() as cursor:
+                cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+        user_ids = sorted(User.objects.values_list('id', flat=True))
+        position = {user_id: i for i, user_id in enumerate(user_ids)}
+
+        sources, targets = [], []
+        edges = Follower.objects.values_list('follower_id', 'following_id')
+        for follower_id, following_id in edges.iterator(chunk_size=EDGE_CHUNK_SIZE):
+            source, target = position.get(follower_id), position.get(following_id)
+            if source is None or target is None:
+                continue  # A user created after the user list was read.
+            sources.append(source)
+            targets.append(target)
+    return user_ids, np.asarray(sources, dtype=np.int32), np.asarray(targets, dtype=np.int32)
+
+
+def to_csr(rows, cols, size):
+    """Build ``(indptr, indices)`` with each row's neighbors sorted ascending."""
+    order = np.lexsort((cols, rows))
+    indptr = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=size), out=indptr[1:])
+    return indptr, cols[order]
+
+
+class FollowGraphMatrix:
+    """Follow edges as a CSR matrix over dense user indices."""
+
+    def __init__(self, user_ids, indptr, indices):
+        self.user_ids = user_ids
+        self.indptr = indptr
+        self.indices = indices
+
+    @property
+    def size(self):
+        return len(self.user_ids)
+
+    @property
+    def in_degree(self):
+        return np.bincount(self.indices, minlength=self.size)
+
+    @classmethod
+    def load(cls):
+        """Read the followers table into CSR form with one streaming query."""
+        user_ids, rows, cols = load_edges()
+        indptr, indices = to_csr(rows, cols, len(user_ids))
+        return cls(user_ids, indptr, indices)
+
+    def _expand(self, rows):
+        """Return (row, neighbor) pairs for every outgoing edge of ``rows``."""
+        starts, ends = self.indptr[rows], self.indptr[rows + 1]
+        lengths = ends - starts
+        owners = np.repeat(rows, lengths)
+        offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        return owners, self.indices[np.repeat(starts, lengths) + offsets]
+
+    def suggest_block(self, rows, weights, top_k):
+        """
+        Score 2-hop candidates for a block of users.
+        Returns (user, candidate, mutuals, score) arrays, top_k rows per user.
+        """
+        users, middles = self._expand(rows)
+        # Follow the second hop from each middle user, keeping the origin.
+        _, candidates = self._expand(middles)
+        origin = np.repeat(users, self.indptr[middles + 1] - self.indptr[middles])
+
+        n = np.int64(self.size)
+        keys = origin.astype(np.int64) * n + candidates
+        keys, mutuals = np.unique(keys, return_counts=True)
+
+        # Drop the users themselves and accounts they already follow.
+        followed = users.astype(np.int64) * n + middles
+        keep = ~np.isin(keys, followed, assume_unique=False)
+        keep &= (keys // n) != (keys % n)
+        keys, mutuals = keys[keep], mutuals[keep]
+
+        owners, candidates = keys // n, keys % n
+        scores = mutuals * weights[candidates]
+
+        order = np.lexsort((-scores, owners))
+        owners, candidates, mutuals, scores = owners[order], candidates[order], mutuals[order], scores[order]
+        group_start = np.searchsorted(owners, owners, side='left')
+        top = (np.arange(len(owners)) - group_start) < top_k
+        return owners[top], candidates[top], mutuals[top], scores[top]
+
+
+def compute_suggestions(top_k=DEFAULT_TOP_K, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    Recompute suggestions for every user who follows someone.
+    Returns the number of users whose suggestions were written.
+    """
+    graph = FollowGraphMatrix.load()
+    in_degree = graph.in_degree
+    # Popularity weight: a mutual connection to a popular account counts
+    # more, but logarithmically so that celebrities don't crowd out friends.
+    weights = 1.0 + np.log1p(in_degree)
+    usernames = dict(User.objects.values_list('id', 'username'))
+
+    active = np.flatnonzero(np.diff(graph.indptr)).astype(np.int32)
+    now = timezone.now()
+    written = 0
+
+    for start in range(0, len(active), block_size):
+        rows = active[start:start + block_size]
+        owners, candidates, mutuals, scores = graph.suggest_block(rows, weights, top_k)
+
+        by_user = {}
+        for owner, candidate, mutual, score in zip(owners.tolist(), candidates.tolist(), mutuals.tolist(), scores.tolist()):
+            candidate_id = graph.user_ids[candidate]
+            by_user.setdefault(owner, []).append({
+                'id': str(candidate_id),
+                'username': usernames.get(candidate_id),
+                'follower_count': int(in_degree[candidate]),
+                'mutuals': mutual,
+                'score': round(score, 4),
+            })
+
+        rows_to_write = [
+            FollowSuggestion(user_id=graph.user_ids[row], suggestions=by_user.get(row, []), computed_at=now)
+            for row in rows.tolist()
+        ]
+        with transaction.atomic():
+            FollowSuggestion.objects.bulk_create(
+                rows_to_write,
+                update_conflicts=True,
+                unique_fields=['user'],
+                update_fields=['suggestions', 'computed_at'],
+            )
+        written += len(rows_to_write)
+
+    # Users who stopped following everyone keep no stale suggestions.
+    FollowSuggestion.objects.filter(computed_at__lt=now).delete()
+    logger.info(f"Computed follow suggestions for {written} users")
+    return written
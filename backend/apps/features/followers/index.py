@@ -0,0 +1,283 @@
+"""
+Compact in-memory index of the follow graph.
+
+A snapshot stores the graph as NumPy arrays: the sorted 16-byte user IDs
+(a user's position in that array is its dense index) and two CSR adjacency
+structures, one for outgoing edges (following) and one for incoming edges
+(followers), each row a sorted int32 array. Snapshots are written by the
+snapshot_follow_graph command and memory-mapped by every process, so the
+arrays are shared through the page cache rather than copied.
+
+Follows and unfollows after the snapshot are appended to a delta log in the
+cache by toggle_follow and replayed into a small per-process overlay.
+"""
+from collections import defaultdict
+from django.conf import settings
+from django.core.cache import cache
+from pathlib import Path
+import json
+import logging
+import numpy as np
+import os
+import shutil
+import threading
+import time
+import uuid
+
+from .graph import load_edges, to_csr
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_DIR = Path(getattr(
+    settings, 'FOLLOW_GRAPH_SNAPSHOT_DIR', settings.BASE_DIR.parent / 'var' / 'follow_graph'
+))
+CURRENT_FILE = "CURRENT"
+ARRAYS = ("ids", "out_indptr", "out_indices", "in_indptr", "in_indices")
+
+DELTA_SEQ_KEY = "follow_graph_delta_seq"
+DELTA_KEY = "follow_graph_delta_{seq}"
+DELTA_TIMEOUT = 24 * 3600  # Snapshots must be rebuilt more often than this
+DELTA_BATCH_SIZE = 1000
+# A missing delta is normally a writer between incr() and set(); once it has
+# been missing this long it was evicted and is skipped.
+DELTA_STALL_TIMEOUT = 5
+RELOAD_CHECK_INTERVAL = 60
+
+
+def record_follow_delta(follower_id, following_id, present):
+    """Append a follow (``present=True``) or unfollow to the delta log."""
+    cache.add(DELTA_SEQ_KEY, 0, timeout=None)
+    try:
+        seq = cache.incr(DELTA_SEQ_KEY)
+    except ValueError:
+        # Evicted between add() and incr(); readers notice the reset.
+        cache.set(DELTA_SEQ_KEY, 1, timeout=None)
+        seq = 1
+    cache.set(
+        DELTA_KEY.format(seq=seq),
+        (str(follower_id), str(following_id), present),
+        timeout=DELTA_TIMEOUT
+    )
+
+
+def current_delta_seq():
+    return cache.get(DELTA_SEQ_KEY, 0)
+
+
+class FollowGraph:
+    """Read-only snapshot arrays plus the deltas applied since."""
+
+    def __init__(self, ids, out_indptr, out_indices, in_indptr, in_indices, seq=0, generation=None):
+        self.ids = ids
+        self.out_indptr = out_indptr
+        self.out_indices = out_indices
+        self.in_indptr = in_indptr
+        self.in_indices = in_indices
+        self.seq = seq
+        self.generation = generation
+
+        # (follower, following) -> present, for edges touched by deltas.
+        self.edges = {}
+        # Edges that exist now but not in the snapshot.
+        self.added_out = defaultdict(set)
+        self.added_in = defaultdict(set)
+        self._stalled = None
+
+    @classmethod
+    def build(cls):
+        """Build an index from the followers table."""
+        # Read the sequence first: deltas racing the load are replayed again,
+        # which is harmless because applying a delta is idempotent.
+        seq = current_delta_seq()
+        user_ids, rows, cols = load_edges()
+        ids = np.array([user_id.bytes for user_id in user_ids], dtype='S16')
+        out_indptr, out_indices = to_csr(rows, cols, len(user_ids))
+        in_indptr, in_indices = to_csr(cols, rows, len(user_ids))
+        return cls(ids, out_indptr, out_indices, in_indptr, in_indices, seq=seq)
+
+    def save(self, directory=SNAPSHOT_DIR, keep=2):
+        """Write a new snapshot generation and point CURRENT at it."""
+        directory = Path(directory)
+        generation = time.strftime("%Y%m%d%H%M%S") + f"-{os.getpid()}"
+        target = directory / generation
+        target.mkdir(parents=True)
+        for name in ARRAYS:
+            np.save(target / f"{name}.npy", getattr(self, name))
+
+        manifest = directory / f".{CURRENT_FILE}.tmp"
+        manifest.write_text(json.dumps({"generation": generation, "seq": self.seq}))
+        os.replace(manifest, directory / CURRENT_FILE)
+        self.generation = generation
+
+        # Processes still mapping the previous generation keep their files.
+        generations = sorted(p for p in directory.iterdir() if p.is_dir())
+        for old in generations[:-keep]:
+            shutil.rmtree(old, ignore_errors=True)
+        return generation
+
+    @classmethod
+    def open(cls, directory=SNAPSHOT_DIR):
+        """Memory-map the current snapshot, or return None if there is none."""
+        directory = Path(directory)
+        try:
+            manifest = json.loads((directory / CURRENT_FILE).read_text())
+        except FileNotFoundError:
+            return None
+        target = directory / manifest["generation"]
+        arrays = [np.load(target / f"{name}.npy", mmap_mode='r') for name in ARRAYS]
+        return cls(*arrays, seq=manifest["seq"], generation=manifest["generation"])
+
+    @property
+    def size(self):
+        return len(self.ids)
+
+    def _position(self, user_id):
+        key = uuid.UUID(str(user_id)).bytes
+        pos = int(np.searchsorted(self.ids, key))
+        # NumPy strips trailing NUL bytes from fixed-width bytes values.
+        if pos < self.size and self.ids[pos] == key.rstrip(b"\0"):
+            return pos
+        return None
+
+    def _user_id(self, pos):
+        return uuid.UUID(bytes=self.ids[pos].ljust(16, b"\0"))
+
+    def _row(self, indptr, indices, pos):
+        if pos is None:
+            return np.empty(0, dtype=np.int32)
+        return indices[indptr[pos]:indptr[pos + 1]]
+
+    def _snapshot_follows(self, follower_id, following_id):
+        row = self._row(self.out_indptr, self.out_indices, self._position(follower_id))
+        target = self._position(following_id)
+        if target is None:
+            return False
+        i = int(np.searchsorted(row, target))
+        return i < len(row) and row[i] == target
+
+    def follows(self, follower_id, following_id):
+        """True if ``follower_id`` follows ``following_id``."""
+        edge = (uuid.UUID(str(follower_id)), uuid.UUID(str(following_id)))
+        if edge in self.edges:
+            return self.edges[edge]
+        return self._snapshot_follows(*edge)
+
+    def apply(self, follower_id, following_id, present):
+        """Apply one follow/unfollow on top of the snapshot."""
+        follower_id, following_id = uuid.UUID(str(follower_id)), uuid.UUID(str(following_id))
+        self.edges[(follower_id, following_id)] = present
+        if present and not self._snapshot_follows(follower_id, following_id):
+            self.added_out[follower_id].add(following_id)
+            self.added_in[following_id].add(follower_id)
+        elif not present:
+            self.added_out[follower_id].discard(following_id)
+            self.added_in[following_id].discard(follower_id)
+
+    def refresh(self):
+        """
+        Replay deltas logged since the last refresh.
+        Returns False if the log was reset and the snapshot must be reopened.
+        """
+        latest = current_delta_seq()
+        if latest < self.seq:
+            return False
+
+        while self.seq < latest:
+            upper = min(latest, self.seq + DELTA_BATCH_SIZE)
+            keys = [DELTA_KEY.format(seq=seq) for seq in range(self.seq + 1, upper + 1)]
+            deltas = cache.get_many(keys)
+            for key in keys:
+                if key not in deltas and not self._skip_missing(key):
+                    return True
+                if key in deltas:
+                    self.apply(*deltas[key])
+                self.seq += 1
+        return True
+
+    def _skip_missing(self, key):
+        now = time.monotonic()
+        if self._stalled is None or self._stalled[0] != key:
+            self._stalled = (key, now)
+            return False
+        if now - self._stalled[1] < DELTA_STALL_TIMEOUT:
+            return False
+        logger.warning(f"Follow graph delta {key} is missing; skipping it")
+        self._stalled = None
+        return True
+
+    def mutual_followers(self, user_a, user_b):
+        """IDs of the users who follow both ``user_a`` and ``user_b``."""
+        user_a, user_b = uuid.UUID(str(user_a)), uuid.UUID(str(user_b))
+        common = np.intersect1d(
+            self._row(self.in_indptr, self.in_indices, self._position(user_a)),
+            self._row(self.in_indptr, self.in_indices, self._position(user_b)),
+            assume_unique=True
+        )
+        result = {
+            user_id for user_id in (self._user_id(pos) for pos in common.tolist())
+            if self.edges.get((user_id, user_a), True) and self.edges.get((user_id, user_b), True)
+        }
+        result.update(u for u in self.added_in.get(user_a, ()) if self.follows(u, user_b))
+        result.update(u for u in self.added_in.get(user_b, ()) if self.follows(u, user_a))
+        return result
+
+    def relationships(self, user_id, other_ids):
+        """Return ``{other_id: (following, followed_by)}`` from ``user_id``'s side."""
+        user_id = uuid.UUID(str(user_id))
+        pos = self._position(user_id)
+        out_row = self._row(self.out_indptr, self.out_indices, pos)
+        in_row = self._row(self.in_indptr, self.in_indices, pos)
+
+        others = [uuid.UUID(str(other_id)) for other_id in other_ids]
+        positions = np.array([
+            -1 if p is None else p for p in (self._position(other) for other in others)
+        ], dtype=np.int64)
+
+        def member(row):
+            if not len(row):
+                return np.zeros(len(positions), dtype=bool)
+            i = np.minimum(np.searchsorted(row, positions), len(row) - 1)
+            return (row[i] == positions) & (positions >= 0)
+
+        following, followed_by = member(out_row), member(in_row)
+        result = {}
+        for i, other in enumerate(others):
+            result[other] = (
+                self.edges.get((user_id, other), bool(following[i])),
+                self.edges.get((other, user_id), bool(followed_by[i])),
+            )
+        return result
+
+
+_graph = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def get_follow_graph():
+    """
+    Return this process's index with pending deltas applied, or None when no
+    snapshot has been built yet (callers then fall back to the database).
+    """
+    global _graph, _checked_at
+    with _lock:
+        now = time.monotonic()
+        if _graph is None or now - _checked_at > RELOAD_CHECK_INTERVAL:
+            _checked_at = now
+            try:
+                manifest = json.loads((SNAPSHOT_DIR / CURRENT_FILE).read_text())
+            except FileNotFoundError:
+                _graph = None
+                return None
+            if _graph is None or _graph.generation != manifest["generation"]:
+                _graph = FollowGraph.open(SNAPSHOT_DIR)
+
+        if not _graph.refresh():
+            # The cache was flushed: deltas since the snapshot are gone and
+            # the new log restarts from zero until the next snapshot.
+            logger.warning("Follow graph delta log was reset; reopening snapshot")
+            _graph = FollowGraph.open(SNAPSHOT_DIR)
+            if _graph is not None:
+                _graph.seq = 0
+                _graph.refresh()
+        return _graph
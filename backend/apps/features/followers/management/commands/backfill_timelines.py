@@ -0,0 +1,66 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.core.users.models import User
+from apps.features.followers.models import Follower
+from apps.features.followers.timeline import build_timeline, timeline_seq_key
+
+
+class Command(BaseCommand):
+    """Build home timelines ahead of time, e.g. after a deploy or cache flush."""
+    help = "Rebuild cached home timelines for users who follow someone."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--username",
+            action="append",
+            help="Only backfill this user (repeatable). Defaults to every follower.",
+        )
+        parser.add_argument(
+            "--only-missing",
+            action="store_true",
+            help="Skip users whose timeline is already cached.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Users checked per cache round trip with --only-missing.",
+        )
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive")
+
+        if options["username"]:
+            user_ids = User.objects.filter(
+                username__in=options["username"]
+            ).values_list("id", flat=True)
+        else:
+            user_ids = Follower.objects.values_list("follower_id", flat=True).distinct()
+
+        built = skipped = 0
+        batch = []
+        for user_id in user_ids.iterator(chunk_size=options["batch_size"]):
+            batch.append(user_id)
+            if len(batch) >= options["batch_size"]:
+                b, s = self._backfill(batch, options["only_missing"])
+                built, skipped, batch = built + b, skipped + s, []
+        if batch:
+            b, s = self._backfill(batch, options["only_missing"])
+            built, skipped = built + b, skipped + s
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Built {built} timelines ({skipped} already cached)"
+        ))
+
+    def _backfill(self, user_ids, only_missing):
+        cached = set()
+        if only_missing:
+            cached = set(cache.get_many([timeline_seq_key(user_id) for user_id in user_ids]))
+        built = 0
+        for user_id in user_ids:
+            if timeline_seq_key(user_id) not in cached:
+                build_timeline(user_id)
+                built += 1
+        return built, len(user_ids) - built
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.features.followers.graph import DEFAULT_BLOCK_SIZE, DEFAULT_TOP_K, compute_suggestions
+
+
+class Command(BaseCommand):
+    """Precompute friend-of-friend suggestions. Run nightly from cron."""
+    help = "Rank 2-hop follow candidates for every user and store the top K."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--top-k",
+            type=int,
+            default=DEFAULT_TOP_K,
+            help="Suggestions kept per user.",
+        )
+        parser.add_argument(
+            "--block-size",
+            type=int,
+            default=DEFAULT_BLOCK_SIZE,
+            help="Users scored per vectorized block (bounds peak memory).",
+        )
+
+    def handle(self, *args, **options):
+        if options["top_k"] < 1 or options["block_size"] < 1:
+            raise CommandError("--top-k and --block-size must be positive")
+
+        written = compute_suggestions(top_k=options["top_k"], block_size=options["block_size"])
+        self.stdout.write(self.style.SUCCESS(f"Stored suggestions for {written} users"))
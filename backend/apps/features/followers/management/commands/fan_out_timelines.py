@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from apps.features.followers.timeline import fan_out_pending
+
+
+class Command(BaseCommand):
+    """Push photos by larger accounts onto followers' timelines. Run every minute from cron."""
+    help = "Fan out recent photos by accounts too large to push when the upload commits."
+
+    def handle(self, *args, **options):
+        pushed = fan_out_pending()
+        self.stdout.write(self.style.SUCCESS(f"Fanned out {pushed} photos"))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from apps.features.followers.index import SNAPSHOT_DIR, FollowGraph
+
+
+class Command(BaseCommand):
+    """Write a follow graph snapshot for the in-memory index. Run hourly from cron."""
+    help = "Snapshot the followers table into memory-mappable adjacency arrays."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--directory",
+            default=str(SNAPSHOT_DIR),
+            help="Snapshot directory shared by the web processes.",
+        )
+
+    def handle(self, *args, **options):
+        graph = FollowGraph.build()
+        generation = graph.save(options["directory"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote follow graph {generation}: {graph.size} users, "
+            f"{len(graph.out_indices)} edges"
+        ))
@@ -13,3 +13,16 @@ class Follower(models.Model):
 
     def __str__(self):
         return f"{self.follower} follows {self.following}"
+
+
+class FollowSuggestion(models.Model):
+    """Precomputed "who to follow" list, written by compute_follow_suggestions."""
+    user = models.OneToOneField("users.User", on_delete=models.CASCADE, primary_key=True, related_name="follow_suggestions")
+    suggestions = models.JSONField(default=list, blank=True)
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        db_table = "follow_suggestions"
+
+    def __str__(self):
+        return f"Suggestions for {self.user}"
@@ -10,3 +10,22 @@ class FollowerSerializer(serializers.ModelSerializer):
         model = Follower
         fields = ["id", "follower", "following", "followed_at"]
         read_only_fields = ["id", "followed_at"]
+
+
+class FollowerCardSerializer(serializers.ModelSerializer):
+    """
+    List row for followers/following. Serializes ``.values()`` rows and takes
+    the user cards from ``context["cards"]`` instead of joining users.
+    """
+    follower = serializers.SerializerMethodField()
+    following = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Follower
+        fields = ["id", "follower", "following", "followed_at"]
+
+    def get_follower(self, obj):
+        return self.context["cards"].get(obj["follower_id"])
+
+    def get_following(self, obj):
+        return self.context["cards"].get(obj["following_id"])
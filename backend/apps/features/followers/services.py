@@ -0,0 +1,10 @@
+from apps.core.cache.bloom import UserBloomFilter
+from .models import Follower
+
+
+def _following_ids(user_id):
+    return Follower.objects.filter(follower_id=user_id).values_list("following_id", flat=True)
+
+
+# Answers "does this user follow X?" negatives without a query.
+FOLLOWING_FILTER = UserBloomFilter("following", _following_ids)
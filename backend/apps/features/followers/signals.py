@@ -0,0 +1,24 @@
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+import logging
+
+from .timeline import fan_out
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender="photos.Photo")
+def fan_out_photo_signal(sender, instance, created, **kwargs):
+    """Push new photos onto followers' timelines once the upload commits."""
+    if not created:
+        return
+
+    def push():
+        try:
+            fan_out(instance)
+        except Exception as e:
+            # Timelines are rebuilt on read, so a failed push only delays the photo.
+            logger.error(f"Timeline fan-out failed for photo {instance.id}: {str(e)}")
+
+    transaction.on_commit(push)
@@ -0,0 +1,247 @@
+"""
+Home timelines: photos from the people a user follows.
+
+Normal accounts fan out on write: a new photo is pushed onto the cached
+timeline of every follower whose timeline is warm. Small accounts (fewer
+than TIMELINE_SYNC_FANOUT_FOLLOWER_LIMIT followers) are pushed as soon as
+the upload commits; larger ones by fan_out_timelines, run every minute from
+cron, which picks up their photos from the photos table. Accounts with more
+than TIMELINE_FANOUT_FOLLOWER_LIMIT followers are never fanned out; their
+photos are pulled at read time and merged into the pushed entries.
+
+A cached timeline is a base snapshot, built with a single query, plus the
+entries pushed since. Pushes never rewrite the snapshot: each takes the
+next number from the user's sequence key with an atomic ``incr`` and writes
+its entry to a slot of its own, so concurrent pushes cannot overwrite one
+another. Reads merge the slots after the snapshot's sequence number and
+fold them into the snapshot once there are COMPACT_AFTER of them.
+
+Timeline entries are ``(timestamp, photo_id)`` pairs, newest first. Deleted
+photos are dropped when the page is hydrated, and cold timelines are rebuilt
+on first read (or ahead of time by backfill_timelines).
+"""
+from django.conf import settings
+from django.core.cache import cache
+from datetime import datetime, timezone
+import base64
+import heapq
+import time
+
+from .models import Follower
+from apps.features.photos.models import Photo
+from apps.core.users.models import User
+
+TIMELINE_CACHE_KEY = "timeline_{user_id}"
+TIMELINE_SEQ_KEY = "timeline_seq_{user_id}"
+TIMELINE_PUSH_KEY = "timeline_{user_id}_{seq}"
+TIMELINE_SIZE = getattr(settings, 'TIMELINE_SIZE', 500)
+TIMELINE_TIMEOUT = 7 * 24 * 3600  # 7 days
+FANOUT_FOLLOWER_LIMIT = getattr(settings, 'TIMELINE_FANOUT_FOLLOWER_LIMIT', 10000)
+SYNC_FANOUT_FOLLOWER_LIMIT = getattr(settings, 'TIMELINE_SYNC_FANOUT_FOLLOWER_LIMIT', 100)
+FANOUT_BATCH_SIZE = 500
+FANOUT_CURSOR_KEY = "timeline_fanout_cursor"
+# Photos uploaded this long before the last run are looked at again, in
+# case their upload committed after the run's query. The cursor remembers
+# which of them were pushed already.
+FANOUT_OVERLAP = 120  # seconds
+FANOUT_LOOKBACK = 3600  # seconds, when the cursor was evicted
+COMPACT_AFTER = 50
+
+
+def timeline_key(user_id):
+    return TIMELINE_CACHE_KEY.format(user_id=user_id)
+
+
+def timeline_seq_key(user_id):
+    return TIMELINE_SEQ_KEY.format(user_id=user_id)
+
+
+def _push_key(user_id, seq):
+    return TIMELINE_PUSH_KEY.format(user_id=user_id, seq=seq)
+
+
+def _entry(upload_date, photo_id):
+    return (upload_date.timestamp(), str(photo_id))
+
+
+def encode_cursor(entry):
+    return base64.urlsafe_b64encode(f"{entry[0]!r}|{entry[1]}".encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Return the ``(timestamp, photo_id)`` entry a cursor points at."""
+    try:
+        timestamp, photo_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        return float(timestamp), photo_id
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+
+def build_timeline(user_id):
+    """Rebuild a user's pushed timeline from the photos of followed normal accounts."""
+    # The sequence is read before the query, so every push numbered up to
+    # it is a photo the query sees. A new sequence starts at the current
+    # time, so it never reuses the slots of an expired one.
+    seq_key = timeline_seq_key(user_id)
+    fresh = time.time_ns() // 1000
+    seq = fresh if cache.add(seq_key, fresh, timeout=TIMELINE_TIMEOUT) else cache.get(seq_key, fresh)
+
+    push_sources = Follower.objects.filter(
+        follower_id=user_id,
+        following__followers_count__lt=FANOUT_FOLLOWER_LIMIT
+    ).values('following_id')
+    rows = Photo.objects.filter(
+        user_id__in=push_sources
+    ).order_by('-upload_date').values_list('upload_date', 'id')[:TIMELINE_SIZE]
+
+    entries = [_entry(upload_date, photo_id) for upload_date, photo_id in rows]
+    cache.set(timeline_key(user_id), {"seq": seq, "entries": entries}, timeout=TIMELINE_TIMEOUT)
+    return entries
+
+
+def load_timeline(user_id):
+    """The user's pushed entries, newest first: the snapshot merged with later pushes."""
+    base_key, seq_key = timeline_key(user_id), timeline_seq_key(user_id)
+    values = cache.get_many([base_key, seq_key])
+    base, head = values.get(base_key), values.get(seq_key)
+    if base is None or head is None or head < base["seq"] or head - base["seq"] > TIMELINE_SIZE:
+        return build_timeline(user_id)
+    if head == base["seq"]:
+        return base["entries"]
+
+    keys = [_push_key(user_id, seq) for seq in range(base["seq"] + 1, head + 1)]
+    pushed = cache.get_many(keys)
+    entries = sorted(set(base["entries"]).union(pushed.values()), reverse=True)[:TIMELINE_SIZE]
+
+    # Fold the pushes into the snapshot, up to the first slot not written
+    # yet (its push is still in flight) so that it is read next time.
+    settled = base["seq"]
+    for key in keys:
+        if key not in pushed:
+            break
+        settled += 1
+    if settled - base["seq"] >= COMPACT_AFTER:
+        cache.set(base_key, {"seq": settled, "entries": entries}, timeout=TIMELINE_TIMEOUT)
+    return entries
+
+
+def fan_out(photo):
+    """
+    Push a new photo onto the warm timelines of the author's followers, if
+    the author is small enough to do so inline; fan_out_pending does the rest.
+    """
+    if photo.user.followers_count >= SYNC_FANOUT_FOLLOWER_LIMIT:
+        return
+    _fan_out(photo.user_id, _entry(photo.upload_date, photo.id))
+
+
+def fan_out_pending():
+    """
+    Push recent photos by accounts too large to fan out inline. Safe to run
+    concurrently or twice: a pushed entry is merged into the timeline as a
+    set. Returns the number of photos pushed.
+    """
+    now = time.time()
+    cursor = cache.get(FANOUT_CURSOR_KEY) or {"at": now - FANOUT_LOOKBACK, "pushed": []}
+    since = datetime.fromtimestamp(cursor["at"] - FANOUT_OVERLAP, tz=timezone.utc)
+    already = set(cursor["pushed"])
+
+    authors = User.objects.filter(
+        followers_count__gte=SYNC_FANOUT_FOLLOWER_LIMIT,
+        followers_count__lt=FANOUT_FOLLOWER_LIMIT,
+    ).values('id')
+    rows = Photo.objects.filter(
+        user_id__in=authors, upload_date__gte=since
+    ).order_by('upload_date').values_list('id', 'user_id', 'upload_date')
+
+    pushed, recent = 0, []
+    overlap_start = datetime.fromtimestamp(now - FANOUT_OVERLAP, tz=timezone.utc)
+    for photo_id, user_id, upload_date in rows:
+        if str(photo_id) not in already:
+            _fan_out(user_id, _entry(upload_date, photo_id))
+            pushed += 1
+        if upload_date >= overlap_start:
+            recent.append(str(photo_id))
+    cache.set(FANOUT_CURSOR_KEY, {"at": now, "pushed": recent}, timeout=None)
+    return pushed
+
+
+def _fan_out(author_id, entry):
+    follower_ids = Follower.objects.filter(
+        following_id=author_id
+    ).values_list('follower_id', flat=True).iterator(chunk_size=FANOUT_BATCH_SIZE)
+
+    batch = []
+    for follower_id in follower_ids:
+        batch.append(follower_id)
+        if len(batch) >= FANOUT_BATCH_SIZE:
+            _push(batch, entry)
+            batch = []
+    if batch:
+        _push(batch, entry)
+
+
+def _push(user_ids, entry):
+    # Only warm timelines are updated; cold ones are rebuilt on read.
+    seq_keys = {timeline_seq_key(user_id): user_id for user_id in user_ids}
+    slots = {}
+    for seq_key in cache.get_many(list(seq_keys)):
+        try:
+            seq = cache.incr(seq_key)
+        except ValueError:
+            continue  # Expired since: rebuilt on read.
+        slots[_push_key(seq_keys[seq_key], seq)] = entry
+    if slots:
+        cache.set_many(slots, timeout=TIMELINE_TIMEOUT)
+
+
+def invalidate_timeline(user_id):
+    """Drop a timeline after the set of followed accounts changed."""
+    cache.delete_many([timeline_key(user_id), timeline_seq_key(user_id)])
+
+
+def read_timeline(user_id, cursor=None, limit=20):
+    """
+    Return ``(photos, next_cursor)`` for one page of the home feed.
+    ``cursor`` is the value returned with the previous page, if any.
+    """
+    before = decode_cursor(cursor) if cursor else None
+
+    pushed = load_timeline(user_id)
+    if before:
+        pushed = [entry for entry in pushed if entry < before]
+
+    pull_sources = Follower.objects.filter(
+        follower_id=user_id,
+        following__followers_count__gte=FANOUT_FOLLOWER_LIMIT
+    ).values('following_id')
+    pulled = Photo.objects.filter(user_id__in=pull_sources)
+    if before:
+        pulled = pulled.filter(upload_date__lte=datetime.fromtimestamp(before[0], tz=timezone.utc))
+    pulled = [
+        entry for entry in (
+            _entry(upload_date, photo_id) for upload_date, photo_id in
+            pulled.order_by('-upload_date').values_list('upload_date', 'id')[:limit + 1]
+        )
+        if not before or entry < before
+    ]
+
+    page, seen = [], set()
+    for entry in heapq.merge(pushed, pulled, reverse=True):
+        if entry[1] in seen:
+            continue
+        seen.add(entry[1])
+        page.append(entry)
+        if len(page) > limit:
+            break
+
+    has_more = len(page) > limit
+    page = page[:limit]
+    photos = {
+        str(photo_id): photo for photo_id, photo in
+        Photo.objects.select_related('user').in_bulk([photo_id for _, photo_id in page]).items()
+    }
+    results = [photos[photo_id] for _, photo_id in page if photo_id in photos]
+    next_cursor = encode_cursor(page[-1]) if has_more and page else None
+    return results, next_cursor
+
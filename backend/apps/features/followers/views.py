@@ -5,17 +5,28 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.exceptions import ValidationError, PermissionDenied
 from django.core.cache import cache
 from django.db import transaction
-from django.db.models import Count, Q
+from django.db.models import F, Q
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 import logging
-
-from .models import Follower
-from .serializers import FollowerSerializer
+import uuid
+
+from .models import Follower, FollowSuggestion
+from .serializers import FollowerCardSerializer, FollowerSerializer
+from .index import get_follow_graph, record_follow_delta
+from .services import FOLLOWING_FILTER
+from .timeline import invalidate_timeline, read_timeline
+from apps.core.cache.keys import FOLLOWER_STATS, FOLLOWS, SUGGESTED_USERS, USER_FOLLOWERS, USER_FOLLOWING
+from apps.core.users.cards import get_user_cards, invalidate_user_cards
 from apps.core.users.models import User
+from apps.features.photos.serializers import PhotoSerializer
 
 logger = logging.getLogger(__name__)
 
+MAX_MUTUALS_SHOWN = 20
+MAX_RELATIONSHIPS = 300
+FOLLOW_ROW_FIELDS = ('id', 'follower_id', 'following_id', 'followed_at')
+
 class FollowerViewSet(viewsets.ModelViewSet):
     """
     ViewSet for handling follower operations.
@@ -29,6 +40,7 @@ class FollowerViewSet(viewsets.ModelViewSet):
     """
     serializer_class = FollowerSerializer
     permission_classes = [IsAuthenticated]
+    throttle_scopes = {'toggle_follow': 'follows', 'relationships': 'bulk_checks'}
 
     def get_queryset(self):
         """Get followers queryset with optimized loading."""
@@ -61,19 +73,34 @@ class FollowerViewSet(viewsets.ModelViewSet):
                     # User already follows, so unfollow
                     follow_relation.delete()
                     action = "unfollowed"
+                    delta = -1
                 else:
                     action = "followed"
+                    delta = 1
+
+                # Keep the denormalized counters in the same transaction.
+                # Rows are updated in id order so that two users following
+                # each other at once cannot deadlock.
+                counter_updates = sorted([
+                    (request.user.id, 'following_count'),
+                    (user_to_follow.id, 'followers_count'),
+                ], key=lambda update: str(update[0]))
+                for user_id, field in counter_updates:
+                    User.objects.filter(id=user_id).update(**{field: F(field) + delta})
+
+            FOLLOWING_FILTER.record(
+                request.user.id, user_to_follow.id, created,
+                exact_key=f"follow_status_{request.user.id}_{user_to_follow.id}"
+            )
+            record_follow_delta(request.user.id, user_to_follow.id, created)
 
             # Clear relevant caches
-            cache_keys = [
-                f"user_followers_{user_to_follow.id}",
-                f"user_following_{request.user.id}",
-                f"follower_stats_{request.user.id}",
-                f"follower_stats_{user_to_follow.id}",
-                f"follow_status_{request.user.id}_{user_to_follow.id}",
-                "suggested_users"
-            ]
-            cache.delete_many(cache_keys)
+            FOLLOWS.bump(request.user.id)
+            FOLLOWS.bump(user_to_follow.id)
+            # Rebuilt on next read with the new set of followed accounts
+            invalidate_timeline(request.user.id)
+            # followers_count shown on the followed user's card changed
+            invalidate_user_cards(user_to_follow.id)
 
             return Response({
                 "message": f"Successfully {action} the user",
@@ -98,17 +125,17 @@ class FollowerViewSet(viewsets.ModelViewSet):
                 raise ValidationError("username query parameter is required")
 
             user = get_object_or_404(User, username=username)
-            cache_key = f"user_followers_{user.id}"
+            cache_key = USER_FOLLOWERS.key(user_id=user.id)
             cached_followers = cache.get(cache_key)
 
             if cached_followers:
                 return Response(cached_followers)
 
-            followers = Follower.objects.select_related('follower').filter(
+            followers = list(Follower.objects.filter(
                 following=user
-            ).order_by('-followed_at')
+            ).order_by('-followed_at').values(*FOLLOW_ROW_FIELDS))
 
-            serializer = self.get_serializer(followers, many=True)
+            serializer = self._card_rows(followers)
             cache.set(cache_key, serializer.data, timeout=300)  # Cache for 5 minutes
             
             return Response(serializer.data)
@@ -131,17 +158,17 @@ class FollowerViewSet(viewsets.ModelViewSet):
                 raise ValidationError("username query parameter is required")
 
             user = get_object_or_404(User, username=username)
-            cache_key = f"user_following_{user.id}"
+            cache_key = USER_FOLLOWING.key(user_id=user.id)
             cached_following = cache.get(cache_key)
 
             if cached_following:
                 return Response(cached_following)
 
-            following = Follower.objects.select_related('following').filter(
+            following = list(Follower.objects.filter(
                 follower=user
-            ).order_by('-followed_at')
+            ).order_by('-followed_at').values(*FOLLOW_ROW_FIELDS))
 
-            serializer = self.get_serializer(following, many=True)
+            serializer = self._card_rows(following)
             cache.set(cache_key, serializer.data, timeout=300)
             
             return Response(serializer.data)
@@ -155,6 +182,50 @@ class FollowerViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    def _card_rows(self, rows):
+        """Serialize follow rows with cached user cards instead of full profiles."""
+        cards = get_user_cards(
+            {row['follower_id'] for row in rows} | {row['following_id'] for row in rows}
+        )
+        return FollowerCardSerializer(rows, many=True, context={'cards': cards})
+
+    @action(detail=False, methods=['get'])
+    def feed(self, request):
+        """
+        Photos from the users the current user follows, newest first.
+        Paginate with the returned next_cursor.
+        """
+        try:
+            try:
+                limit = min(int(request.query_params.get('limit', 20)), 100)
+            except ValueError:
+                raise ValidationError("limit must be an integer")
+            if limit < 1:
+                raise ValidationError("limit must be positive")
+
+            try:
+                photos, next_cursor = read_timeline(
+                    request.user.id,
+                    cursor=request.query_params.get('cursor'),
+                    limit=limit
+                )
+            except ValueError as e:
+                raise ValidationError(str(e))
+
+            return Response({
+                "results": PhotoSerializer(photos, many=True).data,
+                "next_cursor": next_cursor
+            })
+
+        except ValidationError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            logger.error(f"Failed to fetch feed: {str(e)}")
+            return Response(
+                {"error": "Failed to fetch feed"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
     @action(detail=False, methods=['get'])
     def stats(self, request):
         """Get follower statistics for a user."""
@@ -164,15 +235,15 @@ class FollowerViewSet(viewsets.ModelViewSet):
                 raise ValidationError("username query parameter is required")
 
             user = get_object_or_404(User, username=username)
-            cache_key = f"follower_stats_{user.id}"
+            cache_key = FOLLOWER_STATS.key(user_id=user.id)
             cached_stats = cache.get(cache_key)
 
             if cached_stats:
                 return Response(cached_stats)
 
             stats = {
-                "followers_count": Follower.objects.filter(following=user).count(),
-                "following_count": Follower.objects.filter(follower=user).count(),
+                "followers_count": user.followers_count,
+                "following_count": user.following_count,
                 "recent_followers": Follower.objects.select_related('follower')
                     .filter(following=user)
                     .order_by('-followed_at')[:5]
@@ -200,18 +271,14 @@ class FollowerViewSet(viewsets.ModelViewSet):
                 raise ValidationError("username query parameter is required")
 
             user = get_object_or_404(User, username=username)
-            cache_key = f"follow_status_{request.user.id}_{user.id}"
-            cached_status = cache.get(cache_key)
-
-            if cached_status is not None:
-                return Response({"following": cached_status})
-
-            is_following = Follower.objects.filter(
-                follower=request.user,
-                following=user
-            ).exists()
 
-            cache.set(cache_key, is_following, timeout=3600)  # Cache for 1 hour
+            # Most users are not followed: the Bloom filter answers those
+            # without a query. Results are cached for 1 hour.
+            is_following = FOLLOWING_FILTER.check(
+                request.user.id, user.id,
+                exact_key=f"follow_status_{request.user.id}_{user.id}",
+                exists=lambda: Follower.objects.filter(follower=request.user, following=user).exists()
+            )
             return Response({"following": is_following})
 
         except ValidationError as e:
@@ -223,37 +290,154 @@ class FollowerViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @action(detail=False, methods=['get'])
+    def mutuals(self, request):
+        """Users who follow both the current user and the given user."""
+        try:
+            username = request.query_params.get('username')
+            if not username:
+                raise ValidationError("username query parameter is required")
+
+            user = get_object_or_404(User, username=username)
+            graph = get_follow_graph()
+            if graph is not None:
+                mutual_ids = graph.mutual_followers(request.user.id, user.id)
+            else:
+                mutual_ids = set(Follower.objects.filter(
+                    following=user,
+                    follower_id__in=Follower.objects.filter(
+                        following=request.user
+                    ).values('follower_id')
+                ).values_list('follower_id', flat=True))
+
+            users = User.objects.filter(
+                id__in=list(mutual_ids)[:MAX_MUTUALS_SHOWN]
+            ).order_by('-followers_count').values('id', 'username')
+            return Response({
+                "count": len(mutual_ids),
+                "users": list(users)
+            })
+
+        except ValidationError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            logger.error(f"Failed to get mutual followers: {str(e)}")
+            return Response(
+                {"error": "Failed to get mutual followers"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+    @action(detail=False, methods=['get', 'post'])
+    def relationships(self, request):
+        """
+        Follow status between the current user and a list of users.
+        GET takes ?usernames=alice,bob; POST takes {"usernames": [...]}
+        and/or {"ids": [...]}, up to MAX_RELATIONSHIPS users in total.
+        """
+        try:
+            if request.method == 'POST':
+                usernames = request.data.get('usernames') or []
+                ids = request.data.get('ids') or []
+                if not isinstance(usernames, list) or not isinstance(ids, list):
+                    raise ValidationError("usernames and ids must be lists")
+            else:
+                usernames = [
+                    name for name in request.query_params.get('usernames', '').split(',') if name
+                ]
+                ids = []
+            if not usernames and not ids:
+                raise ValidationError("usernames or ids are required")
+            if len(usernames) + len(ids) > MAX_RELATIONSHIPS:
+                raise ValidationError(f"At most {MAX_RELATIONSHIPS} users are allowed")
+
+            try:
+                ids = [uuid.UUID(str(user_id)) for user_id in ids]
+            except ValueError:
+                raise ValidationError("ids must be valid UUIDs")
+
+            users = dict(User.objects.filter(
+                Q(username__in=usernames) | Q(id__in=ids)
+            ).values_list('username', 'id'))
+            flags = self._relationship_flags(request.user.id, list(users.values()))
+
+            return Response({
+                username: {
+                    "id": user_id,
+                    "following": flags[user_id][0],
+                    "followed_by": flags[user_id][1],
+                    "mutual": all(flags[user_id])
+                }
+                for username, user_id in users.items()
+            })
+
+        except ValidationError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            logger.error(f"Failed to get relationships: {str(e)}")
+            return Response(
+                {"error": "Failed to get relationships"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+    def _relationship_flags(self, user_id, other_ids):
+        """
+        Return ``{other_id: (following, followed_by)}``. Served by the follow
+        graph index when loaded, otherwise by the follow_status_* keys shared
+        with check_follow, with every miss answered by one query.
+        """
+        graph = get_follow_graph()
+        if graph is not None:
+            return graph.relationships(user_id, other_ids)
+
+        keys = {}
+        for other_id in other_ids:
+            keys[f"follow_status_{user_id}_{other_id}"] = (user_id, other_id)
+            keys[f"follow_status_{other_id}_{user_id}"] = (other_id, user_id)
+        cached = cache.get_many(keys)
+        missing = [key for key in keys if key not in cached]
+
+        if missing:
+            missing_following = [keys[key][1] for key in missing if keys[key][0] == user_id]
+            missing_followers = [keys[key][0] for key in missing if keys[key][1] == user_id]
+            edges = set(Follower.objects.filter(
+                Q(follower_id=user_id, following_id__in=missing_following)
+                | Q(following_id=user_id, follower_id__in=missing_followers)
+            ).values_list('follower_id', 'following_id'))
+            found = {key: keys[key] in edges for key in missing}
+            cache.set_many(found, timeout=3600)
+            cached.update(found)
+
+        return {
+            other_id: (
+                cached[f"follow_status_{user_id}_{other_id}"],
+                cached[f"follow_status_{other_id}_{user_id}"],
+            )
+            for other_id in other_ids
+        }
+
     @action(detail=False, methods=['get'])
     def suggest_users(self, request):
         """Suggest users to follow based on various criteria."""
         try:
-            cache_key = f"suggested_users_{request.user.id}"
+            cache_key = SUGGESTED_USERS.key(user_id=request.user.id)
             cached_suggestions = cache.get(cache_key)
 
             if cached_suggestions:
                 return Response(cached_suggestions)
 
-            # Get users the current user is following
-            following_ids = Follower.objects.filter(
-                follower=request.user
-            ).values_list('following_id', flat=True)
-
-            # Find users that are followed by users the current user follows
-            suggested_users = User.objects.filter(
-                followers__follower_id__in=following_ids
-            ).exclude(
-                id__in=following_ids
-            ).exclude(
-                id=request.user.id
-            ).annotate(
-                follower_count=Count('followers')
-            ).order_by('-follower_count')[:10]
-
-            suggestions = [{
-                'id': user.id,
-                'username': user.username,
-                'follower_count': user.follower_count
-            } for user in suggested_users]
+            # Precomputed by compute_follow_suggestions; users the job
+            # has not seen yet fall back to a live friend-of-friend query.
+            stored = FollowSuggestion.objects.filter(user_id=request.user.id).first()
+            if stored is None:
+                suggestions = self._live_suggestions(request.user)
+            else:
+                # Hide accounts followed since the job ran.
+                followed_since = {
+                    str(user_id) for user_id in Follower.objects.filter(
+                        follower=request.user, followed_at__gte=stored.computed_at
+                    ).values_list('following_id', flat=True)
+                }
+                suggestions = [s for s in stored.suggestions if s['id'] not in followed_since]
 
             cache.set(cache_key, suggestions, timeout=3600)  # Cache for 1 hour
             return Response(suggestions)
@@ -265,6 +449,28 @@ class FollowerViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    def _live_suggestions(self, user):
+        """Users followed by the people ``user`` follows, most followed first."""
+        following_ids = Follower.objects.filter(
+            follower=user
+        ).values_list('following_id', flat=True)
+
+        suggested_users = User.objects.filter(
+            id__in=Follower.objects.filter(
+                follower_id__in=following_ids
+            ).values('following_id')
+        ).exclude(
+            id__in=following_ids
+        ).exclude(
+            id=user.id
+        ).order_by('-followers_count').values('id', 'username', 'followers_count')[:10]
+
+        return [{
+            'id': str(suggested['id']),
+            'username': suggested['username'],
+            'follower_count': suggested['followers_count']
+        } for suggested in suggested_users]
+
     def create(self, request, *args, **kwargs):
         """Disable direct POST method - use toggle_follow instead."""
         return Response(
@@ -0,0 +1,223 @@
+"""
+Like toggling shared by photos and collections, and per-user liked state.
+
+A toggle is a single PostgreSQL statement: the insert, the delete and the
+counter update run as data-modifying CTEs, so one round trip both flips the
+like and returns the new ``likes_count``.
+
+"Did I like these photos?" is answered from a cached per-user liked set, so
+feeds never probe the likes table per photo. The set is a packed snapshot
+plus the toggles made since, each written to a slot of its own under a
+number from the user's sequence key (an atomic ``incr``), so concurrent
+toggles never overwrite each other. Reads apply the toggles on top of the
+snapshot and fold them into it once there are LIKED_SET_COMPACT_AFTER.
+"""
+import bisect
+import time
+import uuid
+from collections import namedtuple
+from django.apps import apps
+from django.core.cache import cache
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from apps.core.cache.bloom import UserBloomFilter
+
+# edge: the like model, target_field: its FK to the liked object,
+# counter: the denormalized like counter on the liked object.
+LikeTarget = namedtuple("LikeTarget", ["edge", "target_field", "counter", "timestamp_field"])
+
+PHOTO_LIKES = LikeTarget("likes.Like", "photo", "likes_count", "liked_at")
+COLLECTION_LIKES = LikeTarget("collection.CollectionLike", "collection", "likes_count", "liked_at")
+
+TOGGLE_SQL = """
+WITH target AS (
+    SELECT {pk} FROM {target} WHERE {pk} = %(target_id)s
+), ins AS (
+    INSERT INTO {edge} ({user_col}, {fk_col}, {ts_col})
+    SELECT %(user_id)s, {pk}, %(now)s FROM target
+    ON CONFLICT ({user_col}, {fk_col}) DO NOTHING
+    RETURNING {ts_col}
+), del AS (
+    DELETE FROM {edge}
+    WHERE {user_col} = %(user_id)s AND {fk_col} = %(target_id)s
+      AND NOT EXISTS (SELECT 1 FROM ins)
+    RETURNING {ts_col}
+)
+UPDATE {target}
+SET {counter} = {counter} + (SELECT COUNT(*) FROM ins) - (SELECT COUNT(*) FROM del)
+WHERE {pk} = %(target_id)s
+RETURNING {counter}, EXISTS (SELECT 1 FROM ins), COALESCE((SELECT {ts_col} FROM ins), (SELECT {ts_col} FROM del))
+"""
+
+
+def _toggle_sql(spec):
+    """Render the toggle statement for a like target."""
+    qn = connection.ops.quote_name
+    edge = apps.get_model(spec.edge)
+    fk = edge._meta.get_field(spec.target_field)
+    target = fk.related_model
+    return TOGGLE_SQL.format(
+        target=qn(target._meta.db_table),
+        pk=qn(target._meta.pk.column),
+        counter=qn(target._meta.get_field(spec.counter).column),
+        edge=qn(edge._meta.db_table),
+        user_col=qn(edge._meta.get_field("user").column),
+        fk_col=qn(fk.column),
+        ts_col=qn(edge._meta.get_field(spec.timestamp_field).column),
+    ), target
+
+
+def toggle_like(spec, user_id, target_id):
+    """
+    Like the target if the user hasn't yet, otherwise remove the like.
+    Returns ``(liked, likes_count, liked_at)``, where ``liked_at`` is when the
+    like added or removed was made, or ``None`` if the target does not exist.
+    """
+    sql, target = _toggle_sql(spec)
+    pk = target._meta.pk
+    try:
+        target_id = pk.get_db_prep_value(pk.to_python(target_id), connection)
+    except DjangoValidationError:
+        return None
+
+    user_pk = apps.get_model("users.User")._meta.pk
+    params = {
+        "target_id": target_id,
+        "user_id": user_pk.get_db_prep_value(user_id, connection),
+        "now": timezone.now(),
+    }
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            row = cursor.fetchone()
+
+    if row is None:
+        return None
+    likes_count, liked, liked_at = row
+    return liked, likes_count, liked_at
+
+
+# Per-user liked set: the IDs of every photo a user liked, stored as sorted
+# 16-byte UUIDs concatenated into one bytes value and probed by bisection.
+LIKED_SET_CACHE_KEY = "user_liked_set_{user_id}"
+LIKED_SET_SEQ_KEY = "user_liked_set_seq_{user_id}"
+LIKED_SET_DELTA_KEY = "user_liked_set_{user_id}_{seq}"
+LIKED_SET_TIMEOUT = 3600  # 1 hour
+LIKED_SET_COMPACT_AFTER = 20
+LIKED_SET_MAX_DELTAS = 1000
+_UUID_SIZE = 16
+
+
+class _PackedIds:
+    """Read-only sequence view over packed UUID bytes, usable with bisect."""
+
+    def __init__(self, blob):
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.blob) // _UUID_SIZE
+
+    def __getitem__(self, index):
+        start = index * _UUID_SIZE
+        return self.blob[start:start + _UUID_SIZE]
+
+
+def _pack(photo_ids):
+    return b"".join(sorted({uuid.UUID(str(photo_id)).bytes for photo_id in photo_ids}))
+
+
+def _apply(blob, key, liked):
+    """``blob`` with ``key`` inserted (liked) or removed, keeping it sorted."""
+    ids = _PackedIds(blob)
+    index = bisect.bisect_left(ids, key)
+    present = index < len(ids) and ids[index] == key
+    offset = index * _UUID_SIZE
+    if liked and not present:
+        return blob[:offset] + key + blob[offset:]
+    if not liked and present:
+        return blob[:offset] + blob[offset + _UUID_SIZE:]
+    return blob
+
+
+def _build_liked_set(user_id):
+    # The sequence is read before the query, so every toggle numbered up to
+    # it is in the rows read. A new sequence starts at the current time, so
+    # it never reuses the slots of an expired one.
+    seq_key = LIKED_SET_SEQ_KEY.format(user_id=user_id)
+    fresh = time.time_ns() // 1000
+    seq = fresh if cache.add(seq_key, fresh, timeout=LIKED_SET_TIMEOUT) else cache.get(seq_key, fresh)
+    Like = apps.get_model(PHOTO_LIKES.edge)
+    blob = _pack(Like.objects.filter(user_id=user_id).values_list("photo_id", flat=True))
+    cache.set(LIKED_SET_CACHE_KEY.format(user_id=user_id), {"seq": seq, "ids": blob}, timeout=LIKED_SET_TIMEOUT)
+    return blob, {}
+
+
+def get_liked_set(user_id):
+    """
+    Return ``(blob, toggles)``: the user's packed liked set and the toggles
+    made since it was packed, as ``{photo_id_bytes: liked}``. Loads the set
+    with one query on a miss.
+    """
+    base_key, seq_key = LIKED_SET_CACHE_KEY.format(user_id=user_id), LIKED_SET_SEQ_KEY.format(user_id=user_id)
+    values = cache.get_many([base_key, seq_key])
+    base, head = values.get(base_key), values.get(seq_key)
+    if base is None or head is None or head < base["seq"] or head - base["seq"] > LIKED_SET_MAX_DELTAS:
+        return _build_liked_set(user_id)
+    if head == base["seq"]:
+        return base["ids"], {}
+
+    keys = [LIKED_SET_DELTA_KEY.format(user_id=user_id, seq=seq) for seq in range(base["seq"] + 1, head + 1)]
+    slots = cache.get_many(keys)
+    toggles = dict(slots[key] for key in keys if key in slots)
+
+    # Fold the toggles into the snapshot, up to the first slot not written
+    # yet (its toggle is still in flight) so that it is read next time.
+    settled, blob = base["seq"], base["ids"]
+    for key in keys:
+        if key not in slots:
+            break
+        blob = _apply(blob, *slots[key])
+        settled += 1
+    if settled - base["seq"] >= LIKED_SET_COMPACT_AFTER:
+        cache.set(base_key, {"seq": settled, "ids": blob}, timeout=LIKED_SET_TIMEOUT)
+    return base["ids"], toggles
+
+
+def _contains(ids, key):
+    index = bisect.bisect_left(ids, key)
+    return index < len(ids) and ids[index] == key
+
+
+def liked_photo_ids(user_id, photo_ids):
+    """Return the subset of ``photo_ids`` (UUIDs) the user has liked."""
+    blob, toggles = get_liked_set(user_id)
+    ids = _PackedIds(blob)
+    return {
+        photo_id for photo_id in photo_ids
+        if toggles.get(photo_id.bytes, _contains(ids, photo_id.bytes))
+    }
+
+
+def update_liked_set(user_id, photo_id, liked):
+    """Record a committed toggle in a cached liked set; cold sets are built on next read."""
+    try:
+        seq = cache.incr(LIKED_SET_SEQ_KEY.format(user_id=user_id))
+    except ValueError:
+        return  # Not cached: built on next read.
+    cache.set(
+        LIKED_SET_DELTA_KEY.format(user_id=user_id, seq=seq),
+        (uuid.UUID(str(photo_id)).bytes, liked),
+        timeout=LIKED_SET_TIMEOUT
+    )
+
+
+def _liked_photo_ids(user_id):
+    Like = apps.get_model(PHOTO_LIKES.edge)
+    return Like.objects.filter(user_id=user_id).values_list("photo_id", flat=True)
+
+
+# Answers "has this user liked photo X?" negatives without a query.
+LIKES_FILTER = UserBloomFilter("likes", _liked_photo_ids)
@@ -4,14 +4,13 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.exceptions import ValidationError
 from django.core.cache import cache
-from django.db import transaction
-from django.db.models import F
-from django.shortcuts import get_object_or_404
 import logging
-from django.utils import timezone
+import uuid
 
 from .models import Like
 from .serializers import LikeSerializer
+from .services import LIKES_FILTER, PHOTO_LIKES, liked_photo_ids, toggle_like, update_liked_set
+from apps.core.cache.keys import PHOTOS, USER_LIKE_LIST, USER_LIKE_STATS, USER_LIKES
 from apps.features.photos.models import Photo
 
 logger = logging.getLogger(__name__)
@@ -25,9 +24,13 @@ class LikeViewSet(viewsets.ModelViewSet):
     - Toggle like status
     - Get like statistics
     - Check if user liked a photo
+    - Check liked state for many photos at once
     """
     serializer_class = LikeSerializer
     permission_classes = [IsAuthenticated]
+    throttle_scopes = {'toggle': 'likes', 'check_likes': 'bulk_checks'}
+
+    MAX_BULK_CHECK = 200  # photo IDs per check_likes request
 
     def get_queryset(self):
         """Get likes queryset with optimized loading."""
@@ -35,7 +38,7 @@ class LikeViewSet(viewsets.ModelViewSet):
 
     def list(self, request):
         """List all likes for the current user with caching."""
-        cache_key = f"user_likes_{request.user.id}"
+        cache_key = USER_LIKE_LIST.key(user_id=request.user.id)
         cached_likes = cache.get(cache_key)
 
         if cached_likes:
@@ -58,37 +61,29 @@ class LikeViewSet(viewsets.ModelViewSet):
             if not photo_id:
                 raise ValidationError("photo_id is required")
 
-            photo = get_object_or_404(Photo, id=photo_id)
-            
-            with transaction.atomic():
-                like, created = Like.objects.get_or_create(
-                    user=request.user,
-                    photo=photo,
-                    defaults={'liked_at': timezone.now()}
-                )
-                
-                if not created:
-                    # User already liked the photo, so unlike it
-                    like.delete()
-                    Photo.objects.filter(id=photo.id).update(likes_count=F('likes_count') - 1)
-                    action = "unliked"
-                else:
-                    # New like
-                    Photo.objects.filter(id=photo.id).update(likes_count=F('likes_count') + 1)
-                    action = "liked"
+            result = toggle_like(PHOTO_LIKES, request.user.id, photo_id)
+            if result is None:
+                return Response({"error": "Photo not found"}, status=status.HTTP_404_NOT_FOUND)
+            liked, likes_count, _ = result
+            photo_id = uuid.UUID(str(photo_id))
+            update_liked_set(request.user.id, photo_id, liked)
+            LIKES_FILTER.record(
+                request.user.id, photo_id, liked,
+                exact_key=f"user_liked_photo_{request.user.id}_{photo_id}"
+            )
 
             # Clear relevant caches
-            cache.delete(f"user_likes_{request.user.id}")
-            cache.delete(f"photo_{photo.id}")
-            cache.delete("trending_photos")
-            cache.delete(f"user_liked_photo_{request.user.id}_{photo.id}")
+            USER_LIKES.bump(request.user.id)
+            PHOTOS.bump(photo_id)
 
             return Response({
-                "message": f"Successfully {action} the photo",
-                "liked": created,
-                "likes_count": Photo.objects.get(id=photo.id).likes_count
+                "message": f"Successfully {'liked' if liked else 'unliked'} the photo",
+                "liked": liked,
+                "likes_count": likes_count
             })
 
+        except ValidationError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             logger.error(f"Like toggle failed: {str(e)}")
             return Response(
@@ -107,18 +102,18 @@ class LikeViewSet(viewsets.ModelViewSet):
             if not photo_id:
                 raise ValidationError("photo_id query parameter is required")
 
-            cache_key = f"user_liked_photo_{request.user.id}_{photo_id}"
-            cached_result = cache.get(cache_key)
-
-            if cached_result is not None:
-                return Response({"liked": cached_result})
-
-            liked = Like.objects.filter(
-                user=request.user,
-                photo_id=photo_id
-            ).exists()
-
-            cache.set(cache_key, liked, timeout=3600)  # Cache for 1 hour
+            try:
+                photo_id = uuid.UUID(str(photo_id))
+            except ValueError:
+                raise ValidationError("photo_id must be a valid photo ID")
+
+            # Most photos are not liked: the Bloom filter answers those
+            # without a query. Results are cached for 1 hour.
+            liked = LIKES_FILTER.check(
+                request.user.id, photo_id,
+                exact_key=f"user_liked_photo_{request.user.id}_{photo_id}",
+                exists=lambda: Like.objects.filter(user=request.user, photo_id=photo_id).exists()
+            )
             return Response({"liked": liked})
 
         except ValidationError as e:
@@ -130,11 +125,43 @@ class LikeViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @action(detail=False, methods=['post'])
+    def check_likes(self, request):
+        """
+        Check which of several photos the user has liked.
+        Requires a photo_ids list in request data.
+        """
+        try:
+            photo_ids = request.data.get('photo_ids')
+            if not photo_ids or not isinstance(photo_ids, list):
+                raise ValidationError("photo_ids list is required")
+            if len(photo_ids) > self.MAX_BULK_CHECK:
+                raise ValidationError(f"Cannot check more than {self.MAX_BULK_CHECK} photos at once")
+
+            try:
+                ids = [uuid.UUID(str(photo_id)) for photo_id in photo_ids]
+            except ValueError:
+                raise ValidationError("photo_ids must be valid photo IDs")
+
+            liked = liked_photo_ids(request.user.id, ids)
+            return Response({
+                "liked": {str(photo_id): photo_id in liked for photo_id in ids}
+            })
+
+        except ValidationError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            logger.error(f"Bulk like check failed: {str(e)}")
+            return Response(
+                {"error": "Failed to check like status"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
     @action(detail=False, methods=['get'])
     def stats(self, request):
         """Get like statistics for the current user."""
         try:
-            cache_key = f"user_like_stats_{request.user.id}"
+            cache_key = USER_LIKE_STATS.key(user_id=request.user.id)
             cached_stats = cache.get(cache_key)
 
             if cached_stats:
@@ -0,0 +1,138 @@
+"""
+Adding and removing batches of photos in collections and categories.
+
+Each batch is a fixed number of queries whatever its size: one ``id__in``
+lookup validates the photos (and their owner, where that matters), one
+finds the photos already present, and a single ``bulk_create`` with
+``ignore_conflicts`` inserts the rest. Removal reads the matching photo IDs
+and deletes them in one statement.
+
+Where the parent keeps a denormalized photo counter or an order, it is
+locked for the batch (so the photos found present, the counter delta and
+the positions appended are exact) and updated in the same transaction.
+Parents with derived artifacts (collection covers) get their dirty mark
+set in that same UPDATE.
+"""
+from collections import namedtuple
+from django.apps import apps
+from django.db import transaction
+from django.db.models import F, Max
+from django.utils import timezone
+import uuid
+
+from .models import Photo
+
+# edge: the membership model, parent_field: its FK to the collection/category,
+# counter: the parent's denormalized photo count, if it keeps one,
+# position: the edge's sort key, if photos are kept in order,
+# dirty: the parent's timestamp marking artifacts built from its photos stale.
+PhotoSet = namedtuple("PhotoSet", ["edge", "parent_field", "counter", "position", "dirty"])
+
+COLLECTION_PHOTOS = PhotoSet(
+    "collection.PhotoCollection", "collection", "photos_count", "position", "cover_dirty_at"
+)
+CATEGORY_PHOTOS = PhotoSet("categories.photo_category", "category", None, None, None)
+PHOTO_SETS = [COLLECTION_PHOTOS, CATEGORY_PHOTOS]
+
+
+def _parent_model(spec):
+    return apps.get_model(spec.edge)._meta.get_field(spec.parent_field).related_model
+
+
+def _lock_parent(spec, parent):
+    if spec.counter or spec.position:
+        list(_parent_model(spec).objects.select_for_update().filter(pk=parent.pk).values_list('pk'))
+
+
+def _parent_changes(spec, delta):
+    changes = {}
+    if spec.counter:
+        changes[spec.counter] = F(spec.counter) + delta
+    if spec.dirty:
+        changes[spec.dirty] = timezone.now()
+    return changes
+
+
+def _touch_parent(spec, parent, delta):
+    changes = _parent_changes(spec, delta)
+    if changes and delta:
+        _parent_model(spec).objects.filter(pk=parent.pk).update(**changes)
+
+
+def add_photos(spec, parent, photo_ids, owner_id=None):
+    """
+    Add photos to ``parent``, keeping the request order. With ``owner_id``
+    only that user's photos are added; others are skipped.
+    Returns ``(added_ids, missing_ids)``; if any ID is not a photo, nothing
+    is added and those IDs are returned as missing.
+    """
+    edge = apps.get_model(spec.edge)
+    photos = dict(Photo.objects.filter(id__in=photo_ids).values_list('id', 'user_id'))
+    missing = [photo_id for photo_id in photo_ids if photo_id not in photos]
+    if missing:
+        return [], missing
+    candidates = [
+        photo_id for photo_id in photo_ids
+        if owner_id is None or photos[photo_id] == owner_id
+    ]
+    if not candidates:
+        return [], []
+
+    with transaction.atomic():
+        _lock_parent(spec, parent)
+        present = set(
+            edge.objects.filter(**{spec.parent_field: parent}, photo_id__in=candidates)
+            .values_list('photo_id', flat=True)
+        )
+        added = [photo_id for photo_id in candidates if photo_id not in present]
+        rows = [edge(**{spec.parent_field: parent}, photo_id=photo_id) for photo_id in added]
+        if spec.position:
+            # New photos go to the end, POSITION_GAP apart.
+            last = edge.objects.filter(**{spec.parent_field: parent}).aggregate(last=Max(spec.position))['last']
+            for index, row in enumerate(rows, start=1):
+                setattr(row, spec.position, (last or 0) + index * edge.POSITION_GAP)
+        # Without a locked parent, a concurrent request adding the same
+        # photo makes the insert a no-op and both report it as added.
+        edge.objects.bulk_create(rows, ignore_conflicts=True)
+        _touch_parent(spec, parent, len(added))
+    return added, []
+
+
+def remove_photos(spec, parent, photo_ids, owner_id=None):
+    """Remove photos from ``parent`` (only ``owner_id``'s, if given). Returns the removed IDs."""
+    edge = apps.get_model(spec.edge)
+    memberships = edge.objects.filter(**{spec.parent_field: parent}, photo_id__in=photo_ids)
+    if owner_id is not None:
+        memberships = memberships.filter(photo__user_id=owner_id)
+
+    with transaction.atomic():
+        _lock_parent(spec, parent)
+        removed = list(memberships.values_list('photo_id', flat=True))
+        if removed:
+            edge.objects.filter(**{spec.parent_field: parent}, photo_id__in=removed).delete()
+            _touch_parent(spec, parent, -len(removed))
+    return removed
+
+
+def detach_photo(photo_id):
+    """
+    Decrement the counters of every collection holding the photo and mark
+    them dirty. Call in the transaction that deletes it, before the delete
+    cascades to the memberships. Returns the IDs of the parents touched, by spec.
+    """
+    touched = {}
+    for spec in PHOTO_SETS:
+        changes = _parent_changes(spec, -1)
+        if changes:
+            edge = apps.get_model(spec.edge)
+            holders = list(edge.objects.filter(photo_id=photo_id).values_list(spec.parent_field, flat=True))
+            _parent_model(spec).objects.filter(pk__in=holders).update(**changes)
+            touched[spec] = holders
+    return touched
+
+
+def parse_photo_ids(values):
+    """Validate a list of photo IDs, dropping duplicates. Raises ValueError."""
+    if not isinstance(values, list):
+        raise ValueError("photo_ids must be a list")
+    return list(dict.fromkeys(uuid.UUID(str(value)) for value in values))
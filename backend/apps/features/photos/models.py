@@ -5,7 +5,7 @@ from PIL import Image as PILImage
 from django.db import models
 from cloudinary.models import CloudinaryField
 from . import signals
-from django.core.cache import cache
+from apps.core.cache.keys import PHOTO_LISTINGS, PHOTOS
 
 class Photo(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -21,6 +21,7 @@ class Photo(models.Model):
     likes_count = models.IntegerField(default=0)
     comments_count = models.IntegerField(default=0)
     downloads_count = models.IntegerField(default=0)
+    is_downloadable = models.BooleanField(default=True)
 
 
     class Meta:
@@ -39,9 +40,11 @@ class Photo(models.Model):
                 print(f"Failed to extract image metadata: {e}")
                 self.width, self.height, self.format = None, None, None
 
-        cache.delete(f"photo:{self.id}")
-        cache.delete("trending_photos")
+        created = self._state.adding
         super().save(*args, **kwargs)
+        PHOTOS.bump(self.id)
+        if created:
+            PHOTO_LISTINGS.bump()
         
     def generate_ai_tags(self):
         return signals.generate_ai_tags(self)
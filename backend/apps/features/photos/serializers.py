@@ -10,3 +10,10 @@ class PhotoSerializer(serializers.ModelSerializer):
     class Meta:
         model = Photo
         fields = ["id", "username", "image", "title", "description", "width", "height", "upload_date", "likes_count", "comments_count", "downloads_count", "ai_tags"]
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # Present only when the queryset was annotated for the requesting user.
+        if hasattr(instance, "is_liked"):
+            data["is_liked"] = instance.is_liked
+        return data
@@ -4,23 +4,35 @@ from rest_framework.response import Response
 from rest_framework.decorators import action
 from rest_framework.exceptions import PermissionDenied, ValidationError
 from rest_framework.filters import SearchFilter, OrderingFilter
+from django.conf import settings
 from django.core.cache import cache
+from django.db import transaction
 from django.shortcuts import get_object_or_404
-from django.db.models import F, Q
+from django.db.models import Exists, F, OuterRef, Q
 from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
 from cloudinary.uploader import upload, destroy
 from datetime import datetime, timedelta
+import copy
 import logging
 import re
+import uuid
 from urllib.parse import urlparse
 
+from .memberships import COLLECTION_PHOTOS, detach_photo
 from .models import Photo
 from .serializers import PhotoSerializer
+from apps.core.cache.keys import COLLECTIONS, PHOTO_DETAIL, PHOTO_LISTINGS, PHOTOS, PHOTOS_LIST, TRENDING_PHOTOS
+from apps.core.cache.ratelimit import RateLimit
 from apps.core.users.security import validate_image
+from apps.features.likes.models import Like
+from apps.features.likes.services import liked_photo_ids
 
 logger = logging.getLogger(__name__)
 
+UPLOAD_RATE_LIMIT = getattr(settings, 'UPLOAD_RATE_LIMIT', 50)  # images per hour
+UPLOAD_LIMIT = RateLimit("uploads", UPLOAD_RATE_LIMIT, 3600, sliding=True)
+
 class IsOwnerOrAdminOrReadOnly(BasePermission):
     """
     Custom permission to only allow owners or admins to edit/delete photos.
@@ -50,6 +62,10 @@ def get_cloudinary_public_id(cloudinary_url):
     match = re.search(r"/upload/(?:v\d+/)?(.+)", parsed_url)
     return match.group(1) if match else None
 
+def list_rows(data):
+    """Return the photo rows of a (possibly paginated) list response."""
+    return data.get('results', []) if isinstance(data, dict) else data
+
 def validate_and_upload_image(image_file, username):
     """
     Validate image type and upload to Cloudinary.
@@ -121,25 +137,54 @@ class PhotoViewSet(viewsets.ModelViewSet):
                 queryset = queryset.filter(upload_date__gte=now - timedelta(days=7))
             elif time_period == 'month':
                 queryset = queryset.filter(upload_date__gte=now - timedelta(days=30))
+
+        if self.action == 'list' and self._include_liked():
+            queryset = queryset.annotate(is_liked=Exists(
+                Like.objects.filter(user=self.request.user, photo=OuterRef('pk'))
+            ))
         
         return queryset
 
+    def _include_liked(self):
+        """Whether the caller asked for per-user is_liked flags."""
+        return (
+            self.request.user.is_authenticated
+            and self.request.query_params.get('include_liked') in ('1', 'true')
+        )
+
     def list(self, request, *args, **kwargs):
-        """List photos with caching for better performance."""
-        cache_key = f"photos_list_{request.query_params}"
+        """
+        List photos with caching for better performance.
+        With include_liked=true each photo also carries is_liked for the caller.
+        """
+        params = request.query_params.copy()
+        params.pop('include_liked', None)
+        cache_key = PHOTOS_LIST.key(params=params.urlencode())
         cached_response = cache.get(cache_key)
         
         if cached_response:
+            if self._include_liked():
+                rows = list_rows(cached_response)
+                liked = liked_photo_ids(request.user.id, [uuid.UUID(row['id']) for row in rows])
+                for row in rows:
+                    row['is_liked'] = uuid.UUID(row['id']) in liked
             return Response(cached_response)
             
         response = super().list(request, *args, **kwargs)
-        cache.set(cache_key, response.data, timeout=300)  # Cache for 5 minutes
+
+        # The shared cache entry must not carry one user's is_liked flags.
+        data = response.data
+        if self._include_liked():
+            data = copy.deepcopy(data)
+            for row in list_rows(data):
+                row.pop('is_liked', None)
+        cache.set(cache_key, data, timeout=300)  # Cache for 5 minutes
         return response
 
     def retrieve(self, request, *args, **kwargs):
         """Retrieve a photo with caching and view count increment."""
         photo_id = kwargs.get("pk")
-        cache_key = f"photo_{photo_id}"
+        cache_key = PHOTO_DETAIL.key(photo_id=photo_id)
         cached_photo = cache.get(cache_key)
 
         if cached_photo:
@@ -167,9 +212,8 @@ class PhotoViewSet(viewsets.ModelViewSet):
         if photo.user != request.user and not request.user.is_staff:
             raise PermissionDenied("You can only update your own photos.")
         
-        response = super().update(request, *args, **kwargs)
-        cache.delete(f"photo_{photo.id}")
-        return response
+        # Photo.save retires the cached photo and listings.
+        return super().update(request, *args, **kwargs)
 
     def destroy(self, request, *args, **kwargs):
         """Delete photo with Cloudinary cleanup."""
@@ -188,12 +232,15 @@ class PhotoViewSet(viewsets.ModelViewSet):
                 if public_id:
                     destroy(public_id, invalidate=True)
             
+            photo_id = photo.id
+            with transaction.atomic():
+                touched = detach_photo(photo_id)
+                photo.delete()
+
             # Clear caches
-            cache.delete(f"photo_{photo.id}")
-            cache.delete("trending_photos")
-            cache.delete(f"user_photos_{photo.user.id}")
-            
-            photo.delete()
+            PHOTOS.bump(photo_id)
+            PHOTO_LISTINGS.bump()
+            COLLECTIONS.bump_each(touched.get(COLLECTION_PHOTOS, []))
             return Response(
                 {"message": "Photo deleted successfully"},
                 status=status.HTTP_204_NO_CONTENT
@@ -222,6 +269,12 @@ class PhotoViewSet(viewsets.ModelViewSet):
                     {"error": "Maximum 10 images allowed per upload."},
                     status=status.HTTP_400_BAD_REQUEST
                 )
+
+            if not UPLOAD_LIMIT.hit(user.id, len(image_files)):
+                return Response(
+                    {"error": f"Maximum {UPLOAD_RATE_LIMIT} images per hour allowed."},
+                    status=status.HTTP_429_TOO_MANY_REQUESTS
+                )
             
             uploaded_photos = []
             errors = []
@@ -242,6 +295,10 @@ class PhotoViewSet(viewsets.ModelViewSet):
                 else:
                     errors.append(result)
             
+            if errors:
+                # Failed images don't count against the upload limit
+                UPLOAD_LIMIT.undo(user.id, len(errors))
+
             response_data = {
                 "message": "Upload completed",
                 "uploaded": uploaded_photos,
@@ -266,7 +323,7 @@ class PhotoViewSet(viewsets.ModelViewSet):
         Supports different trending algorithms based on likes, comments, and views.
         """
         try:
-            cache_key = f"trending_photos_{request.query_params}"
+            cache_key = TRENDING_PHOTOS.key(params=request.query_params.urlencode())
             trending_photos = cache.get(cache_key)
 
             if not trending_photos:
@@ -374,19 +431,34 @@ class PhotoViewSet(viewsets.ModelViewSet):
         photo.likes_count = F('likes_count') + 1
         photo.save()
         
-        cache.delete(f"photo_{photo.id}")
-        cache.delete("trending_photos")
-        
         return Response({"message": "Photo liked successfully"})
 
     @action(detail=True, methods=['post'])
     def download(self, request, pk=None):
         """Track photo download."""
+        from apps.features.downloads.events import record_download_event
+        from apps.features.downloads.services import DOWNLOADS_FILTER, consume_download_quota
+        from apps.features.downloads.tokens import DOWNLOAD_URL_MAX_AGE, signed_download_url
+
         photo = self.get_object()
-        photo.downloads_count = F('downloads_count') + 1
-        photo.save()
+        if not photo.is_downloadable:
+            raise PermissionDenied("This photo is not available for download")
+
+        quota_error = consume_download_quota(request.user.id)
+        if quota_error:
+            raise PermissionDenied(quota_error)
+
+        # The flush updates the downloads table and downloads_count together,
+        # so the reconcile_counters job still agrees with it.
+        record_download_event(request.user.id, photo.id)
+
+        DOWNLOADS_FILTER.record(
+            request.user.id, photo.id, True,
+            exact_key=f"download_status_{request.user.id}_{photo.id}"
+        )
         
         return Response({
             "message": "Download tracked successfully",
-            "download_url": photo.image.url
+            "download_url": signed_download_url(request, photo, request.user.id),
+            "expires_in": DOWNLOAD_URL_MAX_AGE
         })
\ No newline at end of file
@@ -47,6 +47,8 @@ INSTALLED_APPS = [
     
     # Custom apps
     'apps.core.authentication',
+    'apps.core.cache',
+    'apps.core.counters',
     'apps.features.photos',
     'apps.features.likes',
     'apps.features.followers',
@@ -105,6 +107,40 @@ DATABASES = {
     }
 }
 
+# Cache
+# "shared" is Redis when REDIS_URL is set (any server speaking the Redis
+# protocol will do, e.g. a local redis-server in development), otherwise a
+# per-process LocMemCache. "default" serves hot, versioned keys from a small
+# in-process LRU in front of it; see apps.core.cache.tiered. Only keys
+# declared in apps.core.cache.keys belong in LOCAL_KEYS.
+REDIS_URL = config('REDIS_URL', default='')
+
+CACHES = {
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+        'KEY_PREFIX': 'photos',
+    } if REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'shared',
+    },
+    'default': {
+        'BACKEND': 'apps.core.cache.tiered.TieredCache',
+        'OPTIONS': {
+            'SHARED': 'shared',
+            'LOCAL_KEYS': [
+                'all_categories',
+                'popular_categories',
+                'trending_collections',
+                'featured_collections',
+                'trending_photos',
+            ],
+            'LOCAL_MAX_ENTRIES': 1024,
+            'LOCAL_TIMEOUT': 30,  # seconds
+        },
+    },
+}
+
 # Password Validation
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
@@ -133,16 +169,28 @@ REST_FRAMEWORK = {
         "rest_framework_simplejwt.authentication.JWTAuthentication",
     ),
     "DEFAULT_THROTTLE_CLASSES": (
-        "rest_framework.throttling.UserRateThrottle",
-        "rest_framework.throttling.AnonRateThrottle",
+        "apps.core.cache.throttling.UserGCRAThrottle",
+        "apps.core.cache.throttling.AnonGCRAThrottle",
+        "apps.core.cache.throttling.ScopedGCRAThrottle",
     ),
     "DEFAULT_THROTTLE_RATES": {
         "user": "1000/minute",
         "anon": "100/minute",
+        # Per-action scopes, see throttle_scopes on the viewsets
+        "likes": "120/minute",
+        "follows": "60/minute",
+        "bulk_checks": "300/minute",
+        "reports": "30/minute",
     },
     "EXCEPTION_HANDLER": "config.error_handlers.custom_exception_handler",
 }
 
+# Largest burst per throttle scope; defaults to the scope's full rate
+THROTTLE_BURSTS = {
+    "likes": 20,
+    "follows": 10,
+}
+
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=30),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=7),